@@ -0,0 +1,307 @@
+"""
+async_toronto_api.py
+
+Asyncio client for Toronto's Open Data CKAN API.
+
+AsyncTorontoOpenDataAPI mirrors get_package and get_resource_data of
+TorontoOpenDataAPI, but all requests share one aiohttp session whose
+connection pool is capped, and downloaded files are parsed on an executor
+so parsing one resource overlaps with downloading the others. Fetching
+several datasets with gather_packages/gather_resources then takes about as
+long as the slowest download rather than the sum of all of them.
+
+Requires aiohttp.
+
+Example:
+    async with AsyncTorontoOpenDataAPI(max_connections=8) as client:
+        frames = await client.gather_resources([
+            ('neighbourhood-profiles', 0),
+            ('wellbeing-youth-mental-health', 0)
+        ])
+"""
+
+import asyncio
+import io
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+from common.profiling import profile_block, record_bytes
+from common.snapshot_store import SnapshotStore
+from common.toronto_api import TorontoOpenDataAPI, read_resource
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+
+def _parse(name: str, content: bytes, resource: Dict, **kwargs) -> pd.DataFrame:
+    """Parse downloaded bytes on an executor thread, under its own profile record."""
+    with profile_block(name):
+        record_bytes(len(content))
+        return read_resource(io.BytesIO(content), resource, **kwargs)
+
+
+class AsyncTorontoOpenDataAPI:
+    """
+    Asyncio client for Toronto's Open Data CKAN API.
+
+    Unlike TorontoOpenDataAPI it is not bound to one package: one client
+    serves any number of packages over a shared connection pool. Use it as
+    an async context manager, or call close() when done.
+
+    Args:
+        max_connections: Maximum concurrent connections to the portal
+        snapshot_store: optional SnapshotStore where every raw resource
+            download is saved, as in TorontoOpenDataAPI
+        executor: Executor to parse downloads on; defaults to a thread pool
+        timeout: Total timeout of each request in seconds
+        base_url: Root URL of the CKAN portal
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 8,
+        snapshot_store: Optional[SnapshotStore] = None,
+        executor: Optional[Executor] = None,
+        timeout: float = 300,
+        base_url: str = 'https://ckan0.cf.opendata.inter.prod-toronto.ca'
+    ):
+        if aiohttp is None:
+            raise ImportError('AsyncTorontoOpenDataAPI requires aiohttp')
+        self.base_url = base_url
+        self.api_version = '3'
+        self.max_connections = max_connections
+        self.snapshot_store = snapshot_store
+        self.timeout = timeout
+        self._executor = executor
+        self._own_executor = executor is None
+        self._session = None
+        # Package metadata requests, so each package is fetched once
+        self._packages: Dict[str, asyncio.Future] = {}
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_connections)
+        return self._session
+
+    async def close(self):
+        """Close the connection pool (and the executor if it was created here)."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking function on the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: func(*args, **kwargs)
+        )
+
+    async def _make_request(
+        self,
+        endpoint: str,
+        params: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Make a request to the CKAN API.
+
+        Args:
+            endpoint: API endpoint (i.e., action to take; e.g., 'package_show')
+            params: Dictionary of query parameters
+
+        Returns:
+            JSON response from the API
+        """
+        url = f"{self.base_url}/api/{self.api_version}/action/{endpoint}"
+        async with self._get_session().get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _download(self, url: str) -> bytes:
+        async with self._get_session().get(url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def _fetch_package(self, package_name: str) -> Dict:
+        package = await self._make_request("package_show", params={"id": package_name})
+        if package.get('success'):
+            return package.get('result')
+        error = package.get('error')
+        raise Exception(
+            f"{error.get('__type')} Error: {error.get('message')}"
+        )
+
+    async def get_package(self, package_name: str, show_info: bool = False) -> Dict:
+        """
+        Get metadata for a specific package.
+
+        Metadata is fetched once per client; concurrent calls for the same
+        package share one request.
+
+        Args:
+            package_name: Name of the package (dataset)
+            show_info: Print the resources of the package
+
+        Returns:
+            Package metadata result
+        """
+        if package_name not in self._packages:
+            self._packages[package_name] = asyncio.ensure_future(
+                self._fetch_package(package_name)
+            )
+        try:
+            result = await asyncio.shield(self._packages[package_name])
+        except Exception:
+            # Do not cache failures, a later call may succeed
+            self._packages.pop(package_name, None)
+            raise
+        if show_info:
+            TorontoOpenDataAPI.show_resources_info(result)
+        return result
+
+    async def get_resource_data(
+        self,
+        package_name: str,
+        resource_idx: int = 0,
+        as_of: Optional[Union[str, datetime]] = None,
+        **kwargs
+    ) -> pd.DataFrame:
+        """
+        Get data from a resource, handling different file formats.
+
+        Args:
+            package_name: Name of the package (dataset)
+            resource_idx: idx of desired resource within the package metadata, defaults to first position (0)
+            as_of: load the version of the resource stored in the snapshot store on or before this date instead of downloading it; the resource is looked up by its position at the time it was stored, without asking the portal
+            **kwargs: Additional arguments for read functions
+
+        Returns:
+            Processed DataFrame
+        """
+        name = f"{type(self).__name__}.get_resource_data"
+        if as_of is not None:
+            if self.snapshot_store is None:
+                raise ValueError('as_of requires a snapshot_store')
+            # Resolved and parsed from the stored manifest only, as in
+            # TorontoOpenDataAPI.get_resource_data
+            stored = await self._run(
+                self.snapshot_store.find, package_name,
+                position=resource_idx, as_of=as_of
+            )
+            data, stored = await self._run(
+                self.snapshot_store.get, package_name, stored['resource_id'], as_of
+            )
+            return await self._run(_parse, name, data, stored, **kwargs)
+
+        metadata = await self.get_package(package_name)
+        resource = next(
+            (r for r in metadata['resources'] if r['position'] == resource_idx),
+            None
+        )
+        if resource is None:
+            raise KeyError(f"{package_name} has no resource at position {resource_idx}")
+
+        content = await self._download(resource['url'])
+        if self.snapshot_store is not None:
+            await self._run(self.snapshot_store.put, package_name, resource, content)
+        return await self._run(_parse, name, content, resource, **kwargs)
+
+    async def gather_packages(
+        self,
+        package_names: Iterable[str],
+        return_exceptions: bool = False
+    ) -> Dict[str, Dict]:
+        """
+        Get the metadata of several packages concurrently.
+
+        Args:
+            package_names: Names of the packages
+            return_exceptions: Return exceptions in place of failed results
+                instead of raising the first one
+
+        Returns:
+            Dictionary of package name to metadata (or exception)
+        """
+        package_names = list(package_names)
+        results = await asyncio.gather(
+            *(self.get_package(name) for name in package_names),
+            return_exceptions=return_exceptions
+        )
+        return dict(zip(package_names, results))
+
+    async def gather_resources(
+        self,
+        requests: Iterable[Union[str, Tuple[str, int], Tuple[str, int, Dict]]],
+        return_exceptions: bool = False
+    ) -> Dict[Tuple[str, int], pd.DataFrame]:
+        """
+        Get the data of several resources concurrently.
+
+        Args:
+            requests: Resources to get, each a package name (first resource),
+                a (package name, resource idx) pair or a (package name,
+                resource idx, read kwargs) triple
+            return_exceptions: Return exceptions in place of failed results
+                instead of raising the first one
+
+        Returns:
+            Dictionary of (package name, resource idx) to DataFrame (or
+            exception)
+        """
+        keys: List[Tuple[str, int]] = []
+        calls = []
+        for request in requests:
+            if isinstance(request, str):
+                request = (request, 0)
+            package_name, resource_idx, *rest = request
+            keys.append((package_name, resource_idx))
+            calls.append(self.get_resource_data(
+                package_name, resource_idx, **(rest[0] if rest else {})
+            ))
+        results = await asyncio.gather(*calls, return_exceptions=return_exceptions)
+        return dict(zip(keys, results))
+
+
+def fetch_resources(
+    requests: Iterable[Union[str, Tuple[str, int], Tuple[str, int, Dict]]],
+    max_connections: int = 8,
+    **client_kwargs
+) -> Dict[Tuple[str, int], pd.DataFrame]:
+    """
+    Get several resources concurrently from synchronous code.
+
+    Runs its own event loop, so call it from scripts rather than from a
+    running loop (in a notebook, await gather_resources instead).
+
+    Args:
+        requests: Resources to get (see AsyncTorontoOpenDataAPI.gather_resources)
+        max_connections: Maximum concurrent connections to the portal
+        **client_kwargs: Additional arguments for AsyncTorontoOpenDataAPI
+
+    Returns:
+        Dictionary of (package name, resource idx) to DataFrame
+    """
+    async def run():
+        async with AsyncTorontoOpenDataAPI(max_connections, **client_kwargs) as client:
+            return await client.gather_resources(requests)
+
+    return asyncio.run(run())
@@ -0,0 +1,324 @@
+"""
+census_matrix.py
+
+Memory-mapped numeric matrix of the neighbourhood census profile.
+
+The city's census profile is a wide table of a few thousand metric rows
+(nested by leading spaces) by 158 neighbourhood columns of mixed text and
+numbers. build_census_matrix converts it once into a float32 metrics x
+neighbourhoods array saved as .npy, with JSON sidecars for the metric paths
+and the neighbourhoods. CensusMatrix opens the array with mmap_mode='r', so
+processes opening the same file share its pages instead of each parsing
+and holding its own copy, and cross-neighbourhood analytics (correlations,
+percentile ranks, similarity) are single vectorized operations over it.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from common.population_metrics import (
+    TARGET_METRICS, add_derived_metrics, identify_hierarchy_level
+)
+from common.profiling import profiled
+
+VALUES_FILE = 'values.npy'
+METRICS_FILE = 'metrics.json'
+NEIGHBOURHOODS_FILE = 'neighbourhoods.json'
+
+PATH_SEPARATOR = ' > '
+
+
+def metric_paths(metric_names):
+    """
+    Full hierarchical path of each metric of a census profile.
+
+    Parameters:
+    metric_names (iterable of str): Metric names with leading spaces
+        marking their level (first column of the census profile)
+
+    Returns:
+    list: Paths such as 'Total - Age groups ... > 15 to 64 years > 15 to 19 years'
+    list: Hierarchy level of each metric
+    """
+    paths, levels, stack = [], [], []
+    for metric_name in metric_names:
+        level, clean_name = identify_hierarchy_level(str(metric_name))
+        stack = stack[:level] + [clean_name]
+        paths.append(PATH_SEPARATOR.join(stack))
+        levels.append(level)
+    return paths, levels
+
+
+@profiled
+def build_census_matrix(df, directory):
+    """
+    Convert a census profile into a memory-mappable matrix with sidecars.
+
+    Parameters:
+    df (pd.DataFrame): Census data with first column as metric names and
+        one column per neighbourhood
+    directory (str or Path): Output directory (created if missing)
+
+    Returns:
+    CensusMatrix: The matrix, opened memory-mapped from directory
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    names = df.iloc[:, 0].astype(str)
+    paths, levels = metric_paths(names)
+    # One coercion pass over the whole block; text values become NaN
+    raw = df.iloc[:, 1:].to_numpy(dtype=object)
+    values = pd.to_numeric(pd.Series(raw.ravel()), errors='coerce')
+    values = values.to_numpy(dtype=np.float32).reshape(raw.shape)
+
+    np.save(directory / VALUES_FILE, values)
+    (directory / METRICS_FILE).write_text(json.dumps({
+        'name': names.str.strip().tolist(),
+        'path': paths,
+        'level': levels
+    }))
+    number_row = names.str.strip() == TARGET_METRICS['neighbourhood_number']
+    numbers = (
+        values[number_row.to_numpy().argmax()] if number_row.any()
+        else np.full(values.shape[1], np.nan)
+    )
+    (directory / NEIGHBOURHOODS_FILE).write_text(json.dumps({
+        'names': [str(c) for c in df.columns[1:]],
+        'numbers': [None if np.isnan(x) else int(x) for x in numbers]
+    }))
+    return CensusMatrix(directory)
+
+
+class CensusMatrix:
+    """
+    Census profile as a read-only memory-mapped metrics x neighbourhoods matrix.
+
+    Parameters:
+    directory (str or Path): Directory written by build_census_matrix
+
+    Attributes:
+    values (np.memmap): float32 array, one row per metric, one column per
+        neighbourhood; NaN where the profile has no numeric value
+    metrics (pd.DataFrame): name, path and level of each row
+    neighbourhoods (pd.Index): Neighbourhood name of each column
+    neighbourhood_numbers (pd.Series): Neighbourhood number by name
+    """
+
+    def __init__(self, directory):
+        directory = Path(directory)
+        self.values = np.load(directory / VALUES_FILE, mmap_mode='r')
+        self.metrics = pd.DataFrame(
+            json.loads((directory / METRICS_FILE).read_text())
+        )
+        neighbourhoods = json.loads((directory / NEIGHBOURHOODS_FILE).read_text())
+        self.neighbourhoods = pd.Index(
+            neighbourhoods['names'], name='neighbourhood_name'
+        )
+        self.neighbourhood_numbers = pd.Series(
+            neighbourhoods['numbers'], index=self.neighbourhoods,
+            name='neighbourhood_number', dtype='Int64'
+        )
+        # First row of each path and of each name, as in the profile order
+        self._path_rows = dict(zip(
+            self.metrics['path'][::-1], self.metrics.index[::-1]
+        ))
+        self._name_rows = dict(zip(
+            self.metrics['name'][::-1], self.metrics.index[::-1]
+        ))
+
+    def __len__(self):
+        return len(self.metrics)
+
+    def row(self, metric):
+        """
+        Row number of a metric given by full path or by (first matching) name.
+
+        Parameters:
+        metric (str or int): Metric path, metric name or row number
+
+        Returns:
+        int: Row number
+        """
+        if isinstance(metric, (int, np.integer)):
+            return int(metric)
+        metric = metric.strip()
+        if metric in self._path_rows:
+            return self._path_rows[metric]
+        if metric in self._name_rows:
+            return self._name_rows[metric]
+        raise KeyError(f'Unknown metric {metric}')
+
+    def rows(self, metrics=None):
+        """Row numbers of several metrics (all rows if None)."""
+        if metrics is None:
+            return np.arange(len(self))
+        return np.array([self.row(m) for m in metrics], dtype=np.int64)
+
+    def numeric_rows(self, min_coverage=1.0):
+        """
+        Rows with numeric values for at least a share of neighbourhoods.
+
+        Parameters:
+        min_coverage (float): Minimum share of non-NaN neighbourhood values
+
+        Returns:
+        np.ndarray: Row numbers
+        """
+        coverage = 1 - np.isnan(self.values).mean(axis=1)
+        return np.flatnonzero(coverage >= min_coverage)
+
+    def frame(self, metrics=None, column='path'):
+        """
+        Selected metrics as a neighbourhoods x metrics DataFrame.
+
+        Parameters:
+        metrics (list, optional): Metric paths, names or rows; all if omitted
+        column (str): Metric label to use for the columns ('path' or 'name')
+
+        Returns:
+        pd.DataFrame: float32 values indexed by neighbourhood name
+        """
+        rows = self.rows(metrics)
+        return pd.DataFrame(
+            self.values[rows].T,
+            index=self.neighbourhoods,
+            columns=self.metrics[column].to_numpy()[rows]
+        )
+
+    @profiled
+    def correlations(self, metrics=None, with_metrics=None, min_periods=10):
+        """
+        Pearson correlations across neighbourhoods between metrics.
+
+        Pairs are computed over the neighbourhoods where both metrics have
+        values, all at once with matrix products.
+
+        Parameters:
+        metrics (list, optional): Metrics for the result rows; defaults to
+            all fully numeric rows
+        with_metrics (list, optional): Metrics for the result columns;
+            defaults to the same as metrics
+        min_periods (int): Minimum shared neighbourhoods for a correlation
+
+        Returns:
+        pd.DataFrame: Correlation matrix labelled by metric path
+        """
+        rows = self.numeric_rows() if metrics is None else self.rows(metrics)
+        other_rows = rows if with_metrics is None else self.rows(with_metrics)
+
+        x = np.asarray(self.values[rows], dtype=np.float64)
+        y = np.asarray(self.values[other_rows], dtype=np.float64)
+        mx, my = ~np.isnan(x), ~np.isnan(y)
+        x, y = np.where(mx, x, 0), np.where(my, y, 0)
+        # Sums restricted to the neighbourhoods where both values exist
+        n = mx.astype(np.float64) @ my.T
+        sx = x @ my.T
+        sy = mx @ y.T
+        sxx = (x * x) @ my.T
+        syy = mx @ (y * y).T
+        sxy = x @ y.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = (n * sxy - sx * sy) / np.sqrt(
+                (n * sxx - sx ** 2) * (n * syy - sy ** 2)
+            )
+        corr[n < min_periods] = np.nan
+        paths = self.metrics['path'].to_numpy()
+        return pd.DataFrame(
+            np.clip(corr, -1, 1), index=paths[rows], columns=paths[other_rows]
+        )
+
+    def top_correlations(self, metric, n=10, min_coverage=1.0):
+        """
+        Metrics most correlated (positively or negatively) with one metric.
+
+        Parameters:
+        metric (str or int): Metric path, name or row
+        n (int): Number of metrics to return
+        min_coverage (float): Minimum share of neighbourhoods with values
+
+        Returns:
+        pd.DataFrame: path and correlation, by decreasing absolute correlation
+        """
+        row = self.row(metric)
+        candidates = self.numeric_rows(min_coverage)
+        corr = self.correlations([row], candidates).iloc[0]
+        corr = corr[candidates != row].dropna()
+        order = np.argsort(-np.abs(corr.to_numpy()))[:n]
+        return pd.DataFrame({
+            'path': corr.index[order],
+            'correlation': corr.to_numpy()[order]
+        })
+
+    @profiled
+    def percentile_ranks(self, metrics=None):
+        """
+        Percentile rank (0-1] of every neighbourhood within each metric.
+
+        Parameters:
+        metrics (list, optional): Metric paths, names or rows; all if omitted
+
+        Returns:
+        pd.DataFrame: Ranks, neighbourhoods x metric paths (NaN stays NaN)
+        """
+        return self.frame(metrics).rank(axis=0, pct=True)
+
+    @profiled
+    def similar_neighbourhoods(self, neighbourhood, metrics=None, n=10):
+        """
+        Neighbourhoods with the most similar profile to a given one.
+
+        Metrics are standardized across neighbourhoods and compared by
+        Euclidean distance, averaged over the metrics both have.
+
+        Parameters:
+        neighbourhood (str): Neighbourhood name
+        metrics (list, optional): Metrics to compare on; defaults to all
+            fully numeric rows
+        n (int): Number of neighbourhoods to return
+
+        Returns:
+        pd.DataFrame: neighbourhood_name and distance, nearest first
+        """
+        if neighbourhood not in self.neighbourhoods:
+            raise KeyError(f'Unknown neighbourhood {neighbourhood}')
+        target = self.neighbourhoods.get_loc(neighbourhood)
+        rows = self.numeric_rows() if metrics is None else self.rows(metrics)
+
+        x = np.asarray(self.values[rows], dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (x - np.nanmean(x, axis=1, keepdims=True)) / np.nanstd(
+                x, axis=1, keepdims=True
+            )
+        diff = (z - z[:, [target]]) ** 2
+        distance = np.sqrt(np.nanmean(diff, axis=0))
+        distance[target] = np.nan
+
+        order = np.argsort(distance)[:n]
+        return pd.DataFrame({
+            'neighbourhood_name': self.neighbourhoods[order],
+            'distance': distance[order]
+        })
+
+    @profiled
+    def population_metrics(self):
+        """
+        Same output as population_metrics.extract_population_metrics, read
+        from the matrix instead of the raw profile.
+
+        Returns:
+        pd.DataFrame: Processed population metrics by neighborhood
+        """
+        results = pd.DataFrame(index=pd.Index(self.neighbourhoods, name=None))
+        for result_name, metric_name in TARGET_METRICS.items():
+            if metric_name.strip() in self._name_rows:
+                row = self._name_rows[metric_name.strip()]
+                values = self.values[row].astype(np.float64)
+                # Counts come back as integers, as parsed from the profile
+                if np.all(np.isfinite(values)) and np.all(values == np.round(values)):
+                    values = values.astype(np.int64)
+                results[result_name] = values
+        return add_derived_metrics(results)
@@ -6,12 +6,19 @@ Common data processing utilities for Toronto Open Data.
 """
 
 import pandas as pd
-from typing import Dict
+from concurrent.futures import Executor
+from typing import Dict, Optional
 from datetime import datetime
 
+from common.name_matching import NameCanonicalizer
+from common.parallel import parallel_executor, parallel_groupby_agg
+from common.profiling import profiled
+from common.validation import ColumnRule, DataValidator, Schema, SchemaError
+
 class DataProcessor:
     
     @staticmethod
+    @profiled
     def parse_datetime(
         df: pd.DataFrame,
         datetime_col: str,
@@ -43,6 +50,7 @@ class DataProcessor:
         return df
     
     @staticmethod
+    @profiled
     def add_temporal_flags(
         df: pd.DataFrame,
         datetime_col: str
@@ -73,18 +81,49 @@ class DataProcessor:
 
 class FerryDataProcessor:
     """Processor for ferry data."""
+    
+    # Expected raw columns of the ferry ticket counts datastore resource
+    schema = Schema(
+        columns=[
+            ColumnRule('_id', 'numeric', required=False, integer=True),
+            ColumnRule(
+                'Timestamp', 'datetime',
+                datetime_format='%Y-%m-%dT%H:%M:%S'
+            ),
+            ColumnRule('Sales Count', 'numeric', min_value=0, integer=True),
+            ColumnRule('Redemption Count', 'numeric', min_value=0, integer=True)
+        ],
+        interval_col='Timestamp',
+        interval='15min'
+    )
+    
     @staticmethod
+    @profiled
     def process_resource(
         df: pd.DataFrame,
+        validator: Optional[DataValidator] = None
     ) -> pd.DataFrame:
-        """Process ferry ticket data."""
-        df = df.copy()
-        df = DataProcessor.parse_datetime(
-            df,
-            datetime_col='Timestamp',
-            add_components=False,
-            format='%Y-%m-%dT%H:%M:%S'
-        )
+        """
+        Process ferry ticket data.
+        
+        Args:
+            df: Raw ferry ticket counts
+            validator: Validator (e.g. DataValidator(FerryDataProcessor.schema))
+                to check the rows with; failing rows are quarantined there
+            
+        Returns:
+            DataFrame with parsed Timestamp and temporal flags
+        """
+        if validator is not None:
+            # A new frame, with Timestamp already parsed
+            df = validator.validate(df, 'toronto-island-ferry-ticket-counts')
+        else:
+            df = DataProcessor.parse_datetime(
+                df,
+                datetime_col='Timestamp',
+                add_components=False,
+                format='%Y-%m-%dT%H:%M:%S'
+            )
         df = DataProcessor.add_temporal_flags(df, 'Timestamp')
         # # Parse Timestamp as datetime obj
         # df['datetimeTimestamp'] = pd.to_datetime(
@@ -106,11 +145,34 @@ class FerryDataProcessor:
         return df
     
 class PetNamesProcessor:
-    """Processor for pet names data."""
+    """
+    Processor for pet names data.
+    
+    Args:
+        validator: Validator (e.g. DataValidator(PetNamesProcessor.schema))
+            to check each resource with; failing rows are quarantined there
+        canonicalizer: NameCanonicalizer merging spelling variants of names
+            (e.g. 'KOKO' into 'COCO') before names are totalled and ranked
+    """
+    
+    # Expected columns of each yearly pet names resource, once renamed
+    schema = Schema(
+        columns=[
+            ColumnRule('name', 'string', allow_null=True),
+            ColumnRule('count', 'numeric', allow_null=True, min_value=0)
+        ]
+    )
     
-    def __init__(self):
+    def __init__(
+        self,
+        validator: Optional[DataValidator] = None,
+        canonicalizer: Optional[NameCanonicalizer] = None
+    ):
         self.no_name_values = ['', 'N/A', 'NO NAME LISTED']
+        self.validator = validator
+        self.canonicalizer = canonicalizer
         
+    @profiled
     def process_resource(
         self,
         df: pd.DataFrame,
@@ -119,16 +181,27 @@ class PetNamesProcessor:
         """Process a single pet names resource."""
         # Clean and standardize names
         df = df.copy()
-        df.columns = ['name', 'count']
+        expected = [rule.name for rule in self.schema.columns]
+        # Headerless files come with positional columns; check the raw
+        # columns before naming them, so extra or renamed ones are reported
+        if list(df.columns) == list(range(len(expected))):
+            df.columns = expected
+        if self.validator is not None:
+            df = self.validator.validate(df, resource['name'])
+        if list(df.columns) != expected:
+            raise SchemaError(
+                f"{resource['name']} has columns {list(df.columns)}; "
+                f"expected {len(expected)} columns ({expected})"
+            )
         
         # Standardize NO NAME entries and clean counts
-        df['name'] = df['name'].apply(
-            lambda x: 'NO NAME' if x in self.no_name_values else x
+        df['name'] = df['name'].mask(
+            df['name'].isin(self.no_name_values), 'NO NAME'
         )
-        df['count'] = pd.to_numeric(
-            df['count'].replace('', 0), 
-            errors='coerce'
-        ).fillna(0)
+        if self.validator is None:
+            df['count'] = pd.to_numeric(df['count'].replace('', 0), errors='coerce')
+        # (the validator already converted the counts, blanks to NaN)
+        df['count'] = df['count'].fillna(0)
         
         # Extract year and species from resource name
         title = resource['name'].strip('\t').split('-')
@@ -140,15 +213,48 @@ class PetNamesProcessor:
         
         return df
     
-    def post_process(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Post-process the complete dataset."""
+    @profiled
+    def post_process(
+        self,
+        df: pd.DataFrame,
+        n_jobs: Optional[int] = None,
+        executor: Optional[Executor] = None
+    ) -> pd.DataFrame:
+        """
+        Post-process the complete dataset.
+        
+        Args:
+            df: Concatenated output of process_resource
+            n_jobs: Run the name totals groupby on this many worker
+                processes (see common.parallel); by default it runs serially
+            executor: Existing process pool to run it on instead, e.g. a
+                SharedMemoryExecutor kept across calls
+            
+        Returns:
+            DataFrame of name totals ranked within year and species, with
+            year, species and name as categoricals
+        """
         # Convert count to integer
         df['count'] = df['count'].astype('Int64')
         
+        # Merge spelling variants so they are counted as one name
+        if self.canonicalizer is not None:
+            df['name'] = self.canonicalizer.canonicalize(df['name'], df['count'])
+        
+        # Factorize the keys once: the groupbys below (and the parallel
+        # workers) then work on integer codes
+        keys = ['year', 'species', 'name']
+        df[keys] = df[keys].astype('category')
+        
         # Group by year, species, name and calculate totals
-        df = (df
-            .groupby(['year', 'species', 'name'], as_index=False)
-            .sum()
+        with parallel_executor(n_jobs, executor) as pool:
+            if pool is None:
+                totals = df.groupby(keys, as_index=False, observed=True)['count'].sum()
+            else:
+                totals = parallel_groupby_agg(
+                    df, keys, {'count': 'sum'}, executor=pool
+                ).reset_index()
+        df = (totals
             .sort_values(
                 by=[
                     'year',
@@ -166,7 +272,7 @@ class PetNamesProcessor:
         # Calculate rank within year and species
         df['rank'] = (df
             .drop(columns='name')
-            .groupby(['year', 'species'])
+            .groupby(['year', 'species'], observed=True)
             .rank(method='min', ascending=False)
         )
         
@@ -0,0 +1,321 @@
+"""
+fake_ckan.py
+
+Local stand-in for the Toronto Open Data CKAN portal and the Environment
+Canada bulk weather endpoint, for running refreshes offline.
+
+FakeCKANServer serves package_show metadata and resource downloads for
+packages held in memory, plus generated hourly weather CSVs. sample_packages
+builds small synthetic versions of the ferry, pet-name and neighbourhood
+profile packages in the shapes the real portal returns them.
+
+Run a sample portal with:
+    python -m common.fake_ckan --port 8766
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from common.population_metrics import TARGET_METRICS
+
+WEATHER_PATH = '/climate_data/bulk_data_e.html'
+
+
+def _csv_bytes(df: pd.DataFrame, **kwargs) -> bytes:
+    kwargs.setdefault('index', False)
+    return df.to_csv(**kwargs).encode()
+
+
+def sample_packages(
+    seed: int = 0,
+    years: Iterable[int] = (2022, 2023),
+    n_neighbourhoods: int = 158
+) -> Dict[str, List[Dict]]:
+    """
+    Synthetic ferry, pet-name and neighbourhood profile packages.
+
+    Args:
+        seed: Random seed
+        years: Years covered by the ferry counts and pet-name resources
+        n_neighbourhoods: Number of neighbourhood columns of the profile
+
+    Returns:
+        Mapping of package name to resources, each a dictionary with name,
+        format, datastore_active and data (raw bytes)
+    """
+    rng = np.random.default_rng(seed)
+    years = list(years)
+
+    timestamps = pd.date_range(
+        f'{years[0]}-01-01', f'{years[-1]}-12-31 23:45', freq='15min'
+    )
+    ferry = pd.DataFrame({
+        '_id': np.arange(1, len(timestamps) + 1),
+        'Timestamp': timestamps.strftime('%Y-%m-%dT%H:%M:%S'),
+        'Redemption Count': rng.poisson(20, len(timestamps)),
+        'Sales Count': rng.poisson(20, len(timestamps))
+    })
+
+    names = ['LUNA', 'COCO', 'KOKO', 'MAX', 'BELLA', 'CHARLIE', 'MR. BEAN',
+             'MOLLY', 'ROCKY', 'N/A', 'NO NAME LISTED']
+    pets = []
+    for year in years:
+        for species in ['Cat', 'Dog']:
+            counts = pd.DataFrame({
+                'name': names,
+                'count': rng.integers(1, 500, len(names))
+            })
+            pets.append({
+                'name': f'licensed-pets-{species}s-{year}',
+                'format': 'CSV',
+                'datastore_active': False,
+                'data': _csv_bytes(counts, header=False)
+            })
+
+    neighbourhoods = [f'Neighbourhood {i}' for i in range(1, n_neighbourhoods + 1)]
+    population = rng.integers(5_000, 40_000, n_neighbourhoods)
+
+    def share(low, high):
+        return (population * rng.uniform(low, high, n_neighbourhoods)).astype(int)
+
+    # Metric rows as in the profile; leading spaces mark nested metrics
+    rows = {
+        TARGET_METRICS['neighbourhood_number']: np.arange(1, n_neighbourhoods + 1),
+        'TSNS 2020 Designation': (
+            ['Not an NIA or Emerging Neighbourhood'] * n_neighbourhoods
+        ),
+        TARGET_METRICS['total_population']: population,
+        '  ' + TARGET_METRICS['youth_15_19']: share(0.04, 0.08),
+        '  ' + TARGET_METRICS['youth_20_24']: share(0.05, 0.09),
+        '  ' + TARGET_METRICS['seniors_65_plus']: share(0.1, 0.25),
+        TARGET_METRICS['low_income']: share(0.05, 0.3),
+        TARGET_METRICS['median_income_2019']: rng.integers(25_000, 60_000, n_neighbourhoods),
+        TARGET_METRICS['median_income_2020']: rng.integers(25_000, 60_000, n_neighbourhoods)
+    }
+    profile = pd.DataFrame(
+        [[name, *values] for name, values in rows.items()],
+        columns=['Neighbourhood Name', *neighbourhoods]
+    )
+
+    return {
+        'toronto-island-ferry-ticket-counts': [{
+            'name': 'toronto-island-ferry-ticket-counts',
+            'format': 'CSV',
+            'datastore_active': True,
+            'data': _csv_bytes(ferry)
+        }],
+        'licensed-dog-and-cat-names': pets,
+        'neighbourhood-profiles': [{
+            'name': 'neighbourhood-profiles-2021-158-model',
+            'format': 'CSV',
+            'datastore_active': False,
+            'data': _csv_bytes(profile)
+        }]
+    }
+
+
+def sample_weather(station_id: int, year: int, month: int) -> bytes:
+    """
+    Hourly weather CSV for one month, in the Environment Canada layout.
+
+    Args:
+        station_id: Weather station ID (seeds the values)
+        year: Year of the month
+        month: Month
+
+    Returns:
+        CSV bytes
+    """
+    rng = np.random.default_rng([station_id, year, month])
+    start = pd.Timestamp(year=year, month=month, day=1)
+    end = start + pd.offsets.MonthEnd(1) + pd.Timedelta(hours=23)
+    hours = pd.date_range(start, end, freq='h')
+    df = pd.DataFrame({
+        'Climate ID': station_id,
+        'Date/Time (LST)': hours.strftime('%Y-%m-%d %H:%M'),
+        'Temp (°C)': np.round(10 - 12 * np.cos(2 * np.pi * (month - 1) / 12)
+                              + rng.normal(0, 3, len(hours)), 1),
+        'Precip. Amount (mm)': np.round(rng.exponential(0.2, len(hours)), 1),
+        'Rel Hum (%)': rng.integers(30, 100, len(hours)),
+        'Wind Spd (km/h)': rng.integers(0, 40, len(hours))
+    })
+    return _csv_bytes(df)
+
+
+class FakeCKANServer:
+    """
+    Threaded local HTTP server imitating the CKAN API and weather endpoint.
+
+    Args:
+        packages: Mapping of package name to resources (see sample_packages);
+            defaults to sample_packages()
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+        latency: Seconds to wait before answering each request
+        failing: Package names whose metadata and downloads answer 500,
+            to exercise error handling
+    """
+
+    def __init__(
+        self,
+        packages: Optional[Dict[str, List[Dict]]] = None,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: float = 0.0,
+        failing: Iterable[str] = ()
+    ):
+        self.packages = sample_packages() if packages is None else packages
+        self.latency = latency
+        self.failing = set(failing)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """Root URL to pass as base_url to TorontoOpenDataAPI."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def weather_url(self) -> str:
+        """URL to pass as base_url to download_weather_data."""
+        return self.base_url + WEATHER_PATH
+
+    def _metadata(self, package_name: str) -> Dict:
+        resources = []
+        for position, resource in enumerate(self.packages[package_name]):
+            resources.append({
+                'id': f'{package_name}-{position}',
+                'position': position,
+                'name': resource['name'],
+                'format': resource['format'],
+                'datastore_active': resource['datastore_active'],
+                'url_type': 'datastore' if resource['datastore_active'] else 'upload',
+                'url': f'{self.base_url}/download/{package_name}/{position}'
+            })
+        return {
+            'name': package_name,
+            'num_resources': len(resources),
+            'resources': resources
+        }
+
+    def _respond(self, path: str, params: Dict):
+        """Status, content type and body for a request."""
+        if path == '/api/3/action/package_show':
+            name = params.get('id')
+            if name in self.failing:
+                return 500, 'text/plain', b'Internal Server Error'
+            if name not in self.packages:
+                body = {'success': False, 'error': {
+                    '__type': 'Not Found', 'message': 'Not found'
+                }}
+                return 404, 'application/json', json.dumps(body).encode()
+            body = {'success': True, 'result': self._metadata(name)}
+            return 200, 'application/json', json.dumps(body).encode()
+
+        if path.startswith('/download/'):
+            _, _, name, position = path.split('/', 3)
+            if name in self.failing:
+                return 500, 'text/plain', b'Internal Server Error'
+            try:
+                data = self.packages[name][int(position)]['data']
+            except (KeyError, IndexError, ValueError):
+                return 404, 'text/plain', b'Not found'
+            return 200, 'application/octet-stream', data
+
+        if path == WEATHER_PATH:
+            try:
+                data = sample_weather(
+                    int(params['stationID']), int(params['Year']), int(params['Month'])
+                )
+            except (KeyError, ValueError):
+                return 400, 'text/plain', b'Bad request'
+            return 200, 'text/csv', data
+
+        return 404, 'text/plain', b'Not found'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                url = urlsplit(self.path)
+                status, content_type, body = server._respond(
+                    url.path, dict(parse_qsl(url.query))
+                )
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serve requests on the calling thread until stopped."""
+        self._server.serve_forever()
+
+    def start(self) -> 'FakeCKANServer':
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port."""
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a sample fake CKAN portal.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before each response')
+    args = parser.parse_args(argv)
+
+    server = FakeCKANServer(host=args.host, port=args.port, latency=args.latency)
+    print(f'Serving {sorted(server.packages)} on {server.base_url}')
+    print(f'Weather endpoint: {server.weather_url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+name_matching.py
+
+Fuzzy canonicalization of spelling variants of names.
+
+Names are normalized (case, punctuation, spacing) and reduced to a simple
+phonetic key ("COCO" and "KOKO" both become KOKO). Only names sharing a
+blocking key, the first letter plus the consonant skeleton of the phonetic
+key, are compared, so the work grows with the number of distinct names
+rather than with its square. Within blocks the similarity is the Dice
+coefficient of padded character bigrams, computed for all candidate pairs
+at once as one sparse matrix product whose features are (block, bigram)
+pairs. Similar names are clustered and each cluster is mapped to its most
+frequent spelling.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from common.profiling import profiled
+
+# Ordered rewrites turning a normalized name into its phonetic key
+_PHONETIC_RULES = [
+    (r'\s+', ''),
+    (r'(.)\1+', r'\1'),
+    (r'X', 'KS'),
+    (r'PH', 'F'),
+    (r'CH', 'x'),  # placeholder, so the C rule below leaves CH alone
+    (r'CK', 'K'),
+    (r'C(?=[EIY])', 'S'),
+    (r'[CQ]', 'K'),
+    (r'Z', 'S'),
+    (r'x', 'X'),
+    (r'(?:IE|EY|EE|Y)$', 'I'),
+    (r'Y', 'I'),
+    (r'(.)\1+', r'\1')
+]
+
+
+def normalize_names(names: pd.Series) -> pd.Series:
+    """
+    Upper-case names, drop punctuation and collapse whitespace.
+
+    Args:
+        names: Names to normalize
+
+    Returns:
+        Normalized names ("Mr. Bean " becomes "MR BEAN"); missing names
+        stay missing
+    """
+    return (names.where(names.isna(), names.astype(str))
+        .str.upper()
+        .str.replace(r"['.]", '', regex=True)
+        .str.replace(r'[^\w\s]|_', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+
+def phonetic_keys(names: pd.Series) -> pd.Series:
+    """
+    Simple phonetic key of normalized names.
+
+    Spaces are dropped, similar-sounding letters are merged (hard C/K/Q,
+    soft C/S, Z/S, PH/F, final Y/IE/EY/I) and repeated letters collapsed;
+    vowels are kept so the key can still be compared letter by letter.
+
+    Args:
+        names: Normalized names (see normalize_names)
+
+    Returns:
+        Phonetic keys
+    """
+    keys = names
+    for pattern, replacement in _PHONETIC_RULES:
+        keys = keys.str.replace(pattern, replacement, regex=True)
+    return keys
+
+
+def blocking_keys(keys: pd.Series) -> pd.Series:
+    """
+    First letter plus the consonant skeleton of phonetic keys.
+
+    Args:
+        keys: Phonetic keys (see phonetic_keys)
+
+    Returns:
+        Blocking keys; only names with equal blocking keys are compared
+    """
+    return keys.str[:1] + keys.str[1:].str.replace(r'[AEIOU]', '', regex=True)
+
+
+class NameCanonicalizer:
+    """
+    Map spelling variants of names to a canonical spelling.
+
+    The variant -> canonical mapping is cached on the instance (and in
+    cache_path if given); it is only rebuilt when names not seen before
+    come in, in which case the new names are clustered together with the
+    cached ones.
+
+    Args:
+        threshold: Minimum bigram Dice similarity of the phonetic keys for
+            two names to be treated as the same name
+        exclude: Names (normalized) that are never merged, e.g. 'NO NAME'
+        cache_path: Optional JSON file to load the mapping from and save it to
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        exclude: Iterable[str] = ('NO NAME',),
+        cache_path: Optional[str] = None
+    ):
+        self.threshold = threshold
+        self.exclude = set(exclude)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.mapping: Dict[str, str] = {}
+        self.weights: Dict[str, float] = {}
+        if self.cache_path is not None and self.cache_path.exists():
+            cached = json.loads(self.cache_path.read_text())
+            self.mapping = cached['mapping']
+            self.weights = cached['weights']
+
+    def _similar_pairs(self, keys: pd.Series, blocks: pd.Series):
+        """Index pairs (i < j) of keys in the same block with Dice >= threshold."""
+        padded = ('^' + keys + '$').to_numpy()
+        rows, features = [], []
+        for i, key in enumerate(padded):
+            bigrams = {key[j:j + 2] for j in range(len(key) - 1)}
+            rows.extend([i] * len(bigrams))
+            features.extend(bigrams)
+        rows = np.asarray(rows, dtype=np.int64)
+        block_codes = pd.factorize(blocks)[0]
+        # Features are (block, bigram), so products only pair names of a block
+        feature_codes = pd.factorize(pd.MultiIndex.from_arrays([
+            block_codes[rows], np.asarray(features, dtype=object)
+        ]))[0]
+
+        incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, feature_codes)),
+            shape=(len(keys), feature_codes.max() + 1 if len(rows) else 0)
+        )
+        shared = sparse.triu(incidence @ incidence.T, k=1).tocoo()
+        sizes = np.asarray(incidence.sum(axis=1)).ravel()
+        dice = 2 * shared.data / (sizes[shared.row] + sizes[shared.col])
+        keep = dice >= self.threshold
+        return shared.row[keep], shared.col[keep]
+
+    @profiled
+    def fit(self, names: pd.Series, weights: Optional[pd.Series] = None):
+        """
+        Cluster names and rebuild the variant -> canonical mapping.
+
+        Args:
+            names: Names (raw or normalized); may repeat; missing names are
+                ignored
+            weights: Optional weight per name (e.g. counts) used to pick the
+                most common spelling of each cluster; defaults to occurrences
+
+        Returns:
+            self
+        """
+        normalized = normalize_names(names)
+        if weights is None:
+            weights = pd.Series(1.0, index=names.index)
+        present = normalized.notna().to_numpy()
+        totals = (pd.Series(
+                weights.to_numpy(dtype=float, na_value=0)[present],
+                index=normalized.to_numpy()[present]
+            )
+            .groupby(level=0).sum()
+        )
+        # Names seen before keep their cached weight unless given again
+        self.weights = {**self.weights, **totals.to_dict()}
+        totals = pd.Series(self.weights)
+
+        distinct = pd.Series(totals.index, dtype=object)
+        mapping = dict(zip(distinct, distinct))
+        candidates = distinct[~distinct.isin(self.exclude) & (distinct != '')]
+        candidates = candidates.reset_index(drop=True)
+        keys = phonetic_keys(candidates)
+        usable = keys.str.len() > 0
+        candidates, keys = candidates[usable].reset_index(drop=True), keys[usable].reset_index(drop=True)
+
+        if len(candidates):
+            left, right = self._similar_pairs(keys, blocking_keys(keys))
+            graph = sparse.coo_matrix(
+                (np.ones(len(left)), (left, right)),
+                shape=(len(candidates), len(candidates))
+            )
+            _, labels = connected_components(graph, directed=False)
+            # Canonical spelling: heaviest variant, ties broken alphabetically
+            clusters = pd.DataFrame({
+                'name': candidates,
+                'label': labels,
+                'weight': totals.reindex(candidates).to_numpy()
+            }).sort_values(['label', 'weight', 'name'], ascending=[True, False, True])
+            canonical = clusters.groupby('label')['name'].transform('first')
+            mapping.update(zip(clusters['name'], canonical))
+
+        self.mapping = mapping
+        if self.cache_path is not None:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps({
+                'mapping': self.mapping,
+                'weights': self.weights
+            }))
+        return self
+
+    def canonicalize(
+        self,
+        names: pd.Series,
+        weights: Optional[pd.Series] = None
+    ) -> pd.Series:
+        """
+        Replace names by their canonical spelling.
+
+        Uses the cached mapping, refitting first if any name is new.
+
+        Args:
+            names: Names to canonicalize
+            weights: Optional weight per name, used if a refit is needed
+
+        Returns:
+            Canonical names (normalized), aligned with names; missing names
+            stay missing
+        """
+        normalized = normalize_names(names)
+        unique = normalized.dropna().unique()
+        if not all(name in self.mapping for name in unique):
+            self.fit(names, weights)
+        return normalized.map(self.mapping)
+
+    def variants(self) -> pd.DataFrame:
+        """
+        Spelling variants merged into another name.
+
+        Returns:
+            DataFrame of variant, canonical and variant weight, one row per
+            variant that maps to a different spelling
+        """
+        df = pd.DataFrame({
+            'variant': list(self.mapping.keys()),
+            'canonical': list(self.mapping.values())
+        })
+        df = df[df['variant'] != df['canonical']].copy()
+        df['weight'] = df['variant'].map(self.weights)
+        return df.sort_values(['canonical', 'weight'], ascending=[True, False])
@@ -0,0 +1,228 @@
+"""
+panel_export.py
+
+Lazy year panels for Tableau-style exports.
+
+A YearPanel describes a table repeated once per year (optionally only for
+the years each row is valid) without building the repeated table. Rows
+are expanded a block at a time and streamed to CSV, Parquet or Tableau
+Hyper, so memory depends on the chunk size rather than on the number of
+rows times the number of years.
+"""
+
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from common.profiling import profiled
+
+
+class YearPanel:
+    """
+    Base table crossed with a range of years, expanded on demand.
+
+    Expanded rows come out in the same order as a cross join of the base
+    table with the years: each base row followed by its years ascending.
+
+    Args:
+        base: Table to repeat per year
+        start_year: First year of the panel
+        end_year: Last year of the panel (inclusive)
+        year_col: Name of the added year column
+        start_col: Optional column (datetime or year) after which a row
+            becomes valid, e.g. a row's DATE_UPDATED; earlier years are skipped
+        end_col: Optional column (datetime or year) after which a row is no
+            longer valid; later years are skipped
+    """
+
+    def __init__(
+        self,
+        base: pd.DataFrame,
+        start_year: int,
+        end_year: int,
+        year_col: str = 'year',
+        start_col: Optional[str] = None,
+        end_col: Optional[str] = None
+    ):
+        self.base = base
+        self.year_col = year_col
+        n = len(base)
+        first = np.full(n, start_year, dtype=np.int64)
+        last = np.full(n, end_year, dtype=np.int64)
+        if start_col is not None:
+            first = np.maximum(first, self._years(base[start_col], start_year))
+        if end_col is not None:
+            last = np.minimum(last, self._years(base[end_col], end_year))
+        self.first_year = first
+        self.counts = np.clip(last - first + 1, 0, None)
+
+    @staticmethod
+    def _years(values: pd.Series, default: int) -> np.ndarray:
+        """Year of each value (datetime or numeric), default where missing."""
+        if pd.api.types.is_numeric_dtype(values):
+            years = values
+        else:
+            years = pd.to_datetime(values, errors='coerce').dt.year
+        return years.fillna(default).to_numpy(dtype=np.int64)
+
+    def __len__(self) -> int:
+        """Number of rows of the expanded panel."""
+        return int(self.counts.sum())
+
+    def iter_chunks(self, chunk_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        Yield the expanded panel in consecutive chunks.
+
+        Args:
+            chunk_rows: Approximate number of expanded rows per chunk (a
+                chunk always holds every year of the base rows it covers)
+
+        Yields:
+            DataFrames with the base columns plus the year column
+        """
+        ends = np.cumsum(self.counts)
+        start = 0
+        while start < len(self.base):
+            offset = ends[start - 1] if start else 0
+            stop = int(np.searchsorted(ends, offset + chunk_rows, side='right'))
+            stop = max(stop, start + 1)
+
+            counts = self.counts[start:stop]
+            rows = np.repeat(np.arange(start, stop), counts)
+            # Position of each expanded row within its base row's years
+            within = np.arange(len(rows)) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            chunk = self.base.iloc[rows].reset_index(drop=True)
+            chunk[self.year_col] = self.first_year[rows] + within
+            start = stop
+            if len(chunk):
+                yield chunk
+
+    def _empty_chunk(self) -> pd.DataFrame:
+        """Zero-row panel with the columns and dtypes of every chunk."""
+        chunk = self.base.iloc[:0].reset_index(drop=True)
+        chunk[self.year_col] = np.array([], dtype=np.int64)
+        return chunk
+
+    @profiled
+    def to_csv(self, path: str, chunk_rows: int = 100_000, **kwargs) -> int:
+        """
+        Stream the panel to a CSV file.
+
+        Args:
+            path: Output file
+            chunk_rows: Expanded rows per chunk
+            **kwargs: Additional arguments for DataFrame.to_csv
+
+        Returns:
+            Number of rows written
+        """
+        kwargs.setdefault('index', False)
+        written = 0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        for chunk in self.iter_chunks(chunk_rows):
+            chunk.to_csv(
+                path,
+                mode='w' if written == 0 else 'a',
+                header=written == 0,
+                **kwargs
+            )
+            written += len(chunk)
+        if written == 0:
+            # Replace any earlier file with just the header
+            self._empty_chunk().to_csv(path, **kwargs)
+        return written
+
+    @profiled
+    def to_parquet(self, path: str, chunk_rows: int = 100_000) -> int:
+        """
+        Stream the panel to a Parquet file, one row group per chunk.
+
+        The schema comes from the whole base table, so a column that
+        happens to be all null in the first chunk keeps its type. Requires
+        pyarrow.
+
+        Args:
+            path: Output file
+            chunk_rows: Expanded rows per chunk
+
+        Returns:
+            Number of rows written
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.Schema.from_pandas(self.base, preserve_index=False)
+        year = pa.field(self.year_col, pa.int64())
+        if self.year_col in schema.names:
+            schema = schema.set(schema.get_field_index(self.year_col), year)
+        else:
+            schema = schema.append(year)
+
+        written = 0
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in self.iter_chunks(chunk_rows):
+                writer.write_table(
+                    pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                )
+                written += len(chunk)
+        return written
+
+    @profiled
+    def to_hyper(
+        self,
+        path: str,
+        table_name: str = 'Extract',
+        chunk_rows: int = 100_000
+    ) -> int:
+        """
+        Stream the panel into a Tableau Hyper extract.
+
+        Requires tableauhyperapi.
+
+        Args:
+            path: Output .hyper file (replaced if it exists)
+            table_name: Name of the table in the extract
+            chunk_rows: Expanded rows per chunk
+
+        Returns:
+            Number of rows written
+        """
+        from tableauhyperapi import (
+            Connection, CreateMode, HyperProcess, Inserter, SqlType,
+            TableDefinition, TableName, Telemetry
+        )
+
+        def sql_type(dtype):
+            if pd.api.types.is_bool_dtype(dtype):
+                return SqlType.bool()
+            if pd.api.types.is_integer_dtype(dtype):
+                return SqlType.big_int()
+            if pd.api.types.is_float_dtype(dtype):
+                return SqlType.double()
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                return SqlType.timestamp()
+            return SqlType.text()
+
+        # Column types from the whole base table, not from the first chunk,
+        # and the table is created even if the panel is empty
+        table = TableDefinition(TableName(table_name), [
+            TableDefinition.Column(str(col), sql_type(dtype))
+            for col, dtype in self._empty_chunk().dtypes.items()
+        ])
+        written = 0
+        with HyperProcess(Telemetry.DO_NOT_SEND_USAGE_DATA_TO_TABLEAU) as hyper:
+            with Connection(
+                hyper.endpoint, path, CreateMode.CREATE_AND_REPLACE
+            ) as connection:
+                connection.catalog.create_table(table)
+                for chunk in self.iter_chunks(chunk_rows):
+                    rows = chunk.astype(object).where(chunk.notna(), None)
+                    with Inserter(connection, table) as inserter:
+                        inserter.add_rows(rows.itertuples(index=False))
+                        inserter.execute()
+                    written += len(chunk)
+        return written
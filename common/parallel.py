@@ -0,0 +1,352 @@
+"""
+parallel.py
+
+Partition-parallel groupby aggregation on a process pool.
+
+The key and value columns are copied as-is into shared-memory buffers (one
+memcpy each; nothing is pickled but the buffer names and a row range).
+Each worker attaches to the buffers, groups its own row range with pandas
+and returns per-group sums and non-null counts for the groups it saw. The
+parent merges these small partial tables and finishes the aggregation,
+which works because every supported aggregation ('sum', 'count', 'mean')
+is decomposable.
+
+Numeric, boolean, datetime and categorical keys are grouped entirely in
+the workers. Object (string) keys cannot be shared without pickling, so
+the parent factorizes them into integer codes first; that step is serial
+and, like any serial step, limits the speedup (store such keys as
+'category', once, to avoid it).
+
+Speedup: the parent's serial work is the copy into shared memory, handing
+out the tasks and merging the partial tables. With a SharedMemoryExecutor
+kept across calls the buffers are reused, and measured on 5M rows grouped
+by two integer keys (year, month) with two count columns the copy takes
+about 0.03 s against 0.29 s for the plain pandas groupby, plus about
+0.02 s per call for the rest. That is about 15% of serial work, so the
+speedup is about 1.5x on 2 workers, 2.4x on 4 and 3.4x on 8, and cannot
+exceed about 6x however many workers there are. A pool started for a
+single call, or fresh buffers, cost more than the grouping itself on
+inputs this size; below MIN_PARALLEL_ROWS rows the plain pandas groupby
+is used.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from common.profiling import profiled
+
+SUPPORTED_AGGS = ('sum', 'count', 'mean')
+
+# Inputs below this many rows are always grouped serially. Measured with a
+# warm SharedMemoryExecutor (two integer keys, two count columns): a
+# parallel call has a fixed cost of about 20 ms, and the parent's copy
+# into the reused buffers about 10% of the pandas groupby time, so even
+# with 4 workers splitting the rest it only wins from about 1M rows up.
+MIN_PARALLEL_ROWS = 1_000_000
+
+# Fewer rows than this per worker go to fewer workers
+MIN_ROWS_PER_JOB = 250_000
+
+# Shared-memory segments a worker keeps mapped between tasks, by name
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+class SharedMemoryExecutor(ProcessPoolExecutor):
+    """
+    Process pool that keeps its shared-memory buffers between calls.
+
+    Most of the cost of copying a column into fresh shared memory is
+    faulting its pages in, in the parent and again in every worker. This
+    executor reuses one buffer per column slot (growing it when needed),
+    and its workers keep the buffers mapped, so only the first call on a
+    given size pays for that. Create one for a whole analysis and pass it
+    to every parallel_groupby_agg call; calls on the same executor run one
+    at a time. The buffers are released by ``shutdown``.
+
+    Args:
+        max_workers: Number of worker processes, defaults to the CPU count
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self.n_workers = max_workers or os.cpu_count() or 1
+        self.lock = threading.Lock()
+        self._buffers: Dict[int, shared_memory.SharedMemory] = {}
+
+    def buffer(self, slot: int, nbytes: int) -> shared_memory.SharedMemory:
+        """Buffer of at least nbytes for a column slot (hold ``lock``)."""
+        shm = self._buffers.get(slot)
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+            self._buffers[slot] = shm
+        return shm
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        with self.lock:
+            for shm in self._buffers.values():
+                shm.close()
+                shm.unlink()
+            self._buffers = {}
+
+
+@contextmanager
+def parallel_executor(
+    n_jobs: Optional[int] = None,
+    executor: Optional[Executor] = None
+):
+    """
+    Executor to run several parallel_groupby_agg calls on.
+
+    Args:
+        n_jobs: Number of worker processes for a new executor
+        executor: Existing executor to use as-is (not shut down here)
+
+    Yields:
+        executor if given, else a SharedMemoryExecutor with n_jobs workers
+        that is shut down on exit, or None if neither is given (run
+        serially)
+    """
+    if executor is not None or n_jobs is None:
+        yield executor
+        return
+    with SharedMemoryExecutor(max_workers=n_jobs) as pool:
+        yield pool
+
+
+def _copy_to(shm: shared_memory.SharedMemory, array: np.ndarray):
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to the parent's segment without tracking it in the worker.
+
+    Before Python 3.13 attaching also registers the segment with the
+    resource tracker, which then unlinks it (or warns about a leak) when
+    the worker exits, although the parent owns it.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _attach(name: str, shape, dtype, keep: bool = False):
+    shm = _attached.get(name) if keep else None
+    if shm is None:
+        shm = _open(name)
+        if keep:
+            _attached[name] = shm
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _shareable_key(series: pd.Series):
+    """
+    Array to share for a key column and how to turn its values back.
+
+    Returns:
+        array: Numeric array for shared memory (codes for object and
+            categorical keys, with -1 for missing values)
+        labels: None, the categorical dtype, or the uniques codes refer to
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.dtype
+    values = series.to_numpy()
+    if values.dtype.kind in 'biufmM':
+        return values, None
+    # Object keys: serial factorize in the parent (see module docstring)
+    codes, uniques = pd.factorize(series, sort=False)
+    return codes, pd.Index(uniques)
+
+
+def _partial_aggregate(task: Dict):
+    """Worker: per-group sums and non-null counts for one row range."""
+    start, stop = task['start'], task['stop']
+    keep = task['keep_attached']
+    names = {name for name, _, _ in task['columns'].values()}
+    # Buffers the parent has since replaced
+    for name in set(_attached) - names:
+        _attached.pop(name).close()
+    handles = []
+    try:
+        data = {}
+        for col, (name, dtype, coded) in task['columns'].items():
+            shm, array = _attach(name, (task['n_rows'],), dtype, keep)
+            if not keep:
+                handles.append(shm)
+            part = array[start:stop].copy()
+            del array
+            if coded and (part < 0).any():
+                # -1 marks a missing key; groupby drops NaN keys
+                part = np.where(part < 0, np.nan, part)
+            data[col] = part
+        df = pd.DataFrame(data, copy=False)
+        del data
+
+        grouped = df.groupby(task['by'], sort=False)
+        value_cols = task['value_cols']
+        sums = grouped[value_cols].sum()
+        counts = grouped[value_cols].count()
+        return sums, counts
+    finally:
+        for shm in handles:
+            shm.close()
+
+
+@profiled
+def parallel_groupby_agg(
+    df: pd.DataFrame,
+    by: Union[str, List[str]],
+    agg: Dict[str, str],
+    n_jobs: Optional[int] = None,
+    min_rows: Optional[int] = None,
+    min_rows_per_job: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> pd.DataFrame:
+    """
+    Group-by aggregation split across a process pool.
+
+    Equivalent to ``df.groupby(by, observed=True).agg(agg)`` for the
+    supported aggregations. Inputs below ``min_rows`` rows (or with fewer
+    than ``min_rows_per_job`` rows per worker) run serially with pandas,
+    since going parallel would cost more than it saves.
+
+    Args:
+        df: Input DataFrame
+        by: Column name or list of column names to group by
+        agg: Mapping of value column to 'sum', 'count' or 'mean'
+        n_jobs: Number of worker processes, defaults to the executor's
+            workers or the CPU count
+        min_rows: Minimum input rows before going parallel, defaults to
+            MIN_PARALLEL_ROWS
+        min_rows_per_job: Minimum rows per worker, defaults to
+            MIN_ROWS_PER_JOB
+        executor: Process pool to reuse across calls, preferably a
+            SharedMemoryExecutor (see parallel_executor); without one a
+            pool is started for this call only
+
+    Returns:
+        Aggregated DataFrame indexed by the sorted group keys
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    unsupported = set(agg.values()) - set(SUPPORTED_AGGS)
+    if unsupported:
+        raise ValueError(f'Unsupported aggregations: {unsupported}')
+
+    reuse = isinstance(executor, SharedMemoryExecutor)
+    n_jobs = n_jobs or (executor.n_workers if reuse else os.cpu_count()) or 1
+    min_rows = MIN_PARALLEL_ROWS if min_rows is None else min_rows
+    if min_rows_per_job is None:
+        min_rows_per_job = MIN_ROWS_PER_JOB
+    if len(df) < min_rows:
+        n_jobs = 1
+    n_jobs = max(1, min(n_jobs, len(df) // max(min_rows_per_job, 1)))
+    if n_jobs == 1:
+        return df.groupby(by, observed=True).agg(agg)
+
+    value_cols = list(agg)
+    arrays, labels = {}, {}
+    for col in dict.fromkeys(by + value_cols):
+        if col in by:
+            arrays[col], col_labels = _shareable_key(df[col])
+            if col_labels is not None:
+                labels[col] = col_labels
+        else:
+            arrays[col] = (
+                df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+                if df[col].hasnans else df[col].to_numpy()
+            )
+
+    def run(pool, buffer):
+        columns = {}
+        for slot, (col, array) in enumerate(arrays.items()):
+            shm = buffer(slot, array.nbytes)
+            _copy_to(shm, array)
+            columns[col] = (shm.name, array.dtype, col in labels)
+        bounds = np.linspace(0, len(df), n_jobs + 1).astype(int)
+        tasks = [
+            {
+                'columns': columns,
+                'by': by,
+                'value_cols': value_cols,
+                'n_rows': len(df),
+                'start': start,
+                'stop': stop,
+                'keep_attached': reuse
+            }
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        return list(pool.map(_partial_aggregate, tasks))
+
+    if reuse:
+        with executor.lock:
+            partials = run(executor, executor.buffer)
+    else:
+        buffers = []
+
+        def fresh_buffer(slot, nbytes):
+            buffers.append(shared_memory.SharedMemory(create=True, size=max(nbytes, 1)))
+            return buffers[-1]
+
+        try:
+            if executor is None:
+                with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+                    partials = run(pool, fresh_buffer)
+            else:
+                partials = run(executor, fresh_buffer)
+        finally:
+            for shm in buffers:
+                shm.close()
+                shm.unlink()
+
+    # Merge the partial group indexes (n_jobs x n_groups rows at most)
+    level = list(range(len(by)))
+    sums = pd.concat([p[0] for p in partials]).groupby(level=level).sum()
+    counts = pd.concat([p[1] for p in partials]).groupby(level=level).sum()
+
+    # Codes back to their labels, then into groupby's sorted key order
+    if labels:
+        keys = sums.index.to_frame(index=False)
+        for col, col_labels in labels.items():
+            codes = keys[col].astype(np.int64)
+            if isinstance(col_labels, pd.CategoricalDtype):
+                keys[col] = pd.Categorical.from_codes(codes, dtype=col_labels)
+            else:
+                keys[col] = col_labels.take(codes)
+        index = pd.MultiIndex.from_frame(keys) if len(by) > 1 else pd.Index(
+            keys[by[0]], name=by[0]
+        )
+        sums.index = counts.index = index
+    sums, counts = sums.sort_index(), counts.sort_index()
+
+    result = {}
+    for col in value_cols:
+        how = agg[col]
+        if how == 'sum':
+            values = sums[col].to_numpy()
+            if pd.api.types.is_integer_dtype(df[col].dtype):
+                values = pd.array(np.round(values).astype(np.int64), dtype=df[col].dtype)
+            result[col] = values
+        elif how == 'count':
+            result[col] = counts[col].to_numpy().astype(np.int64)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[col] = sums[col].to_numpy() / counts[col].to_numpy()
+
+    return pd.DataFrame(result, index=sums.index)
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+from common.profiling import profiled
+
 def identify_hierarchy_level(metric_name):
     """
     Determine hierarchy level based on leading spaces in metric name.
@@ -33,6 +35,22 @@ def identify_hierarchy_level(metric_name):
     return leading_spaces // 2, metric_name.strip()
 
 
+# Key metrics we want to extract with their parent categories
+TARGET_METRICS = {
+    'neighbourhood_number': 'Neighbourhood Number',
+    'total_population': 'Total - Age groups of the population - 25% sample data',
+    # 'tsns_designation': 'TSNS 2020 Designation' # note: not numeric! if using, need to handle it in next loop
+    # 'adults_15_64': '15 to 64 years',
+    'youth_15_19': '15 to 19 years',
+    'youth_20_24': '20 to 24 years',
+    'seniors_65_plus': '65 years and over',
+    'low_income': 'In low income based on the Low-income cut-offs, after tax (LICO-AT)',
+    'median_income_2019': 'Median after-tax income in 2019 among recipients ($)',
+    'median_income_2020': 'Median after-tax income in 2020 among recipients ($)'
+}
+
+
+@profiled
 def extract_hierarchical_metrics_names(df):
     """
     Extract metric names and their hierarchical relationships.
@@ -71,6 +89,7 @@ def extract_hierarchical_metrics_names(df):
     return metric_hierarchy
 
 
+@profiled
 def extract_population_metrics(df):
     """
     Extract metrics from census-formatted dataframe.
@@ -88,22 +107,8 @@ def extract_population_metrics(df):
     # Initialize results DataFrame
     results = pd.DataFrame(index=neighbourhoods)
     
-    # Key metrics we want to extract with their parent categories
-    target_metrics = {
-        'neighbourhood_number': 'Neighbourhood Number',
-        'total_population': 'Total - Age groups of the population - 25% sample data',
-        # 'tsns_designation': 'TSNS 2020 Designation' # note: not numeric! if using, need to handle it in next loop
-        # 'adults_15_64': '15 to 64 years',
-        'youth_15_19': '15 to 19 years',
-        'youth_20_24': '20 to 24 years',
-        'seniors_65_plus': '65 years and over',
-        'low_income': 'In low income based on the Low-income cut-offs, after tax (LICO-AT)',
-        'median_income_2019': 'Median after-tax income in 2019 among recipients ($)',
-        'median_income_2020': 'Median after-tax income in 2020 among recipients ($)'
-    }
-    
     # Extract each metric, considering hierarchy
-    for result_name, metric_name in target_metrics.items():
+    for result_name, metric_name in TARGET_METRICS.items():
         # Find the row with this metric, accounting for potential spaces
         metric_rows = df[df.iloc[:, 0].str.strip() == metric_name.strip()]
         
@@ -115,6 +120,19 @@ def extract_population_metrics(df):
             )
             results[result_name] = metric_values
     
+    return add_derived_metrics(results)
+
+
+def add_derived_metrics(results):
+    """
+    Add youth totals and percentages to extracted population metrics.
+    
+    Parameters:
+    results (pd.DataFrame): TARGET_METRICS columns indexed by neighbourhood name
+    
+    Returns:
+    pd.DataFrame: Metrics with derived columns and a neighbourhood_name column
+    """
     # Calculate derived metrics
     if 'total_population' in results.columns:
         # Get total youths from both age groups
@@ -133,12 +151,19 @@ def extract_population_metrics(df):
     
     return results
 
-def calculate_service_need_index(metrics_df):
+@profiled
+def calculate_service_need_index(metrics_df, extra_weights=None):
     """
     Calculate service need index based on neighbourhood population metrics.
     
     Parameters:
     metrics_df (pd.DataFrame): Processed population metrics
+    extra_weights (dict, optional): Additional columns of metrics_df and
+        their weights, e.g. accessibility metrics from
+        spatial_access.accessibility_metrics merged in by neighbourhood
+        ({'nearest_service_km': 0.2, 'services_within_km': -0.1}); use a
+        negative weight where higher values mean less need. Missing (or
+        infinite) values of these count as the average neighbourhood
     
     Returns:
     pd.Series: Series of float64 values representing the service need index of each neighbourhood
@@ -149,19 +174,28 @@ def calculate_service_need_index(metrics_df):
         'youth_15_24_pct': (1/3),
         'low_income_pct': (1/3)
     }
+    if extra_weights:
+        weights.update(extra_weights)
     # working copy of input df
     population_df = metrics_df.copy()
     
     # Normalize metrics
     for col in weights.keys():
         if col in population_df.columns:
+            values = population_df[col]
+            extra = bool(extra_weights) and col in extra_weights
+            if extra:
+                # Ignore missing values (e.g. no coordinates) and infinite
+                # ones (no service at all) when normalizing
+                values = values.where(np.isfinite(values))
             if not col.endswith('_pct'):
-                population_df[f'{col}_norm'] = (
-                    population_df[col] / population_df[col].max()
-                )
+                norm = values / values.max()
             else:
                 # Percentage columns are already normalized
-                population_df[f'{col}_norm'] = population_df[col] / 100
+                norm = values / 100
+            if extra:
+                norm = norm.fillna(norm.mean()).fillna(0)
+            population_df[f'{col}_norm'] = norm
     
     # Calculate weighted service need index
     index_components = []
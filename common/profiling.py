@@ -0,0 +1,390 @@
+"""
+profiling.py
+
+Lightweight timing and resource instrumentation for the data pipelines.
+
+Functions are wrapped with ``@profiled`` (or blocks with ``profile_block``)
+and, once profiling is switched on with ``enable_profiling``, every call
+produces a record with wall time, CPU time, bytes downloaded, rows in/out
+and peak memory. Records are handed to one or more sinks (log, JSON lines
+file, in-memory summary). While profiling is disabled the wrappers only
+check a flag and call straight through.
+
+Records are kept per thread, but tracemalloc (and process CPU time) are
+process-wide: while profiled calls run on more than one thread at once,
+peak memory cannot be attributed to a single call, so records that
+overlap another thread's profiled calls get no peak_memory, and their
+cpu_time includes the other threads' CPU.
+"""
+
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class _ProfilerState:
+    """Module-wide profiler configuration."""
+
+    def __init__(self):
+        self.enabled = False
+        self.track_memory = False
+        self.sinks = []
+        self.local = threading.local()
+        # Threads with profiled calls in progress, and how many times a
+        # second such thread started (to spot records overlapping others)
+        self.lock = threading.Lock()
+        self.active_threads = 0
+        self.overlaps = 0
+
+
+_state = _ProfilerState()
+
+
+class ProfileRecord:
+    """
+    Measurements for a single profiled call or block.
+
+    Attributes:
+        name: Qualified name of the function or block
+        wall_time: Elapsed wall-clock seconds
+        cpu_time: Process CPU seconds used during the call
+        bytes_downloaded: Bytes reported through ``record_bytes``
+        rows_in: Rows of the first DataFrame argument (or ``record_rows``)
+        rows_out: Rows of the returned DataFrame (or ``record_rows``)
+        peak_memory: Peak traced memory in bytes (None if not tracked, or
+            if profiled calls ran on other threads at the same time)
+        started_at: Epoch seconds when the call started
+        error: Exception class name if the call raised
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.bytes_downloaded = 0
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_memory = None
+        self.started_at = time.time()
+        self.error = None
+        # Peak seen before a nested call reset the tracemalloc peak
+        self._peak_seen = 0
+        self._mem_start = 0
+        self._overlaps_at_start = 0
+
+    def as_dict(self) -> Dict:
+        """Return the public measurements as a plain dictionary."""
+        return {
+            'name': self.name,
+            'started_at': self.started_at,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'bytes_downloaded': self.bytes_downloaded,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_memory': self.peak_memory,
+            'error': self.error
+        }
+
+
+# ---
+# Sinks
+# ---
+
+class LoggingSink:
+    """
+    Emit each record as a structured log message.
+
+    Args:
+        log: Logger to write to, defaults to this module's logger
+        level: Logging level for the messages
+    """
+
+    def __init__(self, log: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.log = log or logger
+        self.level = level
+
+    def emit(self, record: ProfileRecord):
+        self.log.log(
+            self.level,
+            'profile %s',
+            record.name,
+            extra={'profile': record.as_dict()}
+        )
+
+
+class JsonFileSink:
+    """
+    Append each record as one JSON object per line.
+
+    Args:
+        path: File to append records to (created if missing)
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def emit(self, record: ProfileRecord):
+        line = json.dumps(record.as_dict())
+        with self._lock:
+            with self.path.open('a') as f:
+                f.write(line + '\n')
+
+
+class SummarySink:
+    """Keep records in memory and summarise them as a table."""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def emit(self, record: ProfileRecord):
+        with self._lock:
+            self.records.append(record.as_dict())
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return every collected record as a DataFrame."""
+        return pd.DataFrame(self.records)
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Aggregate collected records per function/block name.
+
+        Returns:
+            DataFrame indexed by name with call counts, total and mean times,
+            total bytes/rows and the maximum peak memory
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        return (df
+            .groupby('name')
+            .agg(
+                calls=('wall_time', 'size'),
+                wall_total=('wall_time', 'sum'),
+                wall_mean=('wall_time', 'mean'),
+                cpu_total=('cpu_time', 'sum'),
+                bytes_downloaded=('bytes_downloaded', 'sum'),
+                rows_in=('rows_in', 'sum'),
+                rows_out=('rows_out', 'sum'),
+                peak_memory=('peak_memory', 'max')
+            )
+            .sort_values('wall_total', ascending=False)
+        )
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+
+# ---
+# Configuration
+# ---
+
+def enable_profiling(*sinks, track_memory: bool = False):
+    """
+    Turn profiling on and register the sinks that receive records.
+
+    Args:
+        *sinks: Objects with an ``emit(record)`` method; defaults to a LoggingSink
+        track_memory: Whether to trace peak memory with tracemalloc
+            (adds noticeable overhead while enabled)
+    """
+    _state.sinks = list(sinks) or [LoggingSink()]
+    _state.track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.enabled = True
+
+
+def disable_profiling():
+    """Turn profiling off and drop the registered sinks."""
+    _state.enabled = False
+    if _state.track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _state.track_memory = False
+    _state.sinks = []
+
+
+def is_profiling_enabled() -> bool:
+    """Return whether profiling is currently on."""
+    return _state.enabled
+
+
+def _stack() -> List[ProfileRecord]:
+    stack = getattr(_state.local, 'stack', None)
+    if stack is None:
+        stack = _state.local.stack = []
+    return stack
+
+
+def _current() -> Optional[ProfileRecord]:
+    stack = getattr(_state.local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def record_bytes(n_bytes: int):
+    """
+    Add downloaded bytes to the innermost active record.
+
+    Args:
+        n_bytes: Number of bytes received
+    """
+    if not _state.enabled:
+        return
+    record = _current()
+    if record is not None:
+        record.bytes_downloaded += n_bytes
+
+
+def record_rows(rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+    """
+    Set row counts on the innermost active record explicitly.
+
+    Args:
+        rows_in: Number of input rows
+        rows_out: Number of output rows
+    """
+    if not _state.enabled:
+        return
+    record = _current()
+    if record is not None:
+        if rows_in is not None:
+            record.rows_in = rows_in
+        if rows_out is not None:
+            record.rows_out = rows_out
+
+
+def _start(name: str) -> ProfileRecord:
+    record = ProfileRecord(name)
+    stack = _stack()
+    if not stack:
+        with _state.lock:
+            _state.active_threads += 1
+            if _state.active_threads > 1:
+                _state.overlaps += 1
+    # Another thread already running profiled calls counts as an overlap
+    record._overlaps_at_start = _state.overlaps - (_state.active_threads > 1)
+    if _state.track_memory and tracemalloc.is_tracing() and _state.active_threads == 1:
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the parent's peak before resetting it for this call
+        if stack:
+            stack[-1]._peak_seen = max(stack[-1]._peak_seen, peak)
+        tracemalloc.reset_peak()
+        record._mem_start = current
+        record._peak_seen = current
+    stack.append(record)
+    record._wall_start = time.perf_counter()
+    record._cpu_start = time.process_time()
+    return record
+
+
+def _finish(record: ProfileRecord, propagate_bytes: bool = True):
+    record.wall_time = time.perf_counter() - record._wall_start
+    record.cpu_time = time.process_time() - record._cpu_start
+    stack = _stack()
+    stack.pop()
+    # The peak is only meaningful if no other thread ran profiled calls
+    alone = (
+        _state.active_threads == 1
+        and _state.overlaps == record._overlaps_at_start
+    )
+    if _state.track_memory and tracemalloc.is_tracing() and alone:
+        peak = max(record._peak_seen, tracemalloc.get_traced_memory()[1])
+        record.peak_memory = peak - record._mem_start
+        if stack:
+            stack[-1]._peak_seen = max(stack[-1]._peak_seen, peak)
+    if not stack:
+        with _state.lock:
+            _state.active_threads -= 1
+    # Downloads made by nested calls also count towards the caller
+    if propagate_bytes and stack:
+        stack[-1].bytes_downloaded += record.bytes_downloaded
+    for sink in _state.sinks:
+        try:
+            sink.emit(record)
+        except Exception:
+            logger.exception('Profiling sink %r failed', sink)
+
+
+def _n_rows(obj) -> Optional[int]:
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    return None
+
+
+@contextmanager
+def profile_block(name: str):
+    """
+    Profile an arbitrary block of code.
+
+    Args:
+        name: Name under which the block is recorded
+
+    Yields:
+        The active ProfileRecord (None while profiling is disabled)
+    """
+    if not _state.enabled:
+        yield None
+        return
+    record = _start(name)
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        _finish(record)
+
+
+def profiled(func=None, *, name: Optional[str] = None):
+    """
+    Decorator that profiles every call of the wrapped function.
+
+    Rows in are taken from the first DataFrame/Series argument and rows out
+    from a DataFrame/Series return value, unless set with ``record_rows``.
+
+    Args:
+        func: Function to wrap (allows use as ``@profiled`` or ``@profiled(name=...)``)
+        name: Name to record, defaults to the function's qualified name
+    """
+    def decorator(f):
+        record_name = name or f'{f.__module__}.{f.__qualname__}'
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return f(*args, **kwargs)
+            record = _start(record_name)
+            try:
+                for arg in args:
+                    rows = _n_rows(arg)
+                    if rows is not None:
+                        record.rows_in = rows
+                        break
+                result = f(*args, **kwargs)
+                if record.rows_out is None:
+                    record.rows_out = _n_rows(result)
+                return result
+            except BaseException as e:
+                record.error = type(e).__name__
+                raise
+            finally:
+                _finish(record)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
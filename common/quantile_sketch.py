@@ -0,0 +1,215 @@
+"""
+quantile_sketch.py
+
+Mergeable approximate quantile sketch (KLL) for streaming data.
+
+The sketch keeps a bounded number of items regardless of how many values
+are added, can be updated incrementally and merged with sketches built
+elsewhere (e.g. by parallel workers), and answers quantile/rank queries
+from its retained items only.
+
+Error bound: for a sketch with parameter k, the rank returned by a single
+quantile or rank query is within ``normalized_rank_error(k)`` of the exact
+rank with 99% confidence (about 1.3% of n for the default k=200). The
+sketch is exact while it has seen fewer values than its level-0 capacity
+(k values).
+
+Results are reproducible: compaction offsets come from a seeded generator
+(seed 0 unless given), and values are compacted at the same points however
+they are split across update calls, so the same values added in the same
+order always give the same sketch.
+"""
+
+import numpy as np
+from functools import lru_cache
+from typing import Iterable, Tuple, Union
+
+
+@lru_cache(maxsize=None)
+def _level_capacities(k: int, n_levels: int, c: float) -> Tuple[Tuple[int, ...], int]:
+    """Capacity of each level of a sketch with n_levels levels, and their sum."""
+    capacities = tuple(
+        max(int(np.ceil(k * c ** (n_levels - level - 1))), 2)
+        for level in range(n_levels)
+    )
+    return capacities, sum(capacities)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over float values.
+
+    Args:
+        k: Accuracy parameter; larger k is more accurate and uses more memory
+        seed: Seed for the random compaction offsets; a fixed default so
+            identical inputs give identical sketches
+    """
+
+    # Capacity decay between consecutive levels
+    _c = 2 / 3
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        if k < 8:
+            raise ValueError('k must be at least 8')
+        self.k = k
+        self.n = 0
+        # levels[h] holds items of weight 2**h
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._sorted = None
+
+    @staticmethod
+    def normalized_rank_error(k: int = 200) -> float:
+        """
+        Rank error bound (as a fraction of n) of a single query, 99% confidence.
+
+        Args:
+            k: Accuracy parameter of the sketch
+
+        Returns:
+            Maximum expected error in normalized rank
+        """
+        return 2.296 / k ** 0.9723
+
+    def _capacity(self, level: int) -> int:
+        return _level_capacities(self.k, len(self.levels), self._c)[0][level]
+
+    def _size(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+    def _total_capacity(self) -> int:
+        return _level_capacities(self.k, len(self.levels), self._c)[1]
+
+    def _compress(self):
+        """Compact levels, lowest first, until the sketch fits its capacity."""
+        while self._size() > self._total_capacity():
+            for h, items in enumerate(self.levels):
+                if len(items) < self._capacity(h):
+                    continue
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays on this level
+                keep = items[:1] if len(items) % 2 else items[:0]
+                pairs = items[len(keep):]
+                promoted = pairs[self._rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                break
+
+    def update(self, values: Union[float, Iterable[float]]) -> 'KLLSketch':
+        """
+        Add one value or an array of values to the sketch.
+
+        Args:
+            values: Scalar or array-like of values; NaNs are ignored
+
+        Returns:
+            The sketch itself, for chaining
+        """
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self._sorted = None
+        # Add values in pieces that just overflow the capacity, so compaction
+        # happens where it would adding them one by one, whatever the batching
+        start = 0
+        while start < len(values):
+            room = max(self._total_capacity() - self._size(), 0)
+            piece = values[start:start + room + 1]
+            self.levels[0] = np.concatenate([self.levels[0], piece])
+            self.n += len(piece)
+            start += len(piece)
+            self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        """
+        Merge another sketch into this one in place.
+
+        Args:
+            other: Sketch built with the same k
+
+        Returns:
+            The sketch itself, for chaining
+        """
+        if other.k != self.k:
+            raise ValueError('Can only merge sketches with the same k')
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._sorted = None
+        self._compress()
+        return self
+
+    def copy(self) -> 'KLLSketch':
+        """Return an independent copy of the sketch, including its RNG state."""
+        new = KLLSketch(self.k)
+        new.n = self.n
+        new.levels = [items.copy() for items in self.levels]
+        # Same random compaction offsets from here on as the original
+        new._rng.bit_generator.state = self._rng.bit_generator.state
+        return new
+
+    def _sorted_view(self):
+        """Sorted retained items and their cumulative weights (cached)."""
+        if self._sorted is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([
+                np.full(len(level), 2 ** h, dtype=np.int64)
+                for h, level in enumerate(self.levels)
+            ])
+            order = np.argsort(items, kind='stable')
+            self._sorted = (items[order], np.cumsum(weights[order]))
+        return self._sorted
+
+    def quantile(self, q: Union[float, Iterable[float]]):
+        """
+        Approximate quantile(s) of the values seen.
+
+        Args:
+            q: Quantile or array of quantiles in [0, 1]
+
+        Returns:
+            Retained value(s) whose rank is closest to q * n from above
+        """
+        if self.n == 0:
+            raise ValueError('Sketch is empty')
+        items, cum = self._sorted_view()
+        q = np.asarray(q, dtype=float)
+        idx = np.searchsorted(cum, np.clip(q, 0, 1) * cum[-1], side='left')
+        result = items[np.minimum(idx, len(items) - 1)]
+        return result.item() if result.ndim == 0 else result
+
+    def rank(self, value: float, inclusive: bool = True) -> float:
+        """
+        Approximate fraction of values <= value (or < value if not inclusive).
+
+        Args:
+            value: Value to rank
+            inclusive: Whether values equal to value count towards the rank
+
+        Returns:
+            Normalized rank in [0, 1]
+        """
+        if self.n == 0:
+            raise ValueError('Sketch is empty')
+        items, cum = self._sorted_view()
+        side = 'right' if inclusive else 'left'
+        idx = np.searchsorted(items, value, side=side)
+        return float(cum[idx - 1] / cum[-1]) if idx > 0 else 0.0
+
+    def count_at_least(self, value: float) -> float:
+        """Approximate number of values >= value."""
+        if self.n == 0:
+            return 0.0
+        return self.n * (1 - self.rank(value, inclusive=False))
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __repr__(self) -> str:
+        return f'KLLSketch(k={self.k}, n={self.n}, retained={self._size()})'
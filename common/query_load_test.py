@@ -0,0 +1,138 @@
+"""
+query_load_test.py
+
+Concurrent load test for the local query service.
+
+Each worker thread keeps one keep-alive connection and sends requests drawn
+from a list of query paths; per-request latencies are collected and the
+p50/p95/p99 are reported. The exit status is non-zero if the p99 exceeds
+the given budget or any request fails.
+
+Run against a running service:
+    python -m common.query_load_test --url http://127.0.0.1:8765
+or start one in-process on the processed datasets:
+    python -m common.query_load_test --in-process
+"""
+
+import argparse
+import http.client
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from urllib.parse import urlsplit
+
+import numpy as np
+
+DEFAULT_QUERIES = [
+    '/health',
+    '/ferry/patterns?scale=yearly',
+    '/ferry/patterns?scale=monthly&year=2023',
+    '/ferry/patterns?scale=hourly',
+    '/pets/top?species=Dog&n=10',
+    '/pets/top?year=2020&species=Cat&n=5',
+    '/pets/name?name=LUNA',
+    '/neighbourhoods?n=10',
+    '/neighbourhoods?sort=low_income_pct&n=20'
+]
+
+
+def _worker(host: str, port: int, queries: List[str], n_requests: int, seed: int):
+    """Send n_requests on one connection; return latencies and failures."""
+    rng = np.random.default_rng(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    latencies = np.empty(n_requests)
+    failures = 0
+    for i, q in enumerate(rng.integers(len(queries), size=n_requests)):
+        start = time.perf_counter()
+        conn.request('GET', queries[q])
+        response = conn.getresponse()
+        response.read()
+        latencies[i] = time.perf_counter() - start
+        failures += response.status >= 500
+    conn.close()
+    return latencies, failures
+
+
+def run_load_test(
+    url: str,
+    queries: List[str] = DEFAULT_QUERIES,
+    concurrency: int = 16,
+    requests_per_worker: int = 500
+):
+    """
+    Hit the service from concurrent clients and summarise latencies.
+
+    Args:
+        url: Base URL of the service
+        queries: Paths (with query strings) to request at random
+        concurrency: Number of concurrent client connections
+        requests_per_worker: Requests sent by each client
+
+    Returns:
+        Dictionary with request count, failures, throughput and p50/p95/p99
+        latency in milliseconds
+    """
+    parts = urlsplit(url)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(
+            lambda seed: _worker(
+                parts.hostname, parts.port, queries, requests_per_worker, seed
+            ),
+            range(concurrency)
+        ))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.concatenate([r[0] for r in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': len(latencies),
+        'failures': int(sum(r[1] for r in results)),
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the query service.')
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--in-process', action='store_true',
+                        help='Start a service on a free port for the test')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='Requests per concurrent client')
+    parser.add_argument('--p99-budget-ms', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if args.in_process:
+        from common.query_service import DatasetStore, QueryService, make_server
+        server = make_server(QueryService(DatasetStore()), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_port}'
+
+    try:
+        stats = run_load_test(url, concurrency=args.concurrency,
+                              requests_per_worker=args.requests)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    print(
+        f"{stats['requests']} requests, {stats['failures']} failures, "
+        f"{stats['requests_per_s']:.0f} req/s\n"
+        f"p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+        f"p99 {stats['p99_ms']:.2f} ms (budget {args.p99_budget_ms} ms)"
+    )
+    ok = stats['failures'] == 0 and stats['p99_ms'] <= args.p99_budget_ms
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
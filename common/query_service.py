@@ -0,0 +1,366 @@
+"""
+query_service.py
+
+Local read-only HTTP/JSON query service over the processed datasets.
+
+The processed ferry, pet-name and neighbourhood-metric tables are loaded
+once and kept in memory, together with the analyze_ferry_patterns results
+and the service need index. Responses are serialized once and kept in an
+LRU cache keyed by the data version (file modification times and sizes),
+so any change to the underlying CSVs invalidates them on the next request.
+
+Run with:
+    python -m common.query_service --port 8765
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+from common.population_metrics import calculate_service_need_index
+from ferry_tickets.src.ferry_analysis import analyze_ferry_patterns
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_PATHS = {
+    'ferry': REPO_ROOT / 'ferry_tickets/data/processed/ferry_ticket_data.csv',
+    'pets': REPO_ROOT / 'licensed-pets/Licensed_pets.csv',
+    'neighbourhoods': (
+        REPO_ROOT / 'mental-health-services/data/processed/neighbourhood_metrics.csv'
+    )
+}
+
+
+class QueryError(Exception):
+    """Raised by endpoint handlers for bad requests; carries an HTTP status."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU cache of serialized responses.
+
+    Args:
+        max_entries: Number of responses to keep
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DatasetStore:
+    """
+    In-memory copies of the processed tables, reloaded when files change.
+
+    Args:
+        paths: Mapping of table name ('ferry', 'pets', 'neighbourhoods') to
+            CSV path; defaults to the processed files in this repository
+        check_interval: Minimum seconds between file change checks
+    """
+
+    def __init__(
+        self,
+        paths: Optional[Dict[str, Path]] = None,
+        check_interval: float = 1.0
+    ):
+        self.paths = {k: Path(v) for k, v in (paths or DEFAULT_PATHS).items()}
+        self.check_interval = check_interval
+        self.version = None
+        self.tables = {}
+        self.ferry_analyses = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def _file_version(self) -> Tuple:
+        version = []
+        for name, path in sorted(self.paths.items()):
+            if path.exists():
+                stat = path.stat()
+                version.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    def _load(self):
+        tables = {}
+        for name, path in self.paths.items():
+            if path.exists():
+                tables[name] = pd.read_csv(path)
+
+        analyses = {}
+        if 'ferry' in tables:
+            analyses = analyze_ferry_patterns(tables['ferry'].copy())
+        if 'neighbourhoods' in tables:
+            metrics = tables['neighbourhoods']
+            if 'service_need_index' not in metrics.columns:
+                metrics['service_need_index'] = calculate_service_need_index(metrics)
+        return tables, analyses
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the tables if any file changed since the last load.
+
+        Args:
+            force: Reload regardless of the check interval and version
+
+        Returns:
+            Whether the tables were reloaded
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            version = self._file_version()
+            if not force and version == self.version:
+                return False
+            tables, analyses = self._load()
+            # Swap in the new data all at once for concurrent readers
+            self.tables, self.ferry_analyses = tables, analyses
+            self.version = version
+            return True
+
+    def table(self, name: str) -> pd.DataFrame:
+        if name not in self.tables:
+            raise QueryError(f'Table {name} is not loaded', status=404)
+        return self.tables[name]
+
+
+# ---
+# Endpoints
+# ---
+
+def _records(df: pd.DataFrame):
+    return json.loads(df.to_json(orient='records'))
+
+
+def _int_param(params: Dict, name: str, default=None):
+    value = params.get(name, default)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f'{name} must be an integer')
+
+
+def health(store: DatasetStore, params: Dict):
+    return {
+        'version': [list(v) for v in store.version],
+        'tables': {name: len(df) for name, df in store.tables.items()}
+    }
+
+
+def ferry_patterns(store: DatasetStore, params: Dict):
+    """Yearly, monthly or hourly ferry patterns, optionally for one year."""
+    scale = params.get('scale', 'yearly')
+    if scale not in ('yearly', 'monthly', 'hourly'):
+        raise QueryError('scale must be yearly, monthly or hourly')
+    if not store.ferry_analyses:
+        raise QueryError('Table ferry is not loaded', status=404)
+    df = store.ferry_analyses[scale].reset_index()
+    year = _int_param(params, 'year')
+    if year is not None:
+        if 'year' not in df.columns:
+            raise QueryError(f'year cannot be used with scale={scale}')
+        df = df[df['year'] == year]
+    return {'scale': scale, 'data': _records(df)}
+
+
+def pets_top(store: DatasetStore, params: Dict):
+    """Top ranked pet names, filtered by year and species."""
+    df = store.table('pets')
+    year = _int_param(params, 'year')
+    n = _int_param(params, 'n', 10)
+    if year is not None:
+        df = df[df['year'] == year]
+    if 'species' in params:
+        df = df[df['species'].str.lower() == params['species'].lower()]
+    df = df[df['rank'] <= n].sort_values(['year', 'species', 'rank'])
+    return {'data': _records(df)}
+
+
+def pets_name(store: DatasetStore, params: Dict):
+    """Yearly count and rank of one pet name."""
+    if 'name' not in params:
+        raise QueryError('name is required')
+    df = store.table('pets')
+    df = df[df['name'].str.upper() == params['name'].upper()]
+    if 'species' in params:
+        df = df[df['species'].str.lower() == params['species'].lower()]
+    return {'data': _records(df.sort_values(['species', 'year']))}
+
+
+def neighbourhoods(store: DatasetStore, params: Dict):
+    """Neighbourhood metrics sorted by a column (service need by default)."""
+    df = store.table('neighbourhoods')
+    sort = params.get('sort', 'service_need_index')
+    if sort not in df.columns:
+        raise QueryError(f'Unknown column {sort}')
+    min_population = _int_param(params, 'min_population')
+    if min_population is not None:
+        df = df[df['total_population'] >= min_population]
+    ascending = params.get('order', 'desc') == 'asc'
+    df = df.sort_values(sort, ascending=ascending)
+    n = _int_param(params, 'n')
+    if n is not None:
+        df = df.head(n)
+    return {'data': _records(df)}
+
+
+ENDPOINTS: Dict[str, Callable] = {
+    '/health': health,
+    '/ferry/patterns': ferry_patterns,
+    '/pets/top': pets_top,
+    '/pets/name': pets_name,
+    '/neighbourhoods': neighbourhoods
+}
+
+
+class QueryService:
+    """
+    Dispatch queries to endpoints through the response cache.
+
+    Args:
+        store: Loaded datasets
+        cache_size: Number of cached responses
+    """
+
+    def __init__(self, store: DatasetStore, cache_size: int = 1024):
+        self.store = store
+        self.cache = ResponseCache(cache_size)
+
+    def handle(self, path: str, params: Dict) -> Tuple[int, bytes]:
+        """
+        Answer a query.
+
+        Args:
+            path: Endpoint path
+            params: Query string parameters
+
+        Returns:
+            HTTP status code and JSON body
+        """
+        if self.store.refresh():
+            self.cache.clear()
+        key = (self.store.version, path, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        endpoint = ENDPOINTS.get(path)
+        try:
+            if endpoint is None:
+                raise QueryError(f'Unknown endpoint {path}', status=404)
+            response = (200, json.dumps(endpoint(self.store, params)).encode())
+        except QueryError as e:
+            # Errors are not cached, they are cheap and may depend on reloads
+            return e.status, json.dumps({'error': str(e)}).encode()
+        except Exception as e:
+            traceback.print_exc()
+            body = {'error': f'Internal error: {type(e).__name__}: {e}'}
+            return 500, json.dumps(body).encode()
+        self.cache.put(key, response)
+        return response
+
+
+def make_server(
+    service: QueryService,
+    host: str = '127.0.0.1',
+    port: int = 8765
+) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) a threaded HTTP server for a QueryService.
+
+    Args:
+        service: Service answering the queries
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+
+    Returns:
+        Server; call serve_forever() to start it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive connections, so clients do not reconnect per request
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are separate writes; without TCP_NODELAY the
+        # body waits for the client's delayed ACK (~40 ms)
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, body = service.handle(url.path, dict(parse_qsl(url.query)))
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    for name, path in DEFAULT_PATHS.items():
+        parser.add_argument(f'--{name}', default=str(path), help=f'{name} CSV')
+    args = parser.parse_args(argv)
+
+    store = DatasetStore({name: getattr(args, name) for name in DEFAULT_PATHS})
+    server = make_server(QueryService(store), args.host, args.port)
+    print(f'Serving {sorted(store.tables)} on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
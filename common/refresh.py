@@ -0,0 +1,501 @@
+"""
+refresh.py
+
+Headless refresh of the processed datasets, without the notebooks.
+
+Each dataset (ferry ticket counts, Environment Canada weather, licensed pet
+names, neighbourhood profile metrics) is a job doing what its collection
+notebook does: fetch with TorontoOpenDataAPI or download_weather_data,
+process, and write the processed file. Independent jobs run concurrently
+under CPU, memory and connection budgets; every job declares what it needs
+and starts only once that fits in what the running jobs leave free. Each
+job sends its requests through its own session whose connection pool is
+capped at the connections it was granted. A per-job timing summary is
+printed at the end, and the exit status is 0 when every job succeeded and
+1 otherwise.
+
+Jobs run on threads of one process, so the CPU budget is a concurrency cap
+(how many CPU-heavy jobs may run at once), not a reservation of cores: the
+jobs mostly wait on the network, and their pandas work releases the GIL
+only in part.
+
+With --fake-portal the outputs go to a new temporary directory unless
+--output-root is given, so sample data never overwrites the real files.
+
+Run with:
+    python -m common.refresh                      # all datasets
+    python -m common.refresh ferry pets --max-connections 2
+    python -m common.refresh --fake-portal        # into a temporary directory
+    python -m common.refresh_check                # end-to-end offline check
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.data_processors import FerryDataProcessor, PetNamesProcessor
+from common.population_metrics import (
+    calculate_service_need_index, extract_population_metrics
+)
+from common.profiling import (
+    SummarySink, disable_profiling, enable_profiling, is_profiling_enabled,
+    profile_block
+)
+from common.toronto_api import TorontoOpenDataAPI
+from common.weather_data import download_weather_data
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+PORTAL_URL = 'https://ckan0.cf.opendata.inter.prod-toronto.ca'
+WEATHER_URL = 'https://climate.weather.gc.ca/climate_data/bulk_data_e.html'
+
+# Outputs relative to the output root, as written by the notebooks
+OUTPUTS = {
+    'ferry': 'ferry_tickets/data/processed/ferry_ticket_data.csv',
+    'weather': 'ferry_tickets/data/weather',
+    'pets': 'licensed-pets/Licensed_pets.csv',
+    'neighbourhoods': 'mental-health-services/data/processed/neighbourhood_metrics.csv'
+}
+
+
+class RefreshSettings:
+    """
+    Where to fetch from and write to.
+
+    Args:
+        output_root: Directory the OUTPUTS paths are relative to
+        base_url: Root URL of the CKAN portal
+        weather_url: URL of the Environment Canada bulk data endpoint
+        weather_station: Weather station ID
+        weather_start: (year, month) of the first weather month
+        weather_end: (year, month) of the last weather month; defaults to
+            the current month
+        request_delay: Seconds between weather requests
+    """
+
+    def __init__(
+        self,
+        output_root: Path = REPO_ROOT,
+        base_url: str = PORTAL_URL,
+        weather_url: str = WEATHER_URL,
+        weather_station: int = 48549,
+        weather_start: tuple = (2015, 5),
+        weather_end: Optional[tuple] = None,
+        request_delay: float = 0.5
+    ):
+        today = datetime.now()
+        self.output_root = Path(output_root)
+        self.base_url = base_url
+        self.weather_url = weather_url
+        self.weather_station = weather_station
+        self.weather_start = weather_start
+        self.weather_end = weather_end or (today.year, today.month)
+        self.request_delay = request_delay
+
+    def output(self, job_name: str) -> Path:
+        return self.output_root / OUTPUTS[job_name]
+
+
+def _write_csv(df: pd.DataFrame, path: Path):
+    """Write a CSV next to its destination, then swap it in atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        'w', dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp',
+        delete=False, newline=''
+    ) as tmp:
+        df.to_csv(tmp, header=True, index=False)
+    os.replace(tmp.name, path)
+
+
+def capped_session(max_connections: int) -> requests.Session:
+    """
+    Session that never opens more than max_connections sockets per host.
+
+    Requests beyond the cap wait for a pooled connection to be released
+    instead of opening a new one.
+
+    Args:
+        max_connections: Connection pool size per host
+
+    Returns:
+        requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=max(int(max_connections), 1), pool_block=True
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# ---
+# Jobs
+# ---
+
+def refresh_ferry(settings: RefreshSettings, session: requests.Session) -> int:
+    """Ferry ticket counts, as in ferry_tickets/notebooks/01_data_collection."""
+    api = TorontoOpenDataAPI(
+        'toronto-island-ferry-ticket-counts', base_url=settings.base_url,
+        session=session
+    )
+    df = FerryDataProcessor.process_resource(api.get_resource_data())
+    _write_csv(df, settings.output('ferry'))
+    return len(df)
+
+
+def refresh_weather(settings: RefreshSettings, session: requests.Session) -> int:
+    """Hourly weather files, as in ferry_tickets/notebooks/03_weather."""
+    (start_year, start_month), (end_year, end_month) = (
+        settings.weather_start, settings.weather_end
+    )
+    failed = download_weather_data(
+        station_id=settings.weather_station,
+        start_year=start_year,
+        start_month=start_month,
+        end_year=end_year,
+        end_month=end_month,
+        output_dir=str(settings.output('weather')),
+        base_url=settings.weather_url,
+        request_delay=settings.request_delay,
+        session=session
+    )
+    if failed:
+        months = ', '.join(f'{y}-{m:02d}' for y, m in failed)
+        raise RuntimeError(f'{len(failed)} weather months failed: {months}')
+    n_months = (end_year - start_year) * 12 + end_month - start_month + 1
+    return n_months
+
+
+def refresh_pets(settings: RefreshSettings, session: requests.Session) -> int:
+    """Licensed pet name ranks, as in licensed-pets/api_call_licensed_pets."""
+    api = TorontoOpenDataAPI(
+        'licensed-dog-and-cat-names', base_url=settings.base_url, session=session
+    )
+    processor = PetNamesProcessor()
+    frames = []
+    for resource in api.package_metadata['resources']:
+        # The yearly name lists are files, not datastore tables
+        if resource['datastore_active']:
+            continue
+        df = api.get_resource_data(resource['position'], header=None)
+        frames.append(processor.process_resource(df, resource))
+    if not frames:
+        raise RuntimeError('No pet name resources found')
+    df = processor.post_process(pd.concat(frames, ignore_index=True))
+    _write_csv(df, settings.output('pets'))
+    return len(df)
+
+
+def refresh_neighbourhoods(settings: RefreshSettings, session: requests.Session) -> int:
+    """Neighbourhood metrics, as in mental-health-services/notebooks/01_data_collection."""
+    resource_name = 'neighbourhood-profiles-2021-158-model'
+    api = TorontoOpenDataAPI(
+        'neighbourhood-profiles', base_url=settings.base_url, session=session
+    )
+    resource = next(
+        (r for r in api.package_metadata['resources'] if r['name'] == resource_name),
+        None
+    )
+    if resource is None:
+        raise RuntimeError(f'Resource {resource_name} not found')
+    pop_metrics = extract_population_metrics(
+        api.get_resource_data(resource['position'])
+    )
+    pop_metrics['service_need_index'] = calculate_service_need_index(pop_metrics)
+    # For tableau join
+    pop_metrics['Area Long Code'] = pop_metrics['neighbourhood_number'].apply(
+        lambda x: f'{x:03}'
+    )
+    _write_csv(pop_metrics, settings.output('neighbourhoods'))
+    return len(pop_metrics)
+
+
+# ---
+# Scheduling
+# ---
+
+class Job:
+    """
+    A refresh job and the resources it needs while running.
+
+    Args:
+        name: Job name
+        func: Callable taking RefreshSettings and the session to send its
+            requests through, returning the number of units written
+        unit: What func counts ('rows' or 'files')
+        cpus: CPUs the job keeps busy, counted against the scheduler's
+            CPU concurrency cap
+        memory_mb: Estimated peak memory in MB
+        connections: Concurrent connections the job may open; its session's
+            connection pool is capped at this
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[RefreshSettings, requests.Session], int],
+        unit: str = 'rows',
+        cpus: float = 1,
+        memory_mb: float = 256,
+        connections: int = 1
+    ):
+        self.name = name
+        self.func = func
+        self.unit = unit
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.connections = connections
+
+
+JOBS = {
+    'ferry': Job('ferry', refresh_ferry, cpus=1, memory_mb=1024),
+    'weather': Job('weather', refresh_weather, unit='files', cpus=0.25, memory_mb=64),
+    'pets': Job('pets', refresh_pets, cpus=1, memory_mb=256),
+    'neighbourhoods': Job('neighbourhoods', refresh_neighbourhoods, cpus=1, memory_mb=512)
+}
+
+
+class JobResult:
+    """
+    Outcome and timings of one job.
+
+    Attributes:
+        name: Job name
+        status: 'ok' or 'failed'
+        queued_s: Seconds spent waiting for resources
+        wall_s: Seconds spent running
+        cpu_s: CPU seconds of the job's thread
+        written: Value returned by the job
+        unit: What written counts ('rows' or 'files')
+        bytes_downloaded: Bytes of all responses the job downloaded (when
+            profiling is enabled)
+        error: Error message of a failed job
+    """
+
+    def __init__(self, name: str, unit: str = 'rows'):
+        self.name = name
+        self.status = 'failed'
+        self.queued_s = 0.0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.written = None
+        self.unit = unit
+        self.bytes_downloaded = None
+        self.error = None
+
+    def as_dict(self) -> Dict:
+        return dict(self.__dict__)
+
+
+class JobScheduler:
+    """
+    Run jobs on threads, admitting each one only while it fits the budgets.
+
+    A job needing more than a whole budget is clamped to it, so it runs
+    alone instead of never starting. Jobs are admitted in the order given
+    when possible; a smaller job may start ahead of a larger one waiting
+    for resources. All jobs share one process, so max_cpus limits how much
+    CPU-heavy work is admitted at once rather than pinning jobs to cores.
+
+    Args:
+        max_cpus: Concurrency cap on the summed cpus of running jobs;
+            defaults to the number of CPUs
+        max_memory_mb: Memory budget in MB; unlimited by default
+        max_connections: Concurrent network connection budget
+    """
+
+    def __init__(
+        self,
+        max_cpus: Optional[float] = None,
+        max_memory_mb: Optional[float] = None,
+        max_connections: int = 4
+    ):
+        self.budget = {
+            'cpus': max_cpus or os.cpu_count() or 1,
+            'memory_mb': max_memory_mb if max_memory_mb else float('inf'),
+            'connections': max_connections
+        }
+        self._in_use = dict.fromkeys(self.budget, 0)
+        self._condition = threading.Condition()
+
+    def _needs(self, job: Job) -> Dict:
+        return {
+            resource: min(getattr(job, resource), limit)
+            for resource, limit in self.budget.items()
+        }
+
+    def _fits(self, needs: Dict) -> bool:
+        return all(
+            self._in_use[r] + needs[r] <= self.budget[r] for r in self.budget
+        )
+
+    def _run_job(self, job: Job, settings: RefreshSettings) -> JobResult:
+        result = JobResult(job.name, job.unit)
+        needs = self._needs(job)
+        queued = time.perf_counter()
+        with self._condition:
+            self._condition.wait_for(lambda: self._fits(needs))
+            for r in needs:
+                self._in_use[r] += needs[r]
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        result.queued_s = start - queued
+        session = capped_session(needs['connections'])
+        try:
+            with profile_block(f'refresh.{job.name}') as record:
+                try:
+                    result.written = job.func(settings, session)
+                    result.status = 'ok'
+                except Exception as e:
+                    result.error = f'{type(e).__name__}: {e}'
+                if record is not None:
+                    result.bytes_downloaded = record.bytes_downloaded
+        finally:
+            session.close()
+            result.wall_s = time.perf_counter() - start
+            result.cpu_s = time.thread_time() - cpu_start
+            with self._condition:
+                for r in needs:
+                    self._in_use[r] -= needs[r]
+                self._condition.notify_all()
+        return result
+
+    def run(self, jobs: List[Job], settings: RefreshSettings) -> List[JobResult]:
+        """
+        Run jobs concurrently within the budgets.
+
+        Args:
+            jobs: Jobs to run
+            settings: Settings passed to every job
+
+        Returns:
+            Results in the order of jobs; a failing job does not stop the others
+        """
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(len(jobs), thread_name_prefix='refresh') as pool:
+            futures = [pool.submit(self._run_job, job, settings) for job in jobs]
+            return [future.result() for future in futures]
+
+
+def summarize(results: List[JobResult], elapsed: float) -> str:
+    """
+    Per-job timing table, errors of failed jobs and a total line.
+
+    Args:
+        results: Results of JobScheduler.run
+        elapsed: Wall-clock seconds of the whole run
+
+    Returns:
+        Text summary
+    """
+    df = pd.DataFrame([r.as_dict() for r in results]).set_index('name')
+    df['written'] = df['written'].astype('Int64')
+    df['MB'] = df['bytes_downloaded'].astype(float) / 1e6
+    table = df[['status', 'queued_s', 'wall_s', 'cpu_s', 'written', 'unit', 'MB']]
+    lines = [table.to_string(float_format=lambda x: f'{x:.2f}', na_rep='-')]
+    lines += [f'{name}: {error}' for name, error in df['error'].dropna().items()]
+    n_ok = int((df['status'] == 'ok').sum())
+    lines.append(
+        f'{n_ok}/{len(df)} jobs ok in {elapsed:.2f} s'
+        f' (sum of job times {df["wall_s"].sum():.2f} s)'
+    )
+    return '\n'.join(lines)
+
+
+def _year_month(value: str) -> tuple:
+    try:
+        year, month = value.split('-')
+        return int(year), int(month)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected YYYY-MM, got {value}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('jobs', nargs='*', metavar='job',
+                        help=f'Datasets to refresh: {", ".join(JOBS)} (default: all)')
+    parser.add_argument('--output-root', default=None,
+                        help='Directory the processed files are written under '
+                             '(default: the repository, or a new temporary '
+                             'directory with --fake-portal)')
+    parser.add_argument('--base-url', default=PORTAL_URL, help='CKAN portal URL')
+    parser.add_argument('--weather-url', default=WEATHER_URL,
+                        help='Environment Canada bulk data URL')
+    parser.add_argument('--fake-portal', action='store_true',
+                        help='Fetch from a local fake portal with sample data (offline)')
+    parser.add_argument('--fake-failing', action='append', default=[], metavar='PACKAGE',
+                        help='Package the fake portal answers with errors (repeatable)')
+    parser.add_argument('--weather-station', type=int, default=48549)
+    parser.add_argument('--weather-start', type=_year_month, default=(2015, 5),
+                        help='First weather month, YYYY-MM')
+    parser.add_argument('--weather-end', type=_year_month, default=None,
+                        help='Last weather month, YYYY-MM (default: this month)')
+    parser.add_argument('--request-delay', type=float, default=0.5,
+                        help='Seconds between weather requests')
+    parser.add_argument('--max-cpus', type=float, default=None,
+                        help='Cap on the summed CPUs of concurrently running jobs '
+                             '(default: number of CPUs)')
+    parser.add_argument('--max-memory-mb', type=float, default=None)
+    parser.add_argument('--max-connections', type=int, default=4)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.jobs if name not in JOBS]
+    if unknown:
+        parser.error(f'unknown jobs: {", ".join(unknown)}')
+
+    portal = None
+    output_root = args.output_root
+    if args.fake_portal:
+        from common.fake_ckan import FakeCKANServer
+        portal = FakeCKANServer(failing=args.fake_failing).start()
+        args.base_url, args.weather_url = portal.base_url, portal.weather_url
+        # Never let sample data overwrite the real outputs by default
+        if output_root is None:
+            output_root = tempfile.mkdtemp(prefix='refresh-')
+    if output_root is None:
+        output_root = REPO_ROOT
+
+    settings = RefreshSettings(
+        output_root=Path(output_root),
+        base_url=args.base_url,
+        weather_url=args.weather_url,
+        weather_station=args.weather_station,
+        weather_start=args.weather_start,
+        weather_end=args.weather_end,
+        request_delay=0 if args.fake_portal else args.request_delay
+    )
+    scheduler = JobScheduler(args.max_cpus, args.max_memory_mb, args.max_connections)
+    jobs = [JOBS[name] for name in (args.jobs or JOBS)]
+
+    # Profiling supplies the downloaded bytes of each job
+    own_profiling = not is_profiling_enabled()
+    if own_profiling:
+        enable_profiling(SummarySink())
+    start = time.perf_counter()
+    try:
+        results = scheduler.run(jobs, settings)
+    finally:
+        if own_profiling:
+            disable_profiling()
+        if portal is not None:
+            portal.stop()
+
+    print(summarize(results, time.perf_counter() - start))
+    print(f'Outputs under {settings.output_root}')
+    return 0 if all(r.status == 'ok' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+refresh_check.py
+
+End-to-end check of the headless refresh against the fake portal.
+
+Runs `refresh --fake-portal` into a temporary directory with one package
+answering errors, and checks that the failing job (and only it) is
+reported as failed, the exit status is 1, the other jobs wrote their
+outputs, and downloads were counted. The exit status is non-zero if any
+check fails.
+
+Run with:
+    python -m common.refresh_check
+"""
+
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from common import refresh
+
+FAILING_JOB = 'pets'
+FAILING_PACKAGE = 'licensed-dog-and-cat-names'
+
+
+def _summary_row(summary: str, name: str) -> list:
+    """Fields of a job's row in the summary table (['-'] if it is missing)."""
+    line = next(
+        (l for l in summary.splitlines() if l.startswith(name + ' ')), '-'
+    )
+    return line.split()
+
+
+def run_check(output_root: Path) -> list:
+    """
+    Run the refresh on the fake portal and check its results.
+
+    Args:
+        output_root: Empty directory to write the outputs under
+
+    Returns:
+        Descriptions of the failed checks (empty if all passed)
+    """
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        status = refresh.main([
+            '--fake-portal',
+            '--fake-failing', FAILING_PACKAGE,
+            '--output-root', str(output_root),
+            '--weather-start', '2023-01',
+            '--weather-end', '2023-03',
+            '--max-connections', '2'
+        ])
+    summary = stdout.getvalue()
+    print(summary)
+
+    problems = []
+    if status != 1:
+        problems.append(f'exit status {status}, expected 1')
+
+    for name in refresh.JOBS:
+        expected = 'failed' if name == FAILING_JOB else 'ok'
+        if expected not in _summary_row(summary, name):
+            problems.append(f'{name} not reported as {expected}')
+
+    settings = refresh.RefreshSettings(output_root=output_root)
+    if settings.output(FAILING_JOB).exists():
+        problems.append(f'{FAILING_JOB} output written despite the failure')
+    for name in ('ferry', 'neighbourhoods'):
+        path = settings.output(name)
+        if not path.exists() or pd.read_csv(path).empty:
+            problems.append(f'{name} output missing or empty')
+        elif _summary_row(summary, name)[-1] in ('0.00', '-'):
+            problems.append(f'{name} downloaded bytes not counted')
+    n_weather = len(list(settings.output('weather').glob('*.csv')))
+    if n_weather != 3:
+        problems.append(f'{n_weather} weather files written, expected 3')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the refresh end to end offline.')
+    parser.add_argument('--output-root', default=None,
+                        help='Directory to write to (default: a temporary one)')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        problems = run_check(Path(args.output_root or tmp))
+    for problem in problems:
+        print(f'FAILED: {problem}')
+    print('refresh check ' + ('failed' if problems else 'passed'))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,366 @@
+"""
+snapshot_store.py
+
+Versioned, deduplicated storage of raw portal downloads.
+
+Every raw resource download is split into content-defined chunks with a
+gear rolling hash: chunk boundaries depend on the bytes around them, not on
+their offsets, so appending rows to a dataset only changes the chunks near
+the end. Chunks are stored once under their SHA-256 (zlib-compressed) and
+each version is a small JSON manifest listing its chunks, so a new snapshot
+of a mostly-appended dataset costs roughly the new bytes only. Any version
+can be reassembled by date.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from bisect import bisect_right
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Fixed random table mapping each byte value to a 64-bit gear value
+_GEAR = np.random.default_rng(0x6EA5).integers(
+    0, np.iinfo(np.uint64).max, size=256, dtype=np.uint64, endpoint=True
+)
+
+_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+# Bytes covered by the gear hash, and bytes hashed per vectorized pass
+_WINDOW = 64
+_BLOCK_SIZE = 1 << 20
+
+
+def _gear_hash(data: np.ndarray) -> np.ndarray:
+    """
+    Gear hash over the last 64 bytes at every position.
+
+    h[i] = sum(GEAR[data[i - j]] << j for j in 0..63) mod 2**64, built by
+    doubling the window (1, 2, 4, ..., 64 bytes) in six vectorized passes.
+    """
+    h = _GEAR[data]
+    width = 1
+    while width < _WINDOW:
+        shifted = np.zeros_like(h)
+        shifted[width:] = h[:-width] << np.uint64(width)
+        h = h + shifted
+        width *= 2
+    return h
+
+
+def _cut_candidates(data: np.ndarray, mask: np.uint64) -> np.ndarray:
+    """
+    Offsets just after every position whose gear hash has the mask bits clear.
+
+    Hashes block by block, each block prefixed with the previous 63 bytes so
+    its hashes see full windows, which keeps memory bounded by the block
+    size (8 bytes of hash per byte) instead of the data size.
+    """
+    found = []
+    for start in range(0, len(data), _BLOCK_SIZE):
+        lead = min(start, _WINDOW - 1)
+        h = _gear_hash(data[start - lead:start + _BLOCK_SIZE])[lead:]
+        found.append(np.flatnonzero((h & mask) == 0) + start + 1)
+    return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+
+def chunk_boundaries(
+    data: bytes,
+    avg_size: int = 64 * 1024,
+    min_size: int = 16 * 1024,
+    max_size: int = 256 * 1024
+) -> List[int]:
+    """
+    Content-defined chunk end offsets for a byte string.
+
+    Args:
+        data: Bytes to split
+        avg_size: Target average chunk size (rounded to a power of two)
+        min_size: Smallest chunk, except for the last one
+        max_size: Largest chunk
+
+    Returns:
+        Sorted end offsets of the chunks (the last one is len(data))
+    """
+    if not data:
+        return []
+    bits = max(int(round(np.log2(avg_size))), 1)
+    # Test the high bits, which depend on the whole 64-byte window
+    mask = np.uint64(((1 << bits) - 1) << (64 - bits))
+    candidates = _cut_candidates(np.frombuffer(data, dtype=np.uint8), mask)
+
+    ends = []
+    last = 0
+    for cut in candidates:
+        if cut - last < min_size:
+            continue
+        while cut - last > max_size:
+            last += max_size
+            ends.append(last)
+        ends.append(int(cut))
+        last = int(cut)
+    while len(data) - last > max_size:
+        last += max_size
+        ends.append(last)
+    if last < len(data):
+        ends.append(len(data))
+    return ends
+
+
+class SnapshotStore:
+    """
+    Deduplicated, versioned store of raw resource downloads.
+
+    Layout under root:
+        chunks/<first 2 hex chars>/<sha256>  zlib-compressed chunk bytes
+        manifests/<package>/<resource id>/<fetched at>.json
+
+    Args:
+        root: Directory of the store (created if missing)
+        avg_chunk_size: Target average chunk size in bytes
+        min_chunk_size: Minimum chunk size in bytes
+        max_chunk_size: Maximum chunk size in bytes
+    """
+
+    def __init__(
+        self,
+        root: str,
+        avg_chunk_size: int = 64 * 1024,
+        min_chunk_size: int = 16 * 1024,
+        max_chunk_size: int = 256 * 1024
+    ):
+        self.root = Path(root)
+        self.avg_chunk_size = avg_chunk_size
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        (self.root / 'chunks').mkdir(parents=True, exist_ok=True)
+        (self.root / 'manifests').mkdir(parents=True, exist_ok=True)
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.root / 'chunks' / digest[:2] / digest
+
+    def _manifest_dir(self, package: str, resource_id: str) -> Path:
+        return self.root / 'manifests' / package / resource_id
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temporary name, so concurrent writers never share one
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp', delete=False
+        ) as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, path)
+
+    def _manifest_paths(self, package: str, resource_id: str) -> List[Path]:
+        directory = self._manifest_dir(package, resource_id)
+        if not directory.exists():
+            return []
+        return sorted(directory.glob('*.json'))
+
+    @staticmethod
+    def _until(paths: List[Path], as_of) -> List[Path]:
+        """Manifest paths fetched at or before as_of (all if None)."""
+        if as_of is None:
+            return paths
+        as_of = pd.Timestamp(as_of)
+        if as_of == as_of.normalize():
+            # A plain date includes everything fetched that day
+            as_of = as_of + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        stamps = [p.stem for p in paths]
+        return paths[:bisect_right(stamps, as_of.strftime(_TIME_FORMAT))]
+
+    def put(
+        self,
+        package: str,
+        resource: Dict,
+        data: bytes,
+        fetched_at: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Store a raw download as a new version of a resource.
+
+        A download identical to the latest stored version is not stored
+        again; the latest manifest is returned instead.
+
+        Args:
+            package: Package (dataset) name
+            resource: Resource metadata with at least 'id' (and ideally
+                'name' and 'format')
+            data: Raw bytes as downloaded
+            fetched_at: Time of the download, defaults to now
+
+        Returns:
+            Manifest of the stored version, including new_bytes (compressed
+            bytes actually added to the store)
+        """
+        fetched_at = fetched_at or datetime.now()
+        digest = hashlib.sha256(data).hexdigest()
+        paths = self._manifest_paths(package, resource['id'])
+        if paths:
+            latest = json.loads(paths[-1].read_text())
+            if latest['sha256'] == digest:
+                return latest
+
+        chunks = []
+        new_bytes = 0
+        start = 0
+        for end in chunk_boundaries(
+            data, self.avg_chunk_size, self.min_chunk_size, self.max_chunk_size
+        ):
+            piece = data[start:end]
+            chunk_digest = hashlib.sha256(piece).hexdigest()
+            path = self._chunk_path(chunk_digest)
+            if not path.exists():
+                compressed = zlib.compress(piece)
+                self._write_atomic(path, compressed)
+                new_bytes += len(compressed)
+            chunks.append(chunk_digest)
+            start = end
+
+        manifest = {
+            'package': package,
+            'resource_id': resource['id'],
+            'resource_name': resource.get('name'),
+            'position': resource.get('position'),
+            'format': resource.get('format'),
+            'datastore_active': resource.get('datastore_active', False),
+            'fetched_at': fetched_at.isoformat(),
+            'size': len(data),
+            'sha256': digest,
+            'new_bytes': new_bytes,
+            'chunks': chunks
+        }
+        name = f"{fetched_at.strftime(_TIME_FORMAT)}.json"
+        self._write_atomic(
+            self._manifest_dir(package, resource['id']) / name,
+            json.dumps(manifest).encode()
+        )
+        return manifest
+
+    def versions(self, package: str, resource_id: str) -> pd.DataFrame:
+        """
+        List the stored versions of a resource.
+
+        Args:
+            package: Package (dataset) name
+            resource_id: Resource id
+
+        Returns:
+            DataFrame with fetched_at, size, sha256, new_bytes and n_chunks
+        """
+        rows = []
+        for path in self._manifest_paths(package, resource_id):
+            manifest = json.loads(path.read_text())
+            rows.append({
+                'fetched_at': pd.Timestamp(manifest['fetched_at']),
+                'size': manifest['size'],
+                'sha256': manifest['sha256'],
+                'new_bytes': manifest['new_bytes'],
+                'n_chunks': len(manifest['chunks'])
+            })
+        return pd.DataFrame(rows)
+
+    def get(
+        self,
+        package: str,
+        resource_id: str,
+        as_of: Optional[datetime] = None
+    ) -> Tuple[bytes, Dict]:
+        """
+        Reassemble the version of a resource current at a given time.
+
+        Args:
+            package: Package (dataset) name
+            resource_id: Resource id
+            as_of: Date/time to load the version for (latest version fetched
+                at or before it); defaults to the latest version
+
+        Returns:
+            Raw bytes and the manifest of that version
+        """
+        paths = self._until(self._manifest_paths(package, resource_id), as_of)
+        if not paths:
+            raise KeyError(
+                f"No snapshot of {package}/{resource_id}"
+                + (f" on or before {as_of}" if as_of is not None else "")
+            )
+
+        manifest = json.loads(paths[-1].read_text())
+        data = b''.join(
+            zlib.decompress(self._chunk_path(digest).read_bytes())
+            for digest in manifest['chunks']
+        )
+        if hashlib.sha256(data).hexdigest() != manifest['sha256']:
+            raise ValueError(f"Corrupt snapshot {paths[-1]}")
+        return data, manifest
+
+    def find(
+        self,
+        package: str,
+        position: Optional[int] = None,
+        name: Optional[str] = None,
+        as_of: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Find a stored resource of a package without asking the portal.
+
+        Each resource is matched on the position and name recorded in its
+        latest manifest at as_of, so resources that have since been moved
+        or removed from the package are still found. If several resources
+        match, the most recently fetched one wins.
+
+        Args:
+            package: Package (dataset) name
+            position: Position of the resource within the package
+            name: Name of the resource
+            as_of: Date/time the resource was current at; defaults to now
+
+        Returns:
+            Manifest of the matching resource's version current at as_of
+        """
+        directory = self.root / 'manifests' / package
+        found = []
+        if directory.exists():
+            for resource_dir in directory.iterdir():
+                paths = self._until(sorted(resource_dir.glob('*.json')), as_of)
+                if not paths:
+                    continue
+                manifest = json.loads(paths[-1].read_text())
+                if position is not None and manifest.get('position') != position:
+                    continue
+                if name is not None and manifest.get('resource_name') != name:
+                    continue
+                found.append(manifest)
+        if not found:
+            raise KeyError(
+                f"No snapshot of {package} resource "
+                f"{position if name is None else name!r}"
+                + (f" on or before {as_of}" if as_of is not None else "")
+            )
+        return max(found, key=lambda m: m['fetched_at'])
+
+    def stats(self) -> Dict:
+        """
+        Logical versus stored size of the whole store.
+
+        Returns:
+            Dictionary with number of versions, total bytes of all versions
+            and bytes actually stored for chunks
+        """
+        manifests = [
+            json.loads(p.read_text())
+            for p in (self.root / 'manifests').glob('*/*/*.json')
+        ]
+        stored = sum(p.stat().st_size for p in (self.root / 'chunks').glob('*/*'))
+        return {
+            'versions': len(manifests),
+            'logical_bytes': sum(m['size'] for m in manifests),
+            'stored_bytes': stored
+        }
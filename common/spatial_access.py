@@ -0,0 +1,274 @@
+"""
+spatial_access.py
+
+Distance-based accessibility of services for neighbourhoods.
+
+Service locations are indexed in a KD-tree built on 3D unit-sphere
+coordinates. The straight-line (chord) distance between two points on the
+sphere grows monotonically with their great-circle distance, so nearest
+neighbour and radius queries on the tree are exact for haversine
+distances once converted back. Queries are batched over all points, so
+thousands of neighbourhood centroids or grid points resolve in one call.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from common.profiling import profiled
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _unit_xyz(longitude, latitude):
+    """Convert degrees to (n x 3) coordinates on the unit sphere."""
+    lon = np.radians(np.asarray(longitude, dtype=float))
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    # Infinite coordinates give NaN rows, like missing ones
+    with np.errstate(invalid='ignore'):
+        return np.column_stack([
+            np.cos(lat) * np.cos(lon),
+            np.cos(lat) * np.sin(lon),
+            np.sin(lat)
+        ])
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def _km_to_chord(km):
+    return 2 * np.sin(np.asarray(km, dtype=float) / (2 * EARTH_RADIUS_KM))
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance in kilometres between points given in degrees.
+
+    Parameters:
+    lon1, lat1, lon2, lat2 (float or array-like): Coordinates in degrees
+
+    Returns:
+    numpy.ndarray: Distances in km
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def extract_service_coordinates(df, geometry_col='geometry'):
+    """
+    Add longitude and latitude columns parsed from GeoJSON point strings.
+
+    Parameters:
+    df (pd.DataFrame): Services with a geometry column such as
+        '{"type": "Point", "coordinates": [-79.4, 43.7]}'
+    geometry_col (str): Name of the geometry column
+
+    Returns:
+    pd.DataFrame: Copy of df with float longitude and latitude columns
+    """
+    df = df.copy()
+    coords = df[geometry_col].astype(str).str.extract(
+        r'coordinates"?\s*:\s*\[\s*([-+\d.eE]+)\s*,\s*([-+\d.eE]+)'
+    )
+    df['longitude'] = pd.to_numeric(coords[0], errors='coerce')
+    df['latitude'] = pd.to_numeric(coords[1], errors='coerce')
+    return df
+
+
+def _ring_centroid(ring):
+    """Area and centroid of a polygon ring (planar, in degrees)."""
+    ring = np.asarray(ring, dtype=float)[:, :2]
+    x, y = ring[:, 0], ring[:, 1]
+    x1, y1 = np.roll(x, -1), np.roll(y, -1)
+    cross = x * y1 - x1 * y
+    area = cross.sum() / 2
+    if area == 0:
+        return 0.0, x.mean(), y.mean()
+    cx = ((x + x1) * cross).sum() / (6 * area)
+    cy = ((y + y1) * cross).sum() / (6 * area)
+    return abs(area), cx, cy
+
+
+def neighbourhood_centroids(geojson_obj, id_property='AREA_LONG_CODE'):
+    """
+    Area-weighted centroids of neighbourhood polygons.
+
+    Parameters:
+    geojson_obj (dict): FeatureCollection of Polygon/MultiPolygon features,
+        e.g. the city's 'Neighbourhoods - 4326.geojson'
+    id_property (str): Feature property identifying each neighbourhood
+
+    Returns:
+    pd.DataFrame: One row per feature with the id, longitude and latitude
+    """
+    rows = []
+    for feature in geojson_obj['features']:
+        geometry = feature['geometry']
+        polygons = (
+            [geometry['coordinates']] if geometry['type'] == 'Polygon'
+            else geometry['coordinates']
+        )
+        # Exterior rings only; holes are negligible for a centroid
+        parts = np.array([_ring_centroid(polygon[0]) for polygon in polygons])
+        weights = parts[:, 0] if parts[:, 0].sum() > 0 else None
+        rows.append({
+            id_property: feature['properties'].get(id_property),
+            'longitude': np.average(parts[:, 1], weights=weights),
+            'latitude': np.average(parts[:, 2], weights=weights)
+        })
+    return pd.DataFrame(rows)
+
+
+class ServiceLocator:
+    """
+    Spatial index of service locations for batched distance queries.
+
+    Parameters:
+    longitude (array-like): Service longitudes in degrees
+    latitude (array-like): Service latitudes in degrees
+    """
+
+    def __init__(self, longitude, latitude):
+        xyz = _unit_xyz(longitude, latitude)
+        self.valid = np.isfinite(xyz).all(axis=1)
+        # Positions of the indexed services within the original arrays
+        self.positions = np.flatnonzero(self.valid)
+        self.tree = cKDTree(xyz[self.valid])
+
+    @classmethod
+    def from_frame(cls, df, lon_col='longitude', lat_col='latitude'):
+        """Build an index from a DataFrame with coordinate columns."""
+        return cls(df[lon_col].to_numpy(), df[lat_col].to_numpy())
+
+    def __len__(self):
+        return self.tree.n
+
+    @staticmethod
+    def _query_points(longitude, latitude):
+        """Unit-sphere coordinates of query points and which are finite."""
+        xyz = _unit_xyz(np.atleast_1d(longitude), np.atleast_1d(latitude))
+        return xyz, np.isfinite(xyz).all(axis=1)
+
+    def nearest(self, longitude, latitude, k=1):
+        """
+        Distances to (and positions of) the k nearest services of each point.
+
+        Parameters:
+        longitude, latitude (array-like): Query points in degrees
+        k (int): Number of neighbours
+
+        Returns:
+        tuple: (distances in km, service positions), each of shape (n, k);
+        points with missing coordinates have distance NaN, missing
+        neighbours (fewer than k services, or none at all) distance inf,
+        and both position -1
+        """
+        xyz, ok = self._query_points(longitude, latitude)
+        distances = np.full((len(xyz), k), np.nan)
+        distances[ok] = np.inf
+        positions = np.full((len(xyz), k), -1, dtype=np.int64)
+        if self.tree.n == 0 or not ok.any():
+            return distances, positions
+        chord, idx = self.tree.query(xyz[ok], k=k)
+        chord = np.asarray(chord, dtype=float).reshape(-1, k)
+        idx = np.asarray(idx).reshape(-1, k)
+        found = idx < self.tree.n
+        positions[ok] = np.where(found, self.positions[np.minimum(idx, self.tree.n - 1)], -1)
+        distances[ok] = np.where(found, _chord_to_km(chord), np.inf)
+        return distances, positions
+
+    def count_within(self, longitude, latitude, radius_km):
+        """
+        Number of services within a great-circle radius of each point.
+
+        Parameters:
+        longitude, latitude (array-like): Query points in degrees
+        radius_km (float): Search radius in km
+
+        Returns:
+        numpy.ndarray: Count per point, as floats so that points with
+        missing coordinates can be NaN
+        """
+        xyz, ok = self._query_points(longitude, latitude)
+        counts = np.where(ok, 0.0, np.nan)
+        if self.tree.n == 0 or not ok.any():
+            return counts
+        counts[ok] = self.tree.query_ball_point(
+            xyz[ok], r=float(_km_to_chord(radius_km)), return_length=True
+        )
+        return counts
+
+
+@profiled
+def accessibility_metrics(
+    points,
+    services,
+    radius_km=2.0,
+    type_col=None,
+    group_col=None,
+    weight_col=None,
+    lon_col='longitude',
+    lat_col='latitude'
+):
+    """
+    Nearest-service distance and services within a radius for query points.
+
+    Parameters:
+    points (pd.DataFrame): Query points (neighbourhood centroids or
+        population grid points) with coordinate columns
+    services (pd.DataFrame): Services with coordinate columns
+        (see extract_service_coordinates)
+    radius_km (float): Radius for the service counts
+    type_col (str, optional): Service type column (e.g.
+        'wellbeing_youth_type'); adds metrics per type
+    group_col (str, optional): Column of points to aggregate by (e.g. the
+        neighbourhood of each grid point)
+    weight_col (str, optional): Point weights (e.g. population) for the
+        aggregation; points are weighted equally if omitted
+    lon_col, lat_col (str): Coordinate column names in both frames
+
+    Returns:
+    pd.DataFrame: Per point (or per group) nearest_service_km and
+    services_within_km columns, plus per-type versions if type_col is given;
+    points with missing coordinates get NaN and are left out of group
+    averages (a group with none left is NaN)
+    """
+    lon = points[lon_col].to_numpy()
+    lat = points[lat_col].to_numpy()
+
+    subsets = {'': services}
+    if type_col is not None:
+        for service_type, subset in services.groupby(type_col):
+            subsets[f'_{service_type}'] = subset
+
+    result = points.copy()
+    metric_cols = []
+    for suffix, subset in subsets.items():
+        locator = ServiceLocator.from_frame(subset, lon_col, lat_col)
+        distance, _ = locator.nearest(lon, lat, k=1)
+        result[f'nearest_service_km{suffix}'] = distance[:, 0]
+        result[f'services_within_km{suffix}'] = locator.count_within(
+            lon, lat, radius_km
+        )
+        metric_cols += [
+            f'nearest_service_km{suffix}', f'services_within_km{suffix}'
+        ]
+
+    if group_col is None:
+        return result
+
+    weights = (
+        result[weight_col].astype(float) if weight_col
+        else pd.Series(1.0, index=result.index)
+    )
+    # Weighted means over the points with a value (NaN sums as 0)
+    values = result[metric_cols]
+    groups = result[group_col]
+    totals = values.mul(weights, axis=0).groupby(groups).sum()
+    weight_totals = values.notna().mul(weights, axis=0).groupby(groups).sum()
+    return totals.div(weight_totals).reset_index()
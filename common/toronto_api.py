@@ -4,9 +4,43 @@ toronto_api.py
 Utilities for interacting with Toronto's Open Data CKAN API.
 """
 
+import io
 import requests
 import pandas as pd
-from typing import Dict, Optional
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+from common.profiling import profile_block, profiled, record_bytes
+from common.snapshot_store import SnapshotStore
+
+
+def read_resource(source, resource: Dict, **kwargs) -> pd.DataFrame:
+    """
+    Read resource data with the reader matching the resource format.
+    
+    Args:
+        source: URL, path or file-like object with the resource contents
+        resource: Resource metadata (uses 'format' and 'datastore_active')
+        **kwargs: Additional arguments for read functions
+        
+    Returns:
+        DataFrame of the resource contents
+    """
+    file_format = (resource.get('format') or '').lower()
+    
+    if (file_format == 'csv') | bool(resource.get('datastore_active')):
+        df = pd.read_csv(source, **kwargs)
+    elif file_format in ['xls', 'xlsx', 'excel']:
+        df = pd.read_excel(source, **kwargs)
+    elif file_format in ['xml']:
+        df = pd.read_xml(source, **kwargs)
+    elif file_format in ['json']:
+        df = pd.read_json(source, **kwargs)
+    else:
+        raise ValueError(f'Unsupported file format: {file_format}')
+        
+    return df
+
 
 class TorontoOpenDataAPI:
     """
@@ -15,14 +49,38 @@ class TorontoOpenDataAPI:
     Args:
         package_name: str of package name to get from Toronto's Open Data CKAN API
         show_info: wheather to print some of the metadata to check the contents of the resources included in the package
+        snapshot_store: optional SnapshotStore where every raw resource download is saved as a new version, so past versions can be reloaded with get_resource_data(as_of=...)
+        base_url: Root URL of the CKAN portal (e.g. a local fake portal for offline runs)
+        session: optional requests.Session to send every request through (e.g. one with a capped connection pool); plain requests.get by default
     
     """
     
-    def __init__(self, package_name, show_info = False):
-        self.base_url = 'https://ckan0.cf.opendata.inter.prod-toronto.ca'
+    def __init__(
+        self,
+        package_name,
+        show_info = False,
+        snapshot_store: Optional[SnapshotStore] = None,
+        base_url: str = 'https://ckan0.cf.opendata.inter.prod-toronto.ca',
+        session: Optional[requests.Session] = None
+    ):
+        self.base_url = base_url
+        self.session = session
         self.api_version = '3'
-        self.package_metadata = self.get_package(package_name, show_info)
+        self.package_name = package_name
+        self.snapshot_store = snapshot_store
+        # Fetched on first use, so loading stored versions needs no portal
+        self._package_metadata = (
+            self.get_package(package_name, show_info) if show_info else None
+        )
+
+    @property
+    def package_metadata(self) -> Dict:
+        """Package metadata, fetched from the portal on first access."""
+        if self._package_metadata is None:
+            self._package_metadata = self.get_package(self.package_name, False)
+        return self._package_metadata
     
+    @profiled
     def _make_request(
         self, 
         endpoint: str, 
@@ -39,10 +97,12 @@ class TorontoOpenDataAPI:
             JSON response from the API
         """
         url = f"{self.base_url}/api/{self.api_version}/action/{endpoint}"
-        response = requests.get(url, params=params)
+        response = (self.session or requests).get(url, params=params)
         response.raise_for_status()  # Raise exception for bad status codes
+        record_bytes(len(response.content))
         return response.json()
     
+    @profiled
     def get_package(self, package_name: str, show_info) -> Dict:
         """
         Get metadata for a specific package.
@@ -65,8 +125,9 @@ class TorontoOpenDataAPI:
                 f"{error.get('__type')} Error: {error.get('message')}"
             )
         
+    @staticmethod
     def show_resources_info(
-        self, result: Dict
+        result: Dict
     ):
         """
 
@@ -90,9 +151,11 @@ class TorontoOpenDataAPI:
     url_type: {resource['url_type']}
             """)
 
+    @profiled
     def get_resource_data(
         self,
         resource_idx: int = 0,
+        as_of: Optional[Union[str, datetime]] = None,
         **kwargs
     ) -> pd.DataFrame:
         """
@@ -100,34 +163,57 @@ class TorontoOpenDataAPI:
         
         Args:
             resource_idx: idx of desired resource within the package metadata, defaults to first position (0)
+            as_of: load the version of the resource stored in the snapshot store on or before this date instead of downloading it; the resource is looked up by its position at the time it was stored, without asking the portal
             **kwargs: Additional arguments for read functions
             
         Returns:
             Processed DataFrame
         """
-        # Get the desired resource metadata
-        try:
+        if as_of is not None:
+            if self.snapshot_store is None:
+                raise ValueError('as_of requires a snapshot_store')
+            # Resolve the resource from what was stored, not from the
+            # current metadata: it may since have been moved or removed,
+            # and the stored format is the one the bytes were saved in
+            resource = self.snapshot_store.find(
+                self.package_name, position=resource_idx, as_of=as_of
+            )
+            data, resource = self.snapshot_store.get(
+                self.package_name, resource['resource_id'], as_of
+            )
+        else:
+            # Get the desired resource metadata
             resource = next(
-                (r for r in self.package_metadata['resources'] 
-                    if (r['position'] == resource_idx)
+                (r for r in self.package_metadata['resources']
+                    if r.get('position') == resource_idx
                 ),
                 None
             )
-        except KeyError:
-            print("Metadata incorrectly formatted (should contain a list of resources within a result, each with a 'position' value.)")
-        except:
-            print("Exception raised.")
-        file_format = resource.get('format', '').lower()
+            if resource is None:
+                raise KeyError(
+                    f"{self.package_name} has no resource at position {resource_idx}"
+                )
+            # Download once, keep the raw bytes, then parse them, so the
+            # profile separates download time and bytes from parse time
+            data = self._download(resource['url'])
+            if self.snapshot_store is not None:
+                self.snapshot_store.put(self.package_name, resource, data)
         
-        if (file_format == 'csv') | resource['datastore_active']:
-            df = pd.read_csv(resource['url'], **kwargs)
-        elif file_format in ['xls', 'xlsx', 'excel']:
-            df = pd.read_excel(resource['url'], **kwargs)
-        elif file_format in ['xml']:
-            df = pd.read_xml(resource['url'], **kwargs)
-        elif file_format in ['json']:
-            df = pd.read_json(resource['url'], **kwargs)
-        else:
-            raise ValueError(f'Unsupported file format: {file_format}')
+        with profile_block('parse'):
+            return read_resource(io.BytesIO(data), resource, **kwargs)
+    
+    @profiled
+    def _download(self, url: str) -> bytes:
+        """
+        Download a resource file.
+        
+        Args:
+            url: Resource URL
             
-        return df
+        Returns:
+            Raw bytes of the file
+        """
+        response = (self.session or requests).get(url)
+        response.raise_for_status()  # Raise exception for bad status codes
+        record_bytes(len(response.content))
+        return response.content
@@ -9,7 +9,10 @@ from typing import List, Optional
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from common.profiling import profiled
 
+
+@profiled
 def calculate_rolling_stats(
     df: pd.DataFrame,
     value_col: str,
@@ -56,6 +59,7 @@ def calculate_rolling_stats(
     return df
 
 
+@profiled
 def plot_time_patterns(
     df: pd.DataFrame,
     datetime_col: str,
@@ -108,6 +112,7 @@ def plot_time_patterns(
     plt.tight_layout()
     
 
+@profiled
 def detect_outliers(
     df: pd.DataFrame,
     value_col: str,
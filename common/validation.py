@@ -0,0 +1,308 @@
+"""
+validation.py
+
+Data-quality checks for resources as they are ingested from the portal.
+
+A Schema lists the expected columns with their type and value rules, plus
+optional checks on a fixed-interval timestamp column. DataValidator applies
+every check as a vectorized mask over the frame, returns the clean rows
+(with numeric and datetime columns already converted), keeps the failing
+rows in a quarantine frame and records a compact ValidationReport.
+"""
+
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Optional
+
+
+class SchemaError(ValueError):
+    """Raised when required columns are missing from a resource."""
+
+
+class ColumnRule:
+    """
+    Expectations for a single column.
+
+    Args:
+        name: Column name
+        kind: 'numeric', 'datetime' or 'string'
+        required: Whether the column must be present
+        allow_null: Whether missing values (and empty strings) are accepted
+        min_value: Smallest accepted value (numeric columns)
+        max_value: Largest accepted value (numeric columns)
+        integer: Whether numeric values must be whole numbers
+        datetime_format: Format passed to to_datetime (datetime columns)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str = 'string',
+        required: bool = True,
+        allow_null: bool = False,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+        integer: bool = False,
+        datetime_format: Optional[str] = None
+    ):
+        if kind not in ('numeric', 'datetime', 'string'):
+            raise ValueError(f'Unknown column kind: {kind}')
+        self.name = name
+        self.kind = kind
+        self.required = required
+        self.allow_null = allow_null
+        self.min_value = min_value
+        self.max_value = max_value
+        self.integer = integer
+        self.datetime_format = datetime_format
+
+
+class Schema:
+    """
+    Expected structure of a resource.
+
+    Args:
+        columns: Rules for the expected columns
+        interval_col: Datetime column holding fixed-length interval starts
+        interval: Expected interval length (e.g. '15min')
+    """
+
+    def __init__(
+        self,
+        columns: List[ColumnRule],
+        interval_col: Optional[str] = None,
+        interval: Optional[str] = None
+    ):
+        self.columns = columns
+        self.interval_col = interval_col
+        self.interval = pd.Timedelta(interval) if interval else None
+
+    def rule(self, name: str) -> ColumnRule:
+        return next(r for r in self.columns if r.name == name)
+
+
+class ValidationReport:
+    """
+    Outcome of validating one resource.
+
+    Attributes:
+        resource: Name of the validated resource
+        n_rows: Number of input rows
+        n_quarantined: Number of rows failing at least one check
+        missing_columns: Required columns not found
+        unexpected_columns: Columns not described by the schema
+        issues: Mapping of check name ('column:check') to failing row count
+        order: 'ascending', 'descending' or 'unordered' interval order
+        n_gaps: Number of gaps between consecutive intervals
+        missing_intervals: Number of intervals missing inside those gaps
+    """
+
+    def __init__(self, resource: str, n_rows: int):
+        self.resource = resource
+        self.n_rows = n_rows
+        self.n_quarantined = 0
+        self.missing_columns = []
+        self.unexpected_columns = []
+        self.issues = {}
+        self.order = None
+        self.n_gaps = 0
+        self.missing_intervals = 0
+
+    @property
+    def ok(self) -> bool:
+        """Whether the resource passed every check."""
+        return (
+            not self.missing_columns
+            and self.n_quarantined == 0
+            and self.n_gaps == 0
+        )
+
+    def as_dict(self) -> Dict:
+        return dict(vars(self))
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.resource}: {self.n_rows} rows, "
+            f"{self.n_quarantined} quarantined"
+        ]
+        if self.missing_columns:
+            lines.append(f"  missing columns: {self.missing_columns}")
+        if self.unexpected_columns:
+            lines.append(f"  unexpected columns: {self.unexpected_columns}")
+        for check, count in self.issues.items():
+            lines.append(f"  {check}: {count}")
+        if self.order is not None:
+            lines.append(
+                f"  intervals: {self.order}, {self.n_gaps} gaps, "
+                f"{self.missing_intervals} missing"
+            )
+        return '\n'.join(lines)
+
+
+class DataValidator:
+    """
+    Validate resources against a schema, quarantining bad rows.
+
+    Reports and quarantined rows accumulate across calls, so a single
+    validator can be passed through a whole refresh.
+
+    Args:
+        schema: Expected structure of the resources
+        raise_on_missing: Whether to raise SchemaError for missing columns
+    """
+
+    def __init__(self, schema: Schema, raise_on_missing: bool = True):
+        self.schema = schema
+        self.raise_on_missing = raise_on_missing
+        self.reports: List[ValidationReport] = []
+        self._quarantine: List[pd.DataFrame] = []
+
+    @property
+    def quarantine(self) -> pd.DataFrame:
+        """Quarantined rows from every validated resource."""
+        if not self._quarantine:
+            return pd.DataFrame()
+        return pd.concat(self._quarantine)
+
+    def _check_column(self, df, rule, checks, coerced):
+        values = df[rule.name]
+        if rule.kind == 'string' and rule.allow_null:
+            # Nothing to check or convert
+            return
+        is_null = values.isna().to_numpy()
+        if values.dtype == object:
+            is_null |= values.to_numpy() == ''
+        if not rule.allow_null:
+            checks[f'{rule.name}:null'] = is_null
+
+        if rule.kind == 'numeric':
+            if pd.api.types.is_numeric_dtype(values.dtype):
+                # Already parsed (e.g. by read_csv): nothing to coerce
+                numeric = values
+            else:
+                numeric = pd.to_numeric(values.where(~is_null), errors='coerce')
+            number = numeric.to_numpy(dtype=float, na_value=np.nan)
+            checks[f'{rule.name}:not_numeric'] = np.isnan(number) & ~is_null
+            with np.errstate(invalid='ignore'):
+                if rule.integer:
+                    checks[f'{rule.name}:not_integer'] = (
+                        ~np.isnan(number) & (number % 1 != 0)
+                    )
+                if rule.min_value is not None:
+                    checks[f'{rule.name}:below_min'] = number < rule.min_value
+                if rule.max_value is not None:
+                    checks[f'{rule.name}:above_max'] = number > rule.max_value
+            coerced[rule.name] = numeric
+        elif rule.kind == 'datetime':
+            parsed = pd.to_datetime(
+                values.where(~is_null),
+                format=rule.datetime_format,
+                errors='coerce'
+            )
+            checks[f'{rule.name}:not_datetime'] = (
+                parsed.isna().to_numpy() & ~is_null
+            )
+            coerced[rule.name] = parsed
+
+    def _check_intervals(self, checks, coerced, report):
+        col = self.schema.interval_col
+        interval = self.schema.interval
+        ts = coerced[col]
+        valid = ts.dropna()
+
+        present = ts.notna().to_numpy()
+        checks[f'{col}:misaligned'] = (
+            present & (ts.dt.floor(interval) != ts).to_numpy()
+        )
+        checks[f'{col}:duplicate'] = (
+            present & ts.duplicated(keep='first').to_numpy()
+        )
+
+        if valid.is_monotonic_increasing:
+            report.order = 'ascending'
+        elif valid.is_monotonic_decreasing:
+            report.order = 'descending'
+        else:
+            report.order = 'unordered'
+
+        steps = np.diff(np.sort(valid.unique()))
+        gaps = steps[steps > interval.to_timedelta64()]
+        report.n_gaps = int(len(gaps))
+        report.missing_intervals = int(
+            (gaps // interval.to_timedelta64() - 1).sum()
+        )
+
+    def validate(
+        self,
+        df: pd.DataFrame,
+        resource: str = 'resource'
+    ) -> pd.DataFrame:
+        """
+        Check a resource and split off rows failing any check.
+
+        Args:
+            df: Raw resource data
+            resource: Name used in the report
+
+        Returns:
+            DataFrame of rows passing every check, with numeric and datetime
+            columns converted to numeric/datetime dtypes
+        """
+        report = ValidationReport(resource, len(df))
+        self.reports.append(report)
+
+        expected = [rule.name for rule in self.schema.columns]
+        report.missing_columns = [
+            rule.name for rule in self.schema.columns
+            if rule.required and rule.name not in df.columns
+        ]
+        report.unexpected_columns = [
+            col for col in df.columns if col not in expected
+        ]
+        if report.missing_columns and self.raise_on_missing:
+            raise SchemaError(
+                f"{resource} is missing columns {report.missing_columns}; "
+                f"found {list(df.columns)}"
+            )
+
+        checks: Dict[str, np.ndarray] = {}
+        coerced: Dict[str, pd.Series] = {}
+        for rule in self.schema.columns:
+            if rule.name in df.columns:
+                self._check_column(df, rule, checks, coerced)
+        if self.schema.interval_col in coerced:
+            self._check_intervals(checks, coerced, report)
+
+        # One boolean row per check: counts per check, and the rows failing any
+        masks = np.zeros((len(checks), len(df)), dtype=bool)
+        for i, mask in enumerate(checks.values()):
+            masks[i] = mask
+        counts = masks.sum(axis=1)
+        bad = masks.any(axis=0)
+        report.issues = {
+            check: int(count) for check, count in zip(checks, counts) if count
+        }
+        report.n_quarantined = int(bad.sum())
+
+        if report.n_quarantined:
+            quarantined = df[bad].copy()
+            issues = pd.Series('', index=quarantined.index)
+            for check, mask in zip(checks, masks[:, bad]):
+                issues[mask] += check + ';'
+            quarantined['_resource'] = resource
+            quarantined['_issues'] = issues.str.rstrip(';')
+            self._quarantine.append(quarantined)
+            clean = df[~bad].copy()
+        else:
+            clean = df.copy(deep=False)
+
+        # Hand back the coerced values so they are not parsed again
+        for name, values in coerced.items():
+            if report.n_quarantined:
+                values = values[~bad]
+            rule = self.schema.rule(name)
+            if rule.integer and not rule.allow_null:
+                values = values.astype('int64')
+            clean[name] = values
+
+        return clean
@@ -1,16 +1,24 @@
 import requests
+import pandas as pd
 from pathlib import Path
 from datetime import datetime
 import time
+from typing import List, Optional, Tuple
 
+from common.profiling import profiled, record_bytes
+
+@profiled
 def download_weather_data(
     station_id: int,
     start_year: int,
     start_month: int = 1,
     end_year: int = datetime.now().year,
     end_month: int = 12,
-    output_dir: str = "weather_data"
-) -> None:
+    output_dir: str = "weather_data",
+    base_url: str = "https://climate.weather.gc.ca/climate_data/bulk_data_e.html",
+    request_delay: float = 0.5,
+    session: Optional[requests.Session] = None
+) -> List[Tuple[int, int]]:
     """
     Download historical weather data from Environment Canada.
     
@@ -19,14 +27,17 @@ def download_weather_data(
         start_year: Starting year for data collection
         end_year: Ending year for data collection
         output_dir: Directory to save downloaded files
+        base_url: URL of the bulk data endpoint
+        request_delay: Seconds to wait between requests
+        session: Session to send the requests through; plain requests.get
+            by default
+        
+    Returns:
+        (year, month) of the months that failed to download
     """
     # Create output directory if it doesn't exist
     Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    base_url = (
-        "https://climate.weather.gc.ca/climate_data/bulk_data_e.html"
-    )
-    
     # Common query parameters
     params = {
         "format": "csv",
@@ -36,6 +47,7 @@ def download_weather_data(
         "Day": 14  # Any day works as we're getting monthly data
     }
     
+    failed = []
     for year in range(start_year, end_year + 1):
         for month in range(1, 13):
             # If first_year, 
@@ -51,8 +63,9 @@ def download_weather_data(
             
             try:
                 # Make the request
-                response = requests.get(base_url, params=params)
+                response = (session or requests).get(base_url, params=params)
                 response.raise_for_status()
+                record_bytes(len(response.content))
                 
                 # Get filename from content-disposition header or create one
                 # if "content-disposition" in response.headers:
@@ -72,11 +85,60 @@ def download_weather_data(
                 print(f"Downloaded data for {year}-{month:02d}")
                 
                 # Be nice to the server - add a small delay between requests
-                time.sleep(0.5)
+                time.sleep(request_delay)
                 
             except requests.exceptions.RequestException as e:
                 print(f"Error downloading {year}-{month:02d}: {e}")
+                failed.append((year, month))
                 continue
+    
+    return failed
+
+# Environment Canada hourly columns and their short names
+WEATHER_COLUMNS = {
+    'Temp (°C)': 'temp_c',
+    'Precip. Amount (mm)': 'precip_mm',
+    'Rel Hum (%)': 'rel_hum_pct',
+    'Wind Spd (km/h)': 'wind_kmh'
+}
+
+
+@profiled
+def load_weather_data(
+    output_dir: str = "weather_data",
+    station_id: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    Load the hourly CSVs written by download_weather_data into one frame.
+    
+    Args:
+        output_dir: Directory the files were downloaded to
+        station_id: Only load files for this station (defaults to all)
+        
+    Returns:
+        DataFrame indexed by hourly datetime with the available columns of
+        WEATHER_COLUMNS under their short names (temp_c, precip_mm, ...)
+    """
+    pattern = f"weather_data_{station_id or '*'}_*.csv"
+    frames = []
+    for path in sorted(Path(output_dir).glob(pattern)):
+        df = pd.read_csv(
+            path,
+            usecols=lambda c: c == 'Date/Time (LST)' or c in WEATHER_COLUMNS
+        )
+        frames.append(df)
+    if not frames:
+        raise FileNotFoundError(f"No files matching {pattern} in {output_dir}")
+    
+    weather = (pd.concat(frames, ignore_index=True)
+        .rename(columns=WEATHER_COLUMNS)
+        .assign(datetime=lambda x: pd.to_datetime(x['Date/Time (LST)']))
+        .drop(columns='Date/Time (LST)')
+        .drop_duplicates('datetime')
+        .set_index('datetime')
+        .sort_index()
+    )
+    return weather
 
 if __name__ == "__main__":
     # Example usage for Toronto City Centre station (ID: 48549)
@@ -1,21 +1,70 @@
 import pandas as pd
 import numpy as np
+import zlib
 from datetime import datetime, timedelta
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from common.parallel import parallel_executor, parallel_groupby_agg
+from common.profiling import profiled
+from common.quantile_sketch import KLLSketch
+
+# Ticket count columns in the ferry dataset
+COUNT_COLS = ['Sales Count', 'Redemption Count']
+
+# Seasons by calendar quarter, as used in the exploratory notebook
+SEASON_LABELS = ['Winter', 'Spring', 'Summer', 'Fall']
+
+
+def season_of_month(month):
+    """
+    Map month number(s) (1-12) to season label(s) by calendar quarter.
+    
+    Parameters:
+    month (int or array-like): Month number(s)
+    
+    Returns:
+    str or numpy.ndarray: Season label(s)
+    """
+    labels = np.asarray(SEASON_LABELS)[(np.asarray(month) - 1) // 3]
+    return labels.item() if labels.ndim == 0 else labels
+
+
+def _groupby_agg(df, by, agg, executor=None):
+    """
+    Group and aggregate, serially with pandas or across a process pool.
+    
+    Parameters:
+    df (pandas.DataFrame): Input data
+    by (str or list): Column(s) to group by
+    agg (dict): Mapping of value column to aggregation
+    executor (concurrent.futures.Executor, optional): Process pool to run
+    on (see common.parallel); None runs the plain groupby
+    
+    Returns:
+    pandas.DataFrame: Aggregated data indexed by the group keys
+    """
+    if executor is None:
+        return df.groupby(by).agg(agg)
+    return parallel_groupby_agg(df, by, agg, executor=executor)
+
 
 # ---
 # Redemption/Sales ratio
 # ---
 
-def analyze_ferry_patterns(df):
+@profiled
+def analyze_ferry_patterns(df, n_jobs=None, executor=None):
     """
     Analyze ferry ticket sales vs redemptions across different time scales.
     
     Parameters:
     df (pandas.DataFrame): DataFrame with columns for Timestamp, Sales Count,
     and Redemption Count
+    n_jobs (int, optional): Run the groupbys on one pool of this many worker
+    processes (see common.parallel); by default they run serially
+    executor (concurrent.futures.Executor, optional): Existing pool to run
+    the groupbys on instead, e.g. a SharedMemoryExecutor kept across calls
     
     Returns:
     dict: Dictionary containing analysis results at different time scales
@@ -29,66 +78,65 @@ def analyze_ferry_patterns(df):
     df['day'] = df['datetime'].dt.day
     df['hour'] = df['datetime'].dt.hour
     
-    # Calculate differences at various time scales
-    # Dict to store results
-    analyses = {}
-    
-    # Yearly analysis
-    yearly = (
-        df
-        .groupby('year')
-        .agg({
-            'Sales Count': 'sum',
-            'Redemption Count': 'sum'
-        })
-        .assign(
-            difference=lambda x: (
-            x['Redemption Count'] - x['Sales Count']
-            ),
-            ratio=lambda x: (
-                x['Redemption Count'] / x['Sales Count']
-            )
-        ))
-    analyses['yearly'] = yearly
-    
-    # Monthly analysis
-    monthly = (
-        df
-        .groupby(['year', 'month'])
-        .agg({
-            'Sales Count': 'sum',
-            'Redemption Count': 'sum'
-        })
-        .assign(
-            difference=lambda x: (
-            x['Redemption Count'] - x['Sales Count']
-            ),
-            ratio=lambda x: (
-            x['Redemption Count'] / x['Sales Count']
-            )
-        ))
-    analyses['monthly'] = monthly
-    
-    # Hourly patterns
-    hourly = (
-        df
-        .groupby('hour')
-        .agg({
-        'Sales Count': 'mean',
-        'Redemption Count': 'mean'
-        })
-        .assign(
-            difference=lambda x: (
+    with parallel_executor(n_jobs, executor) as pool:
+        # Calculate differences at various time scales
+        # Dict to store results
+        analyses = {}
+    
+        # Yearly analysis
+        yearly = (
+            df
+            .pipe(_groupby_agg, 'year', {
+                'Sales Count': 'sum',
+                'Redemption Count': 'sum'
+            }, pool)
+            .assign(
+                difference=lambda x: (
                 x['Redemption Count'] - x['Sales Count']
-            ),
-            ratio=lambda x: (
+                ),
+                ratio=lambda x: (
+                    x['Redemption Count'] / x['Sales Count']
+                )
+            ))
+        analyses['yearly'] = yearly
+    
+        # Monthly analysis
+        monthly = (
+            df
+            .pipe(_groupby_agg, ['year', 'month'], {
+                'Sales Count': 'sum',
+                'Redemption Count': 'sum'
+            }, pool)
+            .assign(
+                difference=lambda x: (
+                x['Redemption Count'] - x['Sales Count']
+                ),
+                ratio=lambda x: (
                 x['Redemption Count'] / x['Sales Count']
-            )
-        ))
-    analyses['hourly'] = hourly
+                )
+            ))
+        analyses['monthly'] = monthly
+    
+        # Hourly patterns
+        hourly = (
+            df
+            .pipe(_groupby_agg, 'hour', {
+            'Sales Count': 'mean',
+            'Redemption Count': 'mean'
+            }, pool)
+            .assign(
+                difference=lambda x: (
+                    x['Redemption Count'] - x['Sales Count']
+                ),
+                ratio=lambda x: (
+                    x['Redemption Count'] / x['Sales Count']
+                )
+            ))
+        analyses['hourly'] = hourly
     
     return analyses
 
+@profiled
 def plot_patterns(analyses):
     """
     Create visualizations of ferry ticket patterns.
@@ -142,6 +190,7 @@ def plot_patterns(analyses):
     plt.tight_layout()
     return fig
 
+@profiled
 def generate_insights(analyses):
     """
     Generate key insights from the analyses.
@@ -177,13 +226,18 @@ def generate_insights(analyses):
 # KPIs
 #  ---
 
-def analyze_ferry_service_kpis(df):
+@profiled
+def analyze_ferry_service_kpis(df, n_jobs=None, executor=None):
     """
     Calculate key performance indicators for ferry service optimization.
     
     Parameters:
     df: pandas DataFrame with columns ['Timestamp', 'Sales Count', 
         'Redemption Count']
+    n_jobs (int, optional): Compute the hourly totals on this many worker
+        processes (see common.parallel); by default they run serially
+    executor (concurrent.futures.Executor, optional): Existing pool to
+        compute them on instead, e.g. a SharedMemoryExecutor kept across calls
     
     Returns:
     dict: KPIs and metrics for operational decision making
@@ -193,33 +247,86 @@ def analyze_ferry_service_kpis(df):
     df.set_index('datetime', inplace=True)
     
     # Calculate hourly and daily aggregations
-    hourly_data = df.resample('H').sum()
-    daily_data = df.resample('D').sum()
+    with parallel_executor(n_jobs, executor) as pool:
+        if pool is None:
+            hourly_data = df.resample('H').sum()
+            daily_data = df.resample('D').sum()
+        else:
+            # The only pass over the rows runs on the pool; daily totals are
+            # rolled up from the hourly ones (24 rows a day at most)
+            hourly_totals = parallel_groupby_agg(
+                df.assign(hour_start=df.index.floor('h')),
+                'hour_start',
+                {col: 'sum' for col in COUNT_COLS},
+                executor=pool
+            )
+            hourly_data = _fill_hours(hourly_totals)
+            daily_data = hourly_data.resample('D').sum()
     
     # Calculate service utilization rate
     utilization = (df['Redemption Count'] / df['Sales Count']).mean() * 100
     
-    # Calculate peak hours (top 10% of traffic hours)
-    peak_threshold = np.percentile(
-        hourly_data['Redemption Count'], 
-        90
+    # Calculate ticket efficiency (unused tickets)
+    unused_rate = (
+        (df['Sales Count'] - df['Redemption Count']).sum() / 
+        df['Sales Count'].sum() * 100
+    )
+    
+    kpis = _compile_service_kpis(
+        hourly_data, daily_data, utilization, unused_rate
+    )
+    
+    return kpis
+
+
+def _fill_hours(hourly_totals):
+    """Reindex hourly totals to every hour in their range, as resample does."""
+    return hourly_totals.reindex(
+        pd.date_range(
+            hourly_totals.index.min(),
+            hourly_totals.index.max(),
+            freq='h',
+            name='datetime'
+        ),
+        fill_value=0
     )
-    peak_hours = hourly_data[
-        hourly_data['Redemption Count'] >= peak_threshold
-    ].index.hour.value_counts()
+
+
+def _compile_service_kpis(
+    hourly_data, daily_data, utilization, unused_rate, peak_index=None
+):
+    """
+    Build the KPI dictionary from hourly/daily totals and overall rates.
+    
+    Parameters:
+    hourly_data (pandas.DataFrame): Hourly totals on a complete hourly index
+    daily_data (pandas.DataFrame): Daily totals on a complete daily index
+    utilization (float): Mean redemption/sales ratio, as a percentage
+    unused_rate (float): Share of sold tickets never redeemed, as a percentage
+    peak_index (FerryPeakIndex, optional): Sketch index to take the peak
+        threshold and peak hours from instead of the exact hourly totals
+    
+    Returns:
+    dict: KPIs and metrics for operational decision making
+    """
+    # Calculate peak hours (top 10% of traffic hours)
+    if peak_index is not None:
+        peak_hours = peak_index.peak_hours(0.9)
+    else:
+        peak_threshold = np.percentile(
+            hourly_data['Redemption Count'], 
+            90
+        )
+        peak_hours = hourly_data[
+            hourly_data['Redemption Count'] >= peak_threshold
+        ].index.hour.value_counts()
     
     # Calculate week-over-week growth
-    weekly_data = daily_data.resample('W').sum()
+    weekly_data = daily_data[COUNT_COLS].resample('W').sum()
     wow_growth = (
         (weekly_data - weekly_data.shift(1)) / weekly_data.shift(1) * 100
     )
     
-    # Calculate ticket efficiency (unused tickets)
-    unused_rate = (
-        (df['Sales Count'] - df['Redemption Count']).sum() / 
-        df['Sales Count'].sum() * 100
-    )
-    
     # Prepare KPI dictionary
     kpis = {
         'service_utilization_rate': round(utilization, 2),
@@ -234,3 +341,453 @@ def analyze_ferry_service_kpis(df):
     }
     
     return kpis
+
+#  ---
+# Chunked (out-of-core) versions
+#  ---
+
+def _add_difference_ratio(agg):
+    """Add the redemption minus sales difference and ratio columns."""
+    return agg.assign(
+        difference=lambda x: (
+            x['Redemption Count'] - x['Sales Count']
+        ),
+        ratio=lambda x: (
+            x['Redemption Count'] / x['Sales Count']
+        )
+    )
+
+
+def _merge_partial(total, partial):
+    """
+    Combine two partial sum aggregates sharing the same index names.
+    
+    Concatenating and re-summing (rather than DataFrame.add) keeps integer
+    dtypes when a key only appears in one of the partials.
+    """
+    if total is None:
+        return partial
+    levels = list(range(partial.index.nlevels))
+    return pd.concat([total, partial]).groupby(level=levels).sum()
+
+
+@profiled
+def analyze_ferry_patterns_chunked(chunks):
+    """
+    Chunk-aware version of analyze_ferry_patterns.
+    
+    Each chunk is reduced to partial sums (and counts for the hourly means)
+    which are merged as they arrive, so only one chunk plus the small
+    per-year/month/hour aggregates is ever held in memory.
+    
+    Parameters:
+    chunks (iterable of pandas.DataFrame): Chunks with columns for Timestamp,
+    Sales Count and Redemption Count, e.g. pd.read_csv(..., chunksize=...)
+    
+    Returns:
+    dict: Same structure as analyze_ferry_patterns
+    """
+    yearly = monthly = hourly_sum = hourly_n = None
+    
+    for chunk in chunks:
+        ts = pd.to_datetime(chunk['Timestamp'])
+        counts = chunk[COUNT_COLS]
+        year = ts.dt.year.rename('year')
+        month = ts.dt.month.rename('month')
+        hour = ts.dt.hour.rename('hour')
+        
+        yearly = _merge_partial(yearly, counts.groupby(year).sum())
+        monthly = _merge_partial(
+            monthly, counts.groupby([year, month]).sum()
+        )
+        hourly_sum = _merge_partial(hourly_sum, counts.groupby(hour).sum())
+        hourly_n = _merge_partial(hourly_n, counts.groupby(hour).count())
+    
+    if yearly is None:
+        raise ValueError('No chunks to analyze')
+    
+    analyses = {
+        'yearly': _add_difference_ratio(yearly),
+        'monthly': _add_difference_ratio(monthly),
+        'hourly': _add_difference_ratio(hourly_sum / hourly_n)
+    }
+    
+    return analyses
+
+
+@profiled
+def analyze_ferry_service_kpis_chunked(chunks, peak_index=None):
+    """
+    Chunk-aware version of analyze_ferry_service_kpis.
+    
+    Rows are reduced per chunk to hourly totals, which are merged across
+    chunks (intervals from the same hour may fall in different chunks).
+    Memory is bounded by the number of hours covered, not the number of
+    rows, and every KPI, including the 90th-percentile peak threshold, is
+    computed from those totals exactly as in the in-memory version.
+    
+    Parameters:
+    chunks (iterable of pandas.DataFrame): Chunks with columns
+        ['Timestamp', 'Sales Count', 'Redemption Count']
+    peak_index (FerryPeakIndex, optional): Prebuilt (e.g. incrementally
+        maintained or merged from workers) index used for the peak hours
+        instead of the exact hourly totals
+    
+    Returns:
+    dict: Same structure as analyze_ferry_service_kpis
+    """
+    hourly_totals = None
+    ratio_sum = 0.0
+    ratio_n = 0
+    
+    for chunk in chunks:
+        ts = pd.to_datetime(chunk['Timestamp'])
+        counts = chunk[COUNT_COLS]
+        hourly_totals = _merge_partial(
+            hourly_totals,
+            counts.groupby(ts.dt.floor('h').rename('datetime')).sum()
+        )
+        # Per-interval ratios are averaged, so keep their sum and count
+        ratio = counts['Redemption Count'] / counts['Sales Count']
+        ratio_sum += ratio.sum()
+        ratio_n += ratio.count()
+    
+    if hourly_totals is None:
+        raise ValueError('No chunks to analyze')
+    
+    hourly_data = _fill_hours(hourly_totals)
+    daily_data = hourly_data.resample('D').sum()
+    
+    utilization = ratio_sum / ratio_n * 100
+    totals = hourly_data.sum()
+    unused_rate = (
+        (totals['Sales Count'] - totals['Redemption Count']) /
+        totals['Sales Count'] * 100
+    )
+    
+    return _compile_service_kpis(
+        hourly_data, daily_data, utilization, unused_rate, peak_index
+    )
+
+#  ---
+# Approximate peak-hour index
+#  ---
+
+class FerryPeakIndex:
+    """
+    Mergeable quantile sketches of hourly redemptions per segment.
+    
+    One KLLSketch is kept per (year, season, day of week, hour of day), so
+    the index can be updated as new hourly totals arrive, merged with
+    indexes built by parallel workers, and queried for peak thresholds and
+    peak-hour rankings over any combination of year/season/day of week.
+    Query cost depends only on the number of sketches, not on the number
+    of hourly intervals; merged sketches are cached per query.
+    
+    Results are approximate, not exact per-group peaks. Each query merges
+    the sketches of the selected segments, and merged sketches compact, so
+    a threshold is only guaranteed to have a rank within
+    KLLSketch.normalized_rank_error(k) * n of the exact percentile with 99%
+    confidence, where n is the number of hourly values selected (about 1.3%
+    of n for k=200). The per-hour counts of peak_hours carry the same error
+    relative to each hour's number of values. A query is exact only when
+    the values it selects fit in a single uncompacted sketch (fewer than k).
+    Each sketch is seeded from its segment key, so the same hourly totals
+    always give the same results, however they are split across updates.
+    
+    The last hour of each update is held back as pending, since a batch
+    cut mid-hour gives a partial total that the next batch completes; it is
+    added to the next update's first hour if that is the same hour, and
+    included in queries meanwhile. Call flush() once no more data follows.
+    Indexes to merge should cover separate periods; a pending hour shared
+    by both is summed.
+    
+    Parameters:
+    k (int): Accuracy parameter of each sketch
+    value_col (str): Column of the hourly totals to sketch
+    """
+    
+    def __init__(self, k=200, value_col='Redemption Count'):
+        self.k = k
+        self.value_col = value_col
+        self.sketches = {}
+        self.pending = None
+        self._cache = {}
+    
+    @staticmethod
+    def _segment_keys(idx):
+        return [idx.year, season_of_month(idx.month), idx.day_name(), idx.hour]
+    
+    @staticmethod
+    def _seed(key):
+        """Fixed sketch seed for a segment (stable across processes)."""
+        return zlib.crc32('|'.join(map(str, key)).encode())
+    
+    def _sketch(self, key):
+        if key not in self.sketches:
+            self.sketches[key] = KLLSketch(self.k, seed=self._seed(key))
+        return self.sketches[key]
+    
+    def _commit(self, hourly_data):
+        for key, values in hourly_data.groupby(self._segment_keys(hourly_data.index)):
+            self._sketch(key).update(values.to_numpy())
+    
+    @profiled
+    def update(self, hourly_data):
+        """
+        Add hourly totals to the index.
+        
+        Parameters:
+        hourly_data (pandas.DataFrame or pandas.Series): Hourly totals with a
+            DatetimeIndex (zero-filled hours included, as from resample),
+            later than the data of previous updates; the last hour may be
+            partial and completed by the next update
+        
+        Returns:
+        FerryPeakIndex: The index itself, for chaining
+        """
+        if isinstance(hourly_data, pd.DataFrame):
+            hourly_data = hourly_data[self.value_col]
+        if self.pending is not None:
+            hourly_data = pd.concat([self.pending, hourly_data])
+        hourly_data = hourly_data.groupby(level=0).sum()
+        if len(hourly_data):
+            self._commit(hourly_data.iloc[:-1])
+            self.pending = hourly_data.iloc[-1:]
+        self._cache = {}
+        return self
+    
+    def flush(self):
+        """
+        Count the pending last hour as complete.
+        
+        Returns:
+        FerryPeakIndex: The index itself, for chaining
+        """
+        if self.pending is not None:
+            self._commit(self.pending)
+            self.pending = None
+        self._cache = {}
+        return self
+    
+    def merge(self, other):
+        """
+        Merge another index (same k) into this one in place.
+        
+        Parameters:
+        other (FerryPeakIndex): Index built, e.g., by another worker
+        
+        Returns:
+        FerryPeakIndex: The index itself, for chaining
+        """
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = sketch.copy()
+        if other.pending is not None:
+            if self.pending is not None and self.pending.index.equals(other.pending.index):
+                self.pending = self.pending + other.pending
+            else:
+                self._commit(other.pending)
+        self._cache = {}
+        return self
+    
+    @staticmethod
+    def _selects(key, year, season, day_of_week):
+        return (
+            (year is None or key[0] == year)
+            and (season is None or key[1] == season)
+            and (day_of_week is None or key[2] == day_of_week)
+        )
+    
+    def _matching(self, year, season, day_of_week):
+        # Sorted, so merges run in the same order however the index was built
+        return [
+            (key, self.sketches[key]) for key in sorted(self.sketches)
+            if self._selects(key, year, season, day_of_week)
+        ]
+    
+    def _merged(self, year, season, day_of_week):
+        """Merged sketch over all hours, plus per-hour sketches, for a filter."""
+        cache_key = (year, season, day_of_week)
+        if cache_key not in self._cache:
+            by_hour = {}
+            for key, sketch in self._matching(year, season, day_of_week):
+                hour = key[3]
+                if hour in by_hour:
+                    by_hour[hour].merge(sketch)
+                else:
+                    by_hour[hour] = sketch.copy()
+            # The pending hour counts in queries without being committed
+            if self.pending is not None:
+                key = tuple(k[0] for k in self._segment_keys(self.pending.index))
+                if self._selects(key, year, season, day_of_week):
+                    hour = key[3]
+                    if hour not in by_hour:
+                        by_hour[hour] = KLLSketch(self.k, seed=self._seed(key))
+                    by_hour[hour].update(self.pending.to_numpy())
+            if not by_hour:
+                raise KeyError(f'No data for {cache_key}')
+            overall = KLLSketch(self.k, seed=self._seed(cache_key))
+            for hour in sorted(by_hour):
+                overall.merge(by_hour[hour])
+            self._cache[cache_key] = (overall, by_hour)
+        return self._cache[cache_key]
+    
+    def peak_threshold(self, q=0.9, year=None, season=None, day_of_week=None):
+        """
+        Approximate q-quantile of hourly values for the selected segments.
+        
+        Parameters:
+        q (float): Quantile, 0.9 for the top 10% of traffic hours
+        year (int, optional): Restrict to one year
+        season (str, optional): Restrict to one season
+        day_of_week (str, optional): Restrict to one day name (e.g. 'Monday')
+        
+        Returns:
+        float: Peak threshold
+        """
+        overall, _ = self._merged(year, season, day_of_week)
+        return overall.quantile(q)
+    
+    def peak_hours(self, q=0.9, year=None, season=None, day_of_week=None):
+        """
+        Rank hours of day by how often they reach the peak threshold.
+        
+        Parameters:
+        q (float): Quantile defining the peak threshold
+        year, season, day_of_week: Optional segment filters, as in
+            peak_threshold
+        
+        Returns:
+        pandas.Series: Approximate number of peak hours per hour of day,
+            sorted in descending order (like value_counts)
+        """
+        overall, by_hour = self._merged(year, season, day_of_week)
+        threshold = overall.quantile(q)
+        counts = pd.Series({
+            hour: sketch.count_at_least(threshold)
+            for hour, sketch in sorted(by_hour.items())
+        }, name='count')
+        counts = counts[counts > 0].round().astype(int)
+        return counts.sort_values(ascending=False, kind='stable')
+
+#  ---
+# Sparse hourly aggregation
+#  ---
+
+@profiled
+def aggregate_hourly_sparse(df, value_cols=COUNT_COLS):
+    """
+    Hourly totals for the observed (date, hour) combinations only.
+    
+    Unlike grouping on categorical season/day-of-week/date/hour columns with
+    observed=False, no empty combinations are materialized. Rows are keyed
+    by integer date_key (days since 1970-01-01) and hour; calendar columns
+    can be derived from the date key afterwards with add_calendar_columns.
+    
+    Parameters:
+    df (pandas.DataFrame): Ticket counts with a Timestamp column
+    value_cols (list): Columns to sum
+    
+    Returns:
+    pandas.DataFrame: Columns date_key (int32), hour (int8) and the summed
+    value columns, sorted by date_key and hour; rows without a timestamp
+    are left out
+    """
+    ts = pd.to_datetime(df['Timestamp']).to_numpy()
+    # NaT is the minimum int64 and would overflow the int32 date key
+    valid = ~np.isnat(ts)
+    hour_key = ts[valid].astype('datetime64[h]').astype(np.int64)
+    codes, keys = pd.factorize(hour_key, sort=True)
+    
+    hourly = pd.DataFrame({
+        'date_key': (keys // 24).astype(np.int32),
+        'hour': (keys % 24).astype(np.int8)
+    })
+    for col in value_cols:
+        values = df[col].to_numpy()[valid]
+        sums = np.bincount(codes, weights=values, minlength=len(keys))
+        if np.issubdtype(values.dtype, np.integer):
+            sums = sums.round().astype(np.int64)
+        hourly[col] = sums
+    return hourly
+
+
+def add_calendar_columns(hourly, date_key_col='date_key'):
+    """
+    Derive date, year, season and day_of_week from an integer date key.
+    
+    Parameters:
+    hourly (pandas.DataFrame): Output of aggregate_hourly_sparse
+    date_key_col (str): Column with days since 1970-01-01
+    
+    Returns:
+    pandas.DataFrame: Copy with the calendar columns added (season as a
+    categorical ordered like SEASON_LABELS, as in the exploratory notebook,
+    limited to the seasons present so grouping on it adds no empty seasons)
+    """
+    hourly = hourly.copy()
+    dates = pd.DatetimeIndex(
+        hourly[date_key_col].to_numpy().astype('datetime64[D]')
+    )
+    hourly['date'] = dates
+    hourly['year'] = dates.year
+    seasons = season_of_month(dates.month)
+    hourly['season'] = pd.Categorical(
+        seasons, categories=[s for s in SEASON_LABELS if s in set(seasons)]
+    )
+    hourly['day_of_week'] = dates.day_name()
+    return hourly
+
+
+def flag_group_peaks(
+    df,
+    groupby_cols,
+    col_name='isMax',
+    value_col='Redemption Count'
+):
+    """
+    Flag the row with the highest value within each group, in one sort.
+    
+    Equivalent to marking groupby(groupby_cols)[value_col].idxmax(): ties
+    go to the first row in the frame's order. Rows are lexsorted by group,
+    descending value and row position, and the first row of each group run
+    is flagged. Only groups with at least one row exist, so no empty
+    (e.g. year, season) groups are considered.
+    
+    Parameters:
+    df (pandas.DataFrame): Data to flag
+    groupby_cols (list): Columns defining the groups
+    col_name (str): Name of the boolean flag column to add
+    value_col (str): Column to find the maximum of
+    
+    Returns:
+    pandas.DataFrame: Copy of df with the flag column
+    """
+    result = df.copy()
+    codes = []
+    sizes = []
+    for col in groupby_cols:
+        col_codes, uniques = pd.factorize(result[col])
+        codes.append(col_codes)
+        sizes.append(len(uniques))
+    # Rows with a missing group key are never flagged, as with groupby
+    has_key = np.logical_and.reduce([c >= 0 for c in codes])
+    group = np.ravel_multi_index(
+        [np.where(has_key, c, 0) for c in codes], sizes
+    )
+    
+    values = result[value_col].to_numpy(dtype=float)
+    # Row position as the last key, so ties resolve to the first row
+    order = np.lexsort((np.arange(len(values)), -values, group))
+    order = order[has_key[order] & ~np.isnan(values[order])]
+    sorted_group = group[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_group[1:] != sorted_group[:-1]
+    
+    flags = np.zeros(len(result), dtype=bool)
+    flags[order[first]] = True
+    result[col_name] = flags
+    return result
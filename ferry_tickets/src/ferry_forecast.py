@@ -0,0 +1,353 @@
+"""
+ferry_forecast.py
+
+Hourly ferry demand forecasting with seasonal baselines.
+
+Days are split into segments by season and day of week. Each segment keeps
+an exponentially smoothed 24-hour profile, updated every time a day of that
+segment is observed; the forecast for a future day is the current profile
+of its segment, optionally adjusted by per-hour linear weather effects
+fitted on the smoothing residuals. All segments and hours are updated
+together as NumPy array operations, and the model keeps its state and
+regression sufficient statistics so new days can be added without
+refitting from scratch.
+"""
+
+import pandas as pd
+import numpy as np
+
+from common.profiling import profiled
+from ferry_tickets.src.ferry_analysis import SEASON_LABELS
+
+DAY_NAMES = [
+    'Monday', 'Tuesday', 'Wednesday', 'Thursday',
+    'Friday', 'Saturday', 'Sunday'
+]
+N_SEGMENTS = len(SEASON_LABELS) * len(DAY_NAMES)
+
+
+def _segment_of_days(days):
+    """Segment number (season * 7 + day of week) for each day."""
+    season = (np.asarray(days.month) - 1) // 3
+    return season * len(DAY_NAMES) + np.asarray(days.dayofweek)
+
+
+def _daily_matrix(hourly, value_col):
+    """
+    Reshape hourly totals into a (days x 24) matrix of complete days.
+
+    Hours missing inside the range count as zero, as with resample; a
+    trailing day that has not reached 23:00 yet is dropped.
+    """
+    if isinstance(hourly, pd.DataFrame):
+        hourly = hourly[value_col]
+    hourly = hourly.sort_index()
+    start = hourly.index.min().floor('D')
+    end = hourly.index.max()
+    if end.hour < 23:
+        end = end.floor('D') - pd.Timedelta(hours=1)
+    index = pd.date_range(start, end, freq='h')
+    values = hourly.reindex(index, fill_value=0).to_numpy(dtype=float)
+    days = pd.DatetimeIndex(index[::24])
+    return days, values.reshape(-1, 24)
+
+
+def _weather_tensor(weather, days, weather_cols):
+    """
+    Weather features as a (days x 24 x features + 1) array with a constant.
+
+    Hours without weather data are NaN.
+    """
+    index = pd.date_range(days[0], periods=len(days) * 24, freq='h')
+    features = weather[weather_cols].reindex(index).to_numpy(dtype=float)
+    features = features.reshape(len(days), 24, len(weather_cols))
+    ones = np.ones((len(days), 24, 1))
+    return np.concatenate([ones, features], axis=2)
+
+
+class FerryDemandForecaster:
+    """
+    Seasonal exponential smoothing forecaster for hourly ferry demand.
+
+    Parameters:
+    alpha (float): Smoothing factor for the segment profiles (0-1]
+    value_col (str): Column to forecast when given a DataFrame
+    weather_cols (list, optional): Columns of the load_weather_data output
+        to use as regressors, e.g. ['temp_c', 'precip_mm']
+    ridge (float): L2 penalty of the weather regression
+    """
+
+    def __init__(
+        self,
+        alpha=0.3,
+        value_col='Redemption Count',
+        weather_cols=None,
+        ridge=1.0
+    ):
+        self.alpha = alpha
+        self.value_col = value_col
+        self.weather_cols = list(weather_cols) if weather_cols else []
+        self.ridge = ridge
+        self.profiles = np.full((N_SEGMENTS, 24), np.nan)
+        self.last_day = None
+        # Hours seen after last_day, waiting for the rest of their day
+        self.pending = None
+        n_features = len(self.weather_cols) + 1
+        self._xtx = np.zeros((24, n_features, n_features))
+        self._xty = np.zeros((24, n_features))
+
+    def _smooth(self, values, segments):
+        """
+        Run the profile updates for new days, all segments at once.
+
+        Days are laid out per segment in occurrence order, so step j updates
+        the j-th new day of every segment in a single vectorized operation.
+
+        Returns:
+        tuple: (prior, post) profiles for every day, i.e. the forecast
+        before the day was observed and the profile after updating with it
+        """
+        n_days = len(values)
+        order = np.argsort(segments, kind='stable')
+        sorted_segments = segments[order]
+        first = np.searchsorted(sorted_segments, np.arange(N_SEGMENTS))
+        occurrence = np.arange(n_days) - first[sorted_segments]
+        slots = np.full((N_SEGMENTS, occurrence.max() + 1), -1)
+        slots[sorted_segments, occurrence] = order
+
+        prior = np.empty_like(values)
+        post = np.empty_like(values)
+        for step in slots.T:
+            has_day = step >= 0
+            segs, day_idx = np.flatnonzero(has_day), step[has_day]
+            previous = self.profiles[segs]
+            observed = values[day_idx]
+            updated = np.where(
+                np.isnan(previous),
+                observed,
+                self.alpha * observed + (1 - self.alpha) * previous
+            )
+            prior[day_idx] = previous
+            post[day_idx] = updated
+            self.profiles[segs] = updated
+        return prior, post
+
+    def _regression_stats(self, features, residuals):
+        """Per-day, per-hour contributions to the normal equations."""
+        usable = ~(np.isnan(residuals) | np.isnan(features).any(axis=2))
+        x = np.where(usable[..., None], features, 0.0)
+        r = np.where(usable, residuals, 0.0)
+        xtx = np.einsum('dhi,dhj->dhij', x, x)
+        xty = np.einsum('dhi,dh->dhi', x, r)
+        return xtx, xty
+
+    def _solve(self, xtx, xty):
+        """Ridge coefficients for each hour (batched over leading axes)."""
+        penalty = self.ridge * np.eye(xtx.shape[-1])
+        return np.linalg.solve(xtx + penalty, xty[..., None])[..., 0]
+
+    @property
+    def coefficients(self):
+        """pandas.DataFrame: Weather coefficients per hour of day."""
+        return pd.DataFrame(
+            self._solve(self._xtx, self._xty),
+            columns=['intercept'] + self.weather_cols
+        ).rename_axis('hour')
+
+    def _observe(self, hourly, weather):
+        if isinstance(hourly, pd.DataFrame):
+            hourly = hourly[self.value_col]
+        if self.last_day is not None:
+            hourly = hourly[hourly.index >= self.last_day + pd.Timedelta(days=1)]
+        if self.pending is not None:
+            # New values win where they overlap the carried-over hours
+            hourly = hourly.combine_first(self.pending)
+        if len(hourly) == 0:
+            return
+        days, values = _daily_matrix(hourly, self.value_col)
+        # The trailing incomplete day is carried over to the next update
+        if len(days):
+            hourly = hourly[hourly.index >= days[-1] + pd.Timedelta(days=1)]
+        self.pending = hourly if len(hourly) else None
+        if len(days) == 0:
+            return
+        segments = _segment_of_days(days)
+        prior, _ = self._smooth(values, segments)
+        if self.weather_cols and weather is not None:
+            features = _weather_tensor(weather, days, self.weather_cols)
+            xtx, xty = self._regression_stats(features, values - prior)
+            self._xtx += xtx.sum(axis=0)
+            self._xty += xty.sum(axis=0)
+        self.last_day = days[-1]
+
+    @profiled
+    def fit(self, hourly, weather=None):
+        """
+        Fit the model from scratch.
+
+        Parameters:
+        hourly (pandas.Series or pandas.DataFrame): Hourly totals with a
+            DatetimeIndex (e.g. resample('h').sum() of the ticket counts)
+        weather (pandas.DataFrame, optional): Hourly weather, as returned by
+            common.weather_data.load_weather_data
+
+        Returns:
+        FerryDemandForecaster: The fitted model
+        """
+        self.profiles[:] = np.nan
+        self._xtx[:] = 0
+        self._xty[:] = 0
+        self.last_day = None
+        self.pending = None
+        self._observe(hourly, weather)
+        return self
+
+    @profiled
+    def update(self, hourly, weather=None):
+        """
+        Warm-start refit with newly arrived intervals.
+
+        Only complete days after the last fitted day are used, continuing
+        the smoothing and regression from their current state. Hours of a
+        day left incomplete by an earlier call are kept and completed with
+        the new data, so updating in pieces gives the same model as fitting
+        everything at once.
+
+        Parameters:
+        hourly (pandas.Series or pandas.DataFrame): Hourly totals, which may
+            overlap data already seen
+        weather (pandas.DataFrame, optional): Hourly weather for those days
+
+        Returns:
+        FerryDemandForecaster: The updated model
+        """
+        self._observe(hourly, weather)
+        return self
+
+    @profiled
+    def predict(self, horizon_days=7, start=None, weather=None):
+        """
+        Forecast hourly demand.
+
+        Parameters:
+        horizon_days (int): Number of days to forecast
+        start (str or datetime, optional): First day, defaults to the day
+            after the last fitted day
+        weather (pandas.DataFrame, optional): Forecast (or observed) hourly
+            weather for those days; hours without it use the baseline only
+
+        Returns:
+        pandas.Series: Forecast per hour, indexed by datetime
+        """
+        if self.last_day is None:
+            raise ValueError('Model has not been fitted')
+        start = (
+            self.last_day + pd.Timedelta(days=1) if start is None
+            else pd.Timestamp(start).floor('D')
+        )
+        days = pd.date_range(start, periods=horizon_days, freq='D')
+        forecast = self.profiles[_segment_of_days(days)]
+
+        if self.weather_cols and weather is not None:
+            features = _weather_tensor(weather, days, self.weather_cols)
+            beta = self._solve(self._xtx, self._xty)
+            effect = np.einsum('dhi,hi->dh', features, beta)
+            forecast = forecast + np.nan_to_num(effect)
+
+        index = pd.date_range(start, periods=horizon_days * 24, freq='h')
+        return pd.Series(
+            np.clip(forecast, 0, None).ravel(),
+            index=index,
+            name=f'{self.value_col} forecast'
+        )
+
+    def segment_profiles(self):
+        """
+        Current smoothed profile of every season/day-of-week segment.
+
+        Returns:
+        pandas.DataFrame: Rows per (season, day_of_week), columns per hour
+        """
+        index = pd.MultiIndex.from_product(
+            [SEASON_LABELS, DAY_NAMES], names=['season', 'day_of_week']
+        )
+        return pd.DataFrame(
+            self.profiles,
+            index=index,
+            columns=pd.RangeIndex(24, name='hour')
+        )
+
+
+@profiled
+def backtest_forecaster(
+    hourly,
+    weather=None,
+    horizons=range(1, 8),
+    min_history_days=365,
+    **model_kwargs
+):
+    """
+    Rolling-origin backtest of FerryDemandForecaster.
+
+    Every day after the first min_history_days is used as a forecast origin.
+    A single pass over the history gives the profile of every segment after
+    each day; the forecast made at origin o for day o + h is then the
+    latest profile of that day's segment as of o, looked up for all origins
+    and horizons at once. Weather coefficients are refitted at every origin
+    from cumulative normal equations, using the observed weather of the
+    target day as a stand-in for a weather forecast.
+
+    Parameters:
+    hourly (pandas.Series or pandas.DataFrame): Hourly totals
+    weather (pandas.DataFrame, optional): Hourly weather
+    horizons (iterable of int): Forecast horizons in days
+    min_history_days (int): Days of history before the first origin
+    **model_kwargs: Arguments for FerryDemandForecaster
+
+    Returns:
+    pandas.DataFrame: MAE, RMSE and WAPE of hourly forecasts per horizon
+    """
+    model = FerryDemandForecaster(**model_kwargs)
+    days, values = _daily_matrix(hourly, model.value_col)
+    segments = _segment_of_days(days)
+    _, post = model._smooth(values, segments)
+    n_days = len(days)
+
+    # latest[d, s]: index of the last day <= d in segment s (-1 if none)
+    latest = np.full((n_days, N_SEGMENTS), -1)
+    latest[np.arange(n_days), segments] = np.arange(n_days)
+    latest = np.maximum.accumulate(latest, axis=0)
+
+    use_weather = bool(model.weather_cols) and weather is not None
+    if use_weather:
+        features = _weather_tensor(weather, days, model.weather_cols)
+        prior = np.full_like(values, np.nan)
+        prev_day = np.full(n_days, -1)
+        prev_day[1:] = latest[np.arange(n_days - 1), segments[1:]]
+        has_prev = prev_day >= 0
+        prior[has_prev] = post[prev_day[has_prev]]
+        xtx, xty = model._regression_stats(features, values - prior)
+        beta = model._solve(np.cumsum(xtx, axis=0), np.cumsum(xty, axis=0))
+
+    rows = []
+    for h in horizons:
+        origins = np.arange(min_history_days - 1, n_days - h)
+        targets = origins + h
+        source = latest[origins, segments[targets]]
+        valid = source >= 0
+        origins, targets, source = origins[valid], targets[valid], source[valid]
+        forecast = post[source]
+        if use_weather:
+            effect = np.einsum('dhi,dhi->dh', features[targets], beta[origins])
+            forecast = forecast + np.nan_to_num(effect)
+        forecast = np.clip(forecast, 0, None)
+        errors = forecast - values[targets]
+        rows.append({
+            'horizon_days': h,
+            'origins': len(origins),
+            'mae': np.abs(errors).mean(),
+            'rmse': np.sqrt((errors ** 2).mean()),
+            'wape': np.abs(errors).sum() / values[targets].sum()
+        })
+
+    return pd.DataFrame(rows).set_index('horizon_days')
@@ -0,0 +1,62 @@
+"""
+Shared fixtures: small synthetic datasets in the shapes the Toronto Open
+Data portal returns them (see common/fake_ckan.py), and a local fake portal
+serving them.
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Modules import each other as common.* / ferry_tickets.*, as the notebooks do
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from common.fake_ckan import FakeCKANServer, sample_packages  # noqa: E402
+from common.profiling import SummarySink, disable_profiling, enable_profiling  # noqa: E402
+
+FERRY_PACKAGE = 'toronto-island-ferry-ticket-counts'
+PETS_PACKAGE = 'licensed-dog-and-cat-names'
+PROFILES_PACKAGE = 'neighbourhood-profiles'
+
+
+@pytest.fixture(scope='session')
+def packages():
+    return sample_packages(seed=0, years=(2022, 2023), n_neighbourhoods=40)
+
+
+@pytest.fixture
+def ferry_raw(packages):
+    """Raw ferry ticket counts, one row per 15-minute interval."""
+    return pd.read_csv(io.BytesIO(packages[FERRY_PACKAGE][0]['data']))
+
+
+@pytest.fixture
+def pet_resources(packages):
+    """Raw yearly pet name lists (no header row) with their resources."""
+    return [
+        (pd.read_csv(io.BytesIO(resource['data']), header=None), resource)
+        for resource in packages[PETS_PACKAGE]
+    ]
+
+
+@pytest.fixture
+def census_profile(packages):
+    """Raw neighbourhood profile: metric rows by neighbourhood columns."""
+    return pd.read_csv(io.BytesIO(packages[PROFILES_PACKAGE][0]['data']))
+
+
+@pytest.fixture(scope='session')
+def portal(packages):
+    with FakeCKANServer(packages) as server:
+        yield server
+
+
+@pytest.fixture
+def profile_sink():
+    sink = SummarySink()
+    enable_profiling(sink)
+    yield sink
+    disable_profiling()
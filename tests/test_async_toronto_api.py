@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from common.async_toronto_api import AsyncTorontoOpenDataAPI, fetch_resources  # noqa: E402
+from common.fake_ckan import FakeCKANServer  # noqa: E402
+from common.toronto_api import TorontoOpenDataAPI  # noqa: E402
+from tests.conftest import FERRY_PACKAGE, PETS_PACKAGE, PROFILES_PACKAGE  # noqa: E402
+
+
+def test_resources_match_sync_client(portal, packages):
+    requests = [(FERRY_PACKAGE, 0, {}), (PROFILES_PACKAGE, 0, {})] + [
+        (PETS_PACKAGE, idx, {'header': None})
+        for idx in range(len(packages[PETS_PACKAGE]))
+    ]
+    result = fetch_resources(requests, max_connections=2, base_url=portal.base_url)
+
+    assert list(result) == [(name, idx) for name, idx, _ in requests]
+    for name, idx, kwargs in requests:
+        api = TorontoOpenDataAPI(name, base_url=portal.base_url)
+        pd.testing.assert_frame_equal(
+            result[(name, idx)], api.get_resource_data(idx, **kwargs)
+        )
+
+
+def test_metadata_fetched_once_per_package(packages):
+    n_pets = len(packages[PETS_PACKAGE])
+    with FakeCKANServer(packages) as server:
+        fetch_resources(
+            [(PETS_PACKAGE, idx) for idx in range(n_pets)],
+            base_url=server.base_url
+        )
+        # One package_show, then one download per resource
+        assert server.requests == 1 + n_pets
+
+
+def test_gather_takes_about_the_slowest_request(packages):
+    latency = 0.3
+    requests = [FERRY_PACKAGE, PROFILES_PACKAGE, (PETS_PACKAGE, 0), (PETS_PACKAGE, 1)]
+    with FakeCKANServer(packages, latency=latency) as server:
+        start = time.perf_counter()
+        fetch_resources(requests, base_url=server.base_url)
+        elapsed = time.perf_counter() - start
+        sequential = server.requests * latency
+    # Metadata, then the downloads: two rounds of latency, not one per request
+    assert elapsed < sequential / 2
+
+
+def test_failures_returned_alongside_results(packages):
+    async def gather(server):
+        async with AsyncTorontoOpenDataAPI(base_url=server.base_url) as client:
+            return await client.gather_resources(
+                [FERRY_PACKAGE, (PETS_PACKAGE, 0), ('no-such-package', 0)],
+                return_exceptions=True
+            )
+
+    with FakeCKANServer(packages, failing=[PETS_PACKAGE]) as server:
+        result = asyncio.run(gather(server))
+    assert isinstance(result[(FERRY_PACKAGE, 0)], pd.DataFrame)
+    assert isinstance(result[(PETS_PACKAGE, 0)], Exception)
+    assert isinstance(result[('no-such-package', 0)], Exception)
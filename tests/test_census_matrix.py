@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.census_matrix import CensusMatrix, build_census_matrix, metric_paths
+from common.population_metrics import extract_population_metrics
+
+
+@pytest.fixture
+def wide_profile():
+    """Profile with nested metrics, text rows and missing values."""
+    rng = np.random.default_rng(1)
+    n_metrics, n_hoods = 30, 25
+    values = rng.normal(100, 30, (n_metrics, n_hoods)).round(1)
+    values[2] = values[1] * 2 + rng.normal(0, 1, n_hoods)
+    cells = values.astype(object)
+    cells[5, ::4] = 'x'
+    cells[7, 3] = None
+    names = [' ' * (i % 3) * 2 + f'Metric {i}' for i in range(n_metrics)]
+    df = pd.DataFrame(cells, columns=[f'Hood {j}' for j in range(n_hoods)])
+    df.insert(0, 'Neighbourhood Name', names)
+    return df
+
+
+def test_population_metrics_match_profile(census_profile, tmp_path):
+    matrix = build_census_matrix(census_profile, tmp_path)
+    pd.testing.assert_frame_equal(
+        matrix.population_metrics(), extract_population_metrics(census_profile)
+    )
+
+
+def test_matrix_is_memory_mapped_profile(wide_profile, tmp_path):
+    build_census_matrix(wide_profile, tmp_path)
+    matrix = CensusMatrix(tmp_path)
+    assert isinstance(matrix.values, np.memmap)
+    assert not matrix.values.flags.writeable
+
+    expected = wide_profile.iloc[:, 1:].apply(pd.to_numeric, errors='coerce')
+    np.testing.assert_array_equal(matrix.values, expected.to_numpy(dtype=np.float32))
+    assert list(matrix.neighbourhoods) == list(wide_profile.columns[1:])
+    assert matrix.metrics['path'][2] == 'Metric 0 > Metric 1 > Metric 2'
+    assert matrix.row('Metric 0 > Metric 1 > Metric 2') == matrix.row('Metric 2') == 2
+
+
+def test_metric_paths_follow_indentation():
+    paths, levels = metric_paths(['Total', '  Men', '    Young men', '  Women', 'Other'])
+    assert paths == ['Total', 'Total > Men', 'Total > Men > Young men',
+                     'Total > Women', 'Other']
+    assert levels == [0, 1, 2, 1, 0]
+
+
+def test_correlations_match_pandas(wide_profile, tmp_path):
+    matrix = build_census_matrix(wide_profile, tmp_path)
+    rows = list(range(10))
+    frame = matrix.frame(rows).astype(np.float64)
+    expected = frame.corr(min_periods=10)
+
+    result = matrix.correlations(rows)
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), atol=1e-9)
+    assert result.iloc[1, 2] > 0.99
+
+
+def test_percentile_ranks_match_pandas(wide_profile, tmp_path):
+    matrix = build_census_matrix(wide_profile, tmp_path)
+    expected = matrix.frame().rank(pct=True)
+    pd.testing.assert_frame_equal(matrix.percentile_ranks(), expected)
+
+
+def test_similar_neighbourhoods_match_loop(wide_profile, tmp_path):
+    matrix = build_census_matrix(wide_profile, tmp_path)
+    x = matrix.frame(matrix.numeric_rows()).astype(np.float64)
+    z = (x - x.mean()) / x.std(ddof=0)
+    target = z.loc['Hood 3']
+    distances = pd.Series({
+        name: np.sqrt(((z.loc[name] - target) ** 2).mean())
+        for name in z.index if name != 'Hood 3'
+    })
+
+    result = matrix.similar_neighbourhoods('Hood 3', n=5)
+    expected = distances.sort_values().head(5)
+    assert result['neighbourhood_name'].tolist() == expected.index.tolist()
+    np.testing.assert_allclose(result['distance'], expected.to_numpy())
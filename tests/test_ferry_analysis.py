@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.quantile_sketch import KLLSketch
+from ferry_tickets.src.ferry_analysis import (
+    COUNT_COLS, SEASON_LABELS, FerryPeakIndex, add_calendar_columns,
+    aggregate_hourly_sparse, analyze_ferry_patterns,
+    analyze_ferry_patterns_chunked, analyze_ferry_service_kpis,
+    analyze_ferry_service_kpis_chunked, flag_group_peaks, season_of_month
+)
+
+
+def _chunks(df, size):
+    return (df.iloc[start:start + size] for start in range(0, len(df), size))
+
+
+@pytest.mark.parametrize('chunk_size', [1_000, 7_777])
+def test_chunked_patterns_match_in_memory(ferry_raw, chunk_size):
+    expected = analyze_ferry_patterns(ferry_raw.copy())
+    result = analyze_ferry_patterns_chunked(_chunks(ferry_raw, chunk_size))
+    for scale in ('yearly', 'monthly', 'hourly'):
+        pd.testing.assert_frame_equal(result[scale], expected[scale])
+
+
+def test_chunked_kpis_match_in_memory(ferry_raw):
+    expected = analyze_ferry_service_kpis(ferry_raw.copy())
+    # Odd chunk size, so intervals of one hour land in different chunks
+    result = analyze_ferry_service_kpis_chunked(_chunks(ferry_raw, 4_999))
+    assert result['peak_service_hours'] == expected['peak_service_hours']
+    assert result['daily_capacity_stats'] == expected['daily_capacity_stats']
+    for key in ('service_utilization_rate', 'avg_weekly_growth_rate', 'unused_ticket_rate'):
+        assert result[key] == pytest.approx(expected[key])
+
+
+def test_chunked_patterns_reject_no_chunks():
+    with pytest.raises(ValueError):
+        analyze_ferry_patterns_chunked(iter([]))
+
+
+def _hourly_redemptions(raw):
+    ts = pd.to_datetime(raw['Timestamp'])
+    return raw.set_index(ts)['Redemption Count'].resample('h').sum()
+
+
+def test_peak_index_same_however_batched(ferry_raw):
+    whole = FerryPeakIndex().update(_hourly_redemptions(ferry_raw))
+    # Cut mid-hour, so both batches hold a partial total of the same hour
+    batched = FerryPeakIndex()
+    for start, stop in [(0, 10_001), (10_001, 40_003), (40_003, None)]:
+        batched.update(_hourly_redemptions(ferry_raw.iloc[start:stop]))
+    for filters in [{}, {'year': 2022}, {'season': 'Summer', 'day_of_week': 'Sunday'}]:
+        assert batched.peak_threshold(**filters) == whole.peak_threshold(**filters)
+        pd.testing.assert_series_equal(
+            batched.peak_hours(**filters), whole.peak_hours(**filters)
+        )
+    whole.flush()
+    batched.flush()
+    assert whole.peak_threshold() == batched.peak_threshold()
+
+
+def test_peak_index_threshold_within_error_bound(ferry_raw):
+    hourly = _hourly_redemptions(ferry_raw)
+    index = FerryPeakIndex(k=64).update(hourly).flush()
+    threshold = index.peak_threshold(0.9)
+    rank = (hourly < threshold).mean()
+    assert abs(rank - 0.9) <= KLLSketch.normalized_rank_error(64) + 1 / len(hourly)
+
+
+def test_merged_worker_indexes_within_error_bound(ferry_raw):
+    hourly = _hourly_redemptions(ferry_raw)
+    whole = FerryPeakIndex().update(hourly).flush()
+    middle = len(hourly) // 2
+    halves = [
+        FerryPeakIndex().update(part).flush()
+        for part in (hourly.iloc[:middle], hourly.iloc[middle:])
+    ]
+    merged = halves[0].merge(halves[1])
+    error = KLLSketch.normalized_rank_error(200)
+    assert abs((hourly < merged.peak_threshold()).mean() - 0.9) <= error + 1 / len(hourly)
+    assert abs((hourly < whole.peak_threshold()).mean() - 0.9) <= error + 1 / len(hourly)
+
+
+def test_sparse_hourly_matches_resample(ferry_raw):
+    raw = ferry_raw.iloc[::3].copy()
+    raw.loc[raw.index[5], 'Timestamp'] = None
+    result = add_calendar_columns(aggregate_hourly_sparse(raw))
+
+    ts = pd.to_datetime(raw['Timestamp'])
+    dense = raw.set_index(ts)[COUNT_COLS].resample('h').sum()
+    dense = dense.loc[ts.dropna().dt.floor('h').unique()]
+    hours = result['date'] + pd.to_timedelta(result['hour'], unit='h')
+    assert hours.tolist() == dense.index.tolist()
+    for col in COUNT_COLS:
+        assert result[col].tolist() == dense[col].tolist()
+    assert (result['season'].astype(str) == season_of_month(dense.index.month)).all()
+    assert (result['day_of_week'] == dense.index.day_name()).all()
+
+
+def test_group_peaks_match_idxmax():
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        'year': rng.choice([2022, 2023, None], 500),
+        'season': rng.choice(SEASON_LABELS, 500),
+        # Few distinct values, so many ties
+        'Redemption Count': rng.integers(0, 6, 500).astype(float)
+    }, index=rng.permutation(500))
+    df.iloc[::17, 2] = np.nan
+
+    result = flag_group_peaks(df, ['year', 'season'])
+    expected = df.groupby(['year', 'season'])['Redemption Count'].idxmax()
+    assert sorted(result.index[result['isMax']]) == sorted(expected)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from ferry_tickets.src.ferry_forecast import FerryDemandForecaster
+
+
+@pytest.fixture
+def hourly(ferry_raw):
+    ts = pd.to_datetime(ferry_raw['Timestamp'])
+    return ferry_raw.set_index(ts)[['Redemption Count']].resample('h').sum()
+
+
+@pytest.mark.parametrize('splits', [
+    ['2022-09-14 13:00'],
+    ['2022-03-01 05:00', '2022-03-01 17:00', '2023-06-30 23:00'],
+])
+def test_update_in_pieces_matches_fit(hourly, splits):
+    expected = FerryDemandForecaster().fit(hourly)
+
+    hour = pd.Timedelta(hours=1)
+    splits = [pd.Timestamp(s) for s in splits]
+    model = FerryDemandForecaster().fit(hourly[:splits[0] - hour])
+    for start, end in zip(splits, splits[1:] + [None]):
+        model.update(hourly[start:None if end is None else end - hour])
+
+    assert model.last_day == expected.last_day
+    np.testing.assert_allclose(model.profiles, expected.profiles)
+    pd.testing.assert_series_equal(model.predict(), expected.predict())
+
+
+def test_update_with_overlap_keeps_new_values(hourly):
+    split = pd.Timestamp('2022-09-14 13:00')
+    expected = FerryDemandForecaster().fit(hourly)
+    model = FerryDemandForecaster().fit(hourly[:split - pd.Timedelta(hours=1)])
+    # Re-sending hours already seen changes nothing
+    model.update(hourly[split - pd.Timedelta(days=3):])
+    np.testing.assert_allclose(model.profiles, expected.profiles)
+
+
+def test_partial_day_waits_for_the_rest(hourly):
+    model = FerryDemandForecaster().fit(hourly[:'2022-06-30'])
+    profiles = model.profiles.copy()
+    model.update(hourly['2022-07-01 00:00':'2022-07-01 11:00'])
+    assert model.last_day == pd.Timestamp('2022-06-30')
+    np.testing.assert_array_equal(model.profiles, profiles)
+    assert len(model.pending) == 12
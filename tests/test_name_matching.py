@@ -0,0 +1,84 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from common.data_processors import PetNamesProcessor
+from common.name_matching import (
+    NameCanonicalizer, blocking_keys, normalize_names, phonetic_keys
+)
+
+
+def _dice(a, b):
+    a, b = '^' + a + '$', '^' + b + '$'
+    left = {a[i:i + 2] for i in range(len(a) - 1)}
+    right = {b[i:i + 2] for i in range(len(b) - 1)}
+    return 2 * len(left & right) / (len(left) + len(right))
+
+
+def test_variants_merged_into_heaviest_spelling():
+    names = pd.Series(['Coco', 'KOKO', 'Mr. Bean', 'MR BEAN', 'mr-bean', 'LUNA', 'NO NAME'])
+    weights = pd.Series([5, 20, 3, 1, 1, 9, 50])
+    result = NameCanonicalizer().canonicalize(names, weights)
+    assert result.tolist() == ['KOKO', 'KOKO', 'MR BEAN', 'MR BEAN', 'MR BEAN', 'LUNA', 'NO NAME']
+
+
+def test_missing_names_stay_missing():
+    names = pd.Series(['LUNA', None, np.nan, 'LOONA'])
+    result = NameCanonicalizer().canonicalize(names)
+    assert result.isna().tolist() == [False, True, True, False]
+    assert 'NAN' not in result.tolist()
+
+
+def test_excluded_names_never_merged():
+    canonicalizer = NameCanonicalizer(exclude=['NO NAME', 'NO NAMES'])
+    result = canonicalizer.canonicalize(pd.Series(['NO NAME', 'NO NAMES']))
+    assert result.tolist() == ['NO NAME', 'NO NAMES']
+
+
+def test_blocked_pairs_match_all_pairs():
+    rng = np.random.default_rng(0)
+    letters = np.array(list('ABCEIKLMOSYZ'))
+    names = pd.Series(sorted({
+        ''.join(rng.choice(letters, rng.integers(3, 7))) for _ in range(400)
+    }))
+    keys = phonetic_keys(normalize_names(names))
+    blocks = blocking_keys(keys)
+    canonicalizer = NameCanonicalizer(threshold=0.6)
+
+    left, right = canonicalizer._similar_pairs(keys, blocks)
+    expected = {
+        (i, j) for i, j in combinations(range(len(keys)), 2)
+        if blocks[i] == blocks[j] and _dice(keys[i], keys[j]) >= 0.6
+    }
+    assert set(zip(left.tolist(), right.tolist())) == expected
+    assert expected
+
+
+def test_cached_mapping_reused(tmp_path):
+    path = tmp_path / 'names.json'
+    first = NameCanonicalizer(cache_path=path)
+    first.canonicalize(pd.Series(['COCO', 'KOKO']), pd.Series([1, 2]))
+
+    cached = NameCanonicalizer(cache_path=path)
+    assert cached.mapping == first.mapping
+    cached.fit = None  # known names must not trigger a refit
+    assert cached.canonicalize(pd.Series(['coco'])).tolist() == ['KOKO']
+
+
+def test_canonicalized_totals_keep_counts(pet_resources):
+    processor = PetNamesProcessor(canonicalizer=NameCanonicalizer())
+    df = pd.concat(
+        [processor.process_resource(raw, resource) for raw, resource in pet_resources],
+        ignore_index=True
+    )
+    result = processor.post_process(df.copy())
+    plain = PetNamesProcessor().post_process(df.copy())
+
+    assert result['count'].sum() == plain['count'].sum()
+    assert len(result) < len(plain)
+    assert not {'COCO', 'KOKO'} <= set(result['name'])
+    totals = result.groupby(['year', 'species'], observed=True)['count'].sum()
+    pd.testing.assert_series_equal(
+        totals, plain.groupby(['year', 'species'], observed=True)['count'].sum()
+    )
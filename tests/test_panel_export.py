@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.panel_export import YearPanel
+
+
+@pytest.fixture
+def base():
+    n = 50
+    return pd.DataFrame({
+        'id': np.arange(n),
+        # Missing in the first rows, so the first chunks hold only nulls
+        'note': [None] * 20 + [f'note {i}' for i in range(20, n)],
+        'opened': pd.Timestamp('2015-01-01') + pd.to_timedelta(np.arange(n) * 60, unit='D'),
+        'closed': [np.nan] * 40 + [2019.0] * 10
+    })
+
+
+def _cross_join(base, start_year, end_year):
+    years = pd.DataFrame({'year': range(start_year, end_year + 1)})
+    panel = base.merge(years, how='cross')
+    valid = (
+        (panel['year'] >= panel['opened'].dt.year)
+        & (panel['year'] <= panel['closed'].fillna(end_year))
+    )
+    return panel[valid].reset_index(drop=True)
+
+
+def _panel(base):
+    return YearPanel(base, 2014, 2022, start_col='opened', end_col='closed')
+
+
+def test_chunks_match_cross_join(base):
+    expected = _cross_join(base, 2014, 2022)
+    panel = _panel(base)
+    assert len(panel) == len(expected)
+    result = pd.concat(panel.iter_chunks(chunk_rows=17), ignore_index=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_csv_matches_cross_join(base, tmp_path):
+    path = tmp_path / 'panel.csv'
+    expected = _cross_join(base, 2014, 2022)
+    assert _panel(base).to_csv(path, chunk_rows=17) == len(expected)
+    expected.to_csv(tmp_path / 'expected.csv', index=False)
+    assert path.read_text() == (tmp_path / 'expected.csv').read_text()
+
+
+def test_empty_csv_replaces_old_file(base, tmp_path):
+    path = tmp_path / 'panel.csv'
+    _panel(base).to_csv(path)
+    assert YearPanel(base, 2030, 2029).to_csv(path) == 0
+    assert path.read_text().strip() == 'id,note,opened,closed,year'
+
+
+def test_parquet_keeps_types_of_null_first_chunks(base, tmp_path):
+    path = tmp_path / 'panel.parquet'
+    _panel(base).to_parquet(path, chunk_rows=17)
+    result = pd.read_parquet(path)
+    pd.testing.assert_frame_equal(result, _cross_join(base, 2014, 2022))
+
+    assert YearPanel(base, 2030, 2029).to_parquet(path) == 0
+    empty = pd.read_parquet(path)
+    assert empty.empty and list(empty.columns) == list(result.columns)
+
+
+def test_hyper_row_count(base, tmp_path):
+    hyperapi = pytest.importorskip('tableauhyperapi')
+    path = tmp_path / 'panel.hyper'
+    written = _panel(base).to_hyper(str(path), chunk_rows=17)
+    telemetry = hyperapi.Telemetry.DO_NOT_SEND_USAGE_DATA_TO_TABLEAU
+    with hyperapi.HyperProcess(telemetry) as hyper:
+        with hyperapi.Connection(hyper.endpoint, str(path)) as connection:
+            count = connection.execute_scalar_query(
+                'SELECT COUNT(*) FROM "Extract"'
+            )
+    assert count == written == len(_cross_join(base, 2014, 2022))
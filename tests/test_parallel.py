@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common import parallel
+from common.data_processors import PetNamesProcessor
+from common.parallel import SharedMemoryExecutor, parallel_groupby_agg
+from ferry_tickets.src.ferry_analysis import (
+    analyze_ferry_patterns, analyze_ferry_service_kpis
+)
+
+AGG = {'a': 'sum', 'b': 'count', 'c': 'mean'}
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with SharedMemoryExecutor(max_workers=2) as pool:
+        yield pool
+
+
+@pytest.fixture
+def always_parallel(monkeypatch):
+    """Go parallel whatever the input size, as on a large input."""
+    monkeypatch.setattr(parallel, 'MIN_PARALLEL_ROWS', 0)
+    monkeypatch.setattr(parallel, 'MIN_ROWS_PER_JOB', 1)
+
+
+def _frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    names = np.array(['LUNA', 'COCO', 'MAX', None], dtype=object)
+    return pd.DataFrame({
+        'year': rng.integers(2015, 2024, n),
+        'day': pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 30, n), unit='D'),
+        'name': names[rng.integers(0, len(names), n)],
+        'a': rng.poisson(20, n),
+        'b': np.where(rng.random(n) < 0.1, np.nan, rng.random(n)),
+        'c': rng.random(n)
+    })
+
+
+@pytest.mark.parametrize('by', [
+    'year', 'day', 'name', ['year', 'name'], ['name', 'day']
+])
+def test_matches_pandas_groupby(executor, always_parallel, by):
+    df = _frame(20_000)
+    expected = df.groupby(by, observed=True).agg(AGG)
+    result = parallel_groupby_agg(df, by, AGG, n_jobs=2, executor=executor)
+    pd.testing.assert_frame_equal(result, expected, check_index_type=False)
+
+
+def test_categorical_keys_match_pandas_groupby(executor, always_parallel):
+    df = _frame(20_000).astype({'name': 'category', 'year': 'category'})
+    expected = df.groupby(['year', 'name'], observed=True).agg(AGG)
+    result = parallel_groupby_agg(df, ['year', 'name'], AGG, executor=executor)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_reused_buffers_follow_input_size(executor, always_parallel):
+    # Growing, then shrinking inputs on the same executor and buffers
+    for n, seed in [(1_000, 1), (30_000, 2), (500, 3)]:
+        df = _frame(n, seed)
+        pd.testing.assert_frame_equal(
+            parallel_groupby_agg(df, ['year', 'day'], AGG, executor=executor),
+            df.groupby(['year', 'day']).agg(AGG)
+        )
+
+
+def test_own_pool_without_executor(always_parallel):
+    df = _frame(5_000)
+    pd.testing.assert_frame_equal(
+        parallel_groupby_agg(df, 'year', AGG, n_jobs=2),
+        df.groupby('year').agg(AGG)
+    )
+
+
+def test_small_input_runs_serially(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('went parallel')
+
+    monkeypatch.setattr(parallel, 'ProcessPoolExecutor', fail)
+    df = _frame(1_000)
+    pd.testing.assert_frame_equal(
+        parallel_groupby_agg(df, 'year', AGG, n_jobs=4),
+        df.groupby('year').agg(AGG)
+    )
+
+
+def test_unsupported_aggregation():
+    with pytest.raises(ValueError):
+        parallel_groupby_agg(_frame(10), 'year', {'a': 'median'})
+
+
+def test_ferry_analyses_same_in_parallel(ferry_raw, executor, always_parallel):
+    expected = analyze_ferry_patterns(ferry_raw.copy())
+    result = analyze_ferry_patterns(ferry_raw.copy(), executor=executor)
+    for scale in ('yearly', 'monthly', 'hourly'):
+        pd.testing.assert_frame_equal(result[scale], expected[scale])
+
+    expected = analyze_ferry_service_kpis(ferry_raw.copy())
+    result = analyze_ferry_service_kpis(ferry_raw.copy(), n_jobs=2)
+    assert result == expected
+
+
+def test_pet_totals_same_in_parallel(pet_resources, executor, always_parallel):
+    processor = PetNamesProcessor()
+    df = pd.concat(
+        [processor.process_resource(raw, resource) for raw, resource in pet_resources],
+        ignore_index=True
+    )
+    expected = processor.post_process(df.copy())
+    result = processor.post_process(df.copy(), executor=executor)
+    pd.testing.assert_frame_equal(
+        result.reset_index(drop=True), expected.reset_index(drop=True)
+    )
+    assert isinstance(result['name'].dtype, pd.CategoricalDtype)
@@ -0,0 +1,76 @@
+import threading
+
+import pandas as pd
+
+from common.profiling import (
+    SummarySink, disable_profiling, enable_profiling, profile_block, profiled,
+    record_bytes
+)
+from common.toronto_api import TorontoOpenDataAPI
+from tests.conftest import FERRY_PACKAGE
+
+
+@profiled
+def _double(df):
+    record_bytes(10)
+    return pd.concat([df, df])
+
+
+def test_profiled_records_rows_and_propagates_bytes(profile_sink):
+    with profile_block('outer') as outer:
+        _double(pd.DataFrame({'a': range(3)}))
+    records = profile_sink.to_frame().set_index('name')
+    inner = records.loc[f'{__name__}._double']
+    assert (inner['rows_in'], inner['rows_out']) == (3, 6)
+    assert inner['bytes_downloaded'] == 10
+    assert outer.bytes_downloaded == 10
+
+
+def test_disabled_profiling_records_nothing():
+    sink = SummarySink()
+    enable_profiling(sink)
+    disable_profiling()
+    with profile_block('block') as record:
+        _double(pd.DataFrame({'a': [1]}))
+    assert record is None
+    assert sink.to_frame().empty
+
+
+def test_resource_download_and_parse_profiled_separately(portal, packages, profile_sink):
+    api = TorontoOpenDataAPI(FERRY_PACKAGE, base_url=portal.base_url)
+    # Metadata is fetched on first use; fetch it first, outside get_resource_data
+    api.package_metadata
+    df = api.get_resource_data()
+    assert len(df) > 0
+    records = profile_sink.to_frame().set_index('name')
+    download = records.loc['common.toronto_api.TorontoOpenDataAPI._download']
+    assert download['bytes_downloaded'] == len(packages[FERRY_PACKAGE][0]['data'])
+    assert records.loc['parse', 'bytes_downloaded'] == 0
+    get_data = records.loc['common.toronto_api.TorontoOpenDataAPI.get_resource_data']
+    assert get_data['bytes_downloaded'] == download['bytes_downloaded']
+
+
+def test_peak_memory_dropped_for_overlapping_threads():
+    sink = SummarySink()
+    enable_profiling(sink, track_memory=True)
+    try:
+        with profile_block('alone'):
+            data = [0] * 100_000
+        started = threading.Barrier(2)
+
+        def work(name):
+            with profile_block(name):
+                started.wait()
+                data = [0] * 100_000
+                started.wait()
+
+        threads = [threading.Thread(target=work, args=(f't{i}',)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        disable_profiling()
+    peaks = sink.to_frame().set_index('name')['peak_memory']
+    assert peaks['alone'] >= 800_000
+    assert peaks[['t0', 't1']].isna().all()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from common.quantile_sketch import KLLSketch
+
+
+@pytest.fixture(scope='module')
+def values():
+    return np.random.default_rng(7).lognormal(3, 1, 50_000)
+
+
+def test_exact_below_capacity():
+    values = np.arange(100, dtype=float)
+    sketch = KLLSketch(k=200).update(values)
+    assert sketch.quantile(0.5) == np.quantile(values, 0.5, method='inverted_cdf')
+    assert sketch.rank(49) == 0.5
+
+
+@pytest.mark.parametrize('k', [32, 200])
+def test_rank_error_within_bound(values, k):
+    sketch = KLLSketch(k=k).update(values)
+    qs = np.linspace(0.05, 0.95, 19)
+    ranks = np.searchsorted(np.sort(values), sketch.quantile(qs), side='right') / len(values)
+    # Each query is within the bound with 99% confidence; allow one miss
+    assert (np.abs(ranks - qs) > KLLSketch.normalized_rank_error(k)).sum() <= 1
+
+
+def test_same_sketch_however_batched(values):
+    whole = KLLSketch().update(values)
+    batched = KLLSketch()
+    for part in np.array_split(values, 13):
+        batched.update(part)
+    assert whole.n == batched.n
+    for a, b in zip(whole.levels, batched.levels):
+        np.testing.assert_array_equal(np.sort(a), np.sort(b))
+
+
+def test_copy_keeps_rng_state(values):
+    sketch = KLLSketch(k=16).update(values[:1_000])
+    copy = sketch.copy()
+    sketch.update(values[1_000:5_000])
+    copy.update(values[1_000:5_000])
+    assert sketch.quantile(0.9) == copy.quantile(0.9)
+
+
+def test_merge_counts_all_values(values):
+    left = KLLSketch().update(values[:20_000])
+    right = KLLSketch().update(values[20_000:])
+    merged = left.merge(right)
+    assert len(merged) == len(values)
+    rank = (values <= merged.quantile(0.5)).mean()
+    assert abs(rank - 0.5) <= KLLSketch.normalized_rank_error(200)
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from common import query_service
+from common.data_processors import PetNamesProcessor
+from common.population_metrics import extract_population_metrics
+from common.query_service import DatasetStore, QueryService, make_server
+
+
+@pytest.fixture
+def paths(tmp_path, ferry_raw, pet_resources, census_profile):
+    processor = PetNamesProcessor()
+    pets = processor.post_process(pd.concat(
+        [processor.process_resource(raw, resource) for raw, resource in pet_resources],
+        ignore_index=True
+    ))
+    paths = {
+        'ferry': tmp_path / 'ferry.csv',
+        'pets': tmp_path / 'pets.csv',
+        'neighbourhoods': tmp_path / 'neighbourhoods.csv'
+    }
+    ferry_raw.to_csv(paths['ferry'], index=False)
+    pets.to_csv(paths['pets'], index=False)
+    metrics = extract_population_metrics(census_profile)
+    metrics.to_csv(paths['neighbourhoods'], index=False)
+    return paths
+
+
+@pytest.fixture
+def service(paths):
+    return QueryService(DatasetStore(paths, check_interval=0))
+
+
+def _get(service, path, **params):
+    status, body = service.handle(path, {k: str(v) for k, v in params.items()})
+    return status, json.loads(body)
+
+
+def test_ferry_patterns_match_analysis(service):
+    status, body = _get(service, '/ferry/patterns', scale='monthly', year=2023)
+    assert status == 200
+    expected = service.store.ferry_analyses['monthly'].loc[2023]
+    assert [row['Sales Count'] for row in body['data']] == expected['Sales Count'].tolist()
+
+
+def test_bad_requests(service):
+    assert _get(service, '/ferry/patterns', scale='hourly', year=2023)[0] == 400
+    assert _get(service, '/ferry/patterns', scale='daily')[0] == 400
+    assert _get(service, '/pets/top', n='ten')[0] == 400
+    assert _get(service, '/nowhere')[0] == 404
+
+
+def test_handler_error_is_500(service, monkeypatch):
+    def broken(store, params):
+        raise KeyError('boom')
+
+    monkeypatch.setitem(query_service.ENDPOINTS, '/health', broken)
+    status, body = _get(service, '/health')
+    assert status == 500
+    assert 'KeyError' in body['error']
+
+
+def test_responses_cached_until_files_change(service, paths):
+    first = service.handle('/pets/top', {'n': '3'})
+    assert service.handle('/pets/top', {'n': '3'}) is first
+    assert service.cache.hits == 1
+
+    pets = pd.read_csv(paths['pets'])
+    pets.loc[pets['rank'] == 1, 'count'] += 1000
+    pets.to_csv(paths['pets'], index=False)
+    os.utime(paths['pets'], ns=(1, 1))
+    second = service.handle('/pets/top', {'n': '3'})
+    assert second != first
+    assert service.cache.hits == 1
+
+
+def test_server_round_trip(service):
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = server.server_address[1]
+        url = f'http://127.0.0.1:{port}/neighbourhoods?n=5&order=asc'
+        with urllib.request.urlopen(url) as response:
+            body = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+    need = [row['service_need_index'] for row in body['data']]
+    assert len(need) == 5 and need == sorted(need)
@@ -0,0 +1,61 @@
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from common import refresh
+from common.refresh import Job, JobScheduler, RefreshSettings
+from common.refresh_check import run_check
+
+
+def test_offline_refresh_end_to_end(tmp_path):
+    assert run_check(tmp_path) == []
+
+
+def test_fake_portal_writes_to_a_temporary_directory(capsys, monkeypatch, tmp_path):
+    # Where the real outputs live; the fake portal must not write there
+    monkeypatch.setattr(refresh, 'REPO_ROOT', tmp_path)
+    assert refresh.main(['--fake-portal', 'neighbourhoods']) == 0
+
+    output_root = Path(capsys.readouterr().out.splitlines()[-1].split(' under ')[-1])
+    assert output_root != tmp_path
+    assert list(tmp_path.iterdir()) == []
+    assert RefreshSettings(output_root).output('neighbourhoods').exists()
+    shutil.rmtree(output_root)
+
+
+def test_scheduler_keeps_within_budgets():
+    running, peak = [], {'cpus': 0, 'connections': 0}
+    lock = threading.Lock()
+
+    def work(job):
+        def run(settings, session):
+            with lock:
+                running.append(job)
+                for r in peak:
+                    peak[r] = max(peak[r], sum(getattr(j, r) for j in running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(job)
+            return 1
+        return run
+
+    jobs = []
+    for i in range(6):
+        job = Job(f'job{i}', None, cpus=1, connections=1 + i % 2)
+        job.func = work(job)
+        jobs.append(job)
+    results = JobScheduler(max_cpus=2, max_connections=2).run(jobs, RefreshSettings())
+
+    assert [r.status for r in results] == ['ok'] * 6
+    assert peak == {'cpus': 2, 'connections': 2}
+
+
+def test_failed_job_reported_without_stopping_others():
+    def fail(settings, session):
+        raise ValueError('boom')
+
+    jobs = [Job('bad', fail), Job('good', lambda settings, session: 3)]
+    results = JobScheduler(max_cpus=1).run(jobs, RefreshSettings())
+    assert [(r.status, r.written) for r in results] == [('failed', None), ('ok', 3)]
+    assert results[0].error == 'ValueError: boom'
@@ -0,0 +1,106 @@
+import asyncio
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from common.async_toronto_api import AsyncTorontoOpenDataAPI
+from common.fake_ckan import FakeCKANServer
+from common.snapshot_store import SnapshotStore, chunk_boundaries
+from common.toronto_api import TorontoOpenDataAPI
+from tests.conftest import FERRY_PACKAGE, PETS_PACKAGE
+
+
+def test_chunk_boundaries_survive_appends(packages):
+    data = packages[FERRY_PACKAGE][0]['data']
+    head = chunk_boundaries(data[:len(data) // 2])
+    whole = chunk_boundaries(data)
+    # Only the chunk at the old end moves; every earlier cut is kept
+    assert head[:-1] == whole[:len(head) - 1]
+
+
+def test_appended_version_stores_only_new_bytes(tmp_path, packages):
+    data = packages[FERRY_PACKAGE][0]['data']
+    old = data[:data.rindex(b'\n', 0, len(data) * 9 // 10) + 1]
+    store = SnapshotStore(tmp_path)
+    resource = {'id': 'ferry', 'name': 'ferry', 'format': 'CSV', 'position': 0}
+
+    first = store.put(FERRY_PACKAGE, resource, old, datetime(2024, 1, 1))
+    second = store.put(FERRY_PACKAGE, resource, data, datetime(2024, 2, 1))
+    assert second['new_bytes'] < first['new_bytes'] / 2
+    # Identical download is not stored again
+    assert store.put(FERRY_PACKAGE, resource, data)['fetched_at'] == second['fetched_at']
+
+    assert store.get(FERRY_PACKAGE, 'ferry', '2024-01-01')[0] == old
+    assert store.get(FERRY_PACKAGE, 'ferry', '2024-01-31')[0] == old
+    assert store.get(FERRY_PACKAGE, 'ferry')[0] == data
+    with pytest.raises(KeyError):
+        store.get(FERRY_PACKAGE, 'ferry', '2023-12-31')
+    assert len(store.versions(FERRY_PACKAGE, 'ferry')) == 2
+
+
+def test_find_uses_stored_positions(tmp_path):
+    store = SnapshotStore(tmp_path)
+    store.put('pkg', {'id': 'a', 'name': 'a', 'position': 0}, b'a', datetime(2024, 1, 1))
+    # Later, b takes over position 0
+    store.put('pkg', {'id': 'b', 'name': 'b', 'position': 0}, b'b', datetime(2024, 3, 1))
+
+    assert store.find('pkg', position=0, as_of='2024-02-01')['resource_id'] == 'a'
+    assert store.find('pkg', position=0)['resource_id'] == 'b'
+    assert store.find('pkg', name='a')['resource_id'] == 'a'
+    with pytest.raises(KeyError):
+        store.find('pkg', position=1)
+    with pytest.raises(KeyError):
+        store.find('other', position=0)
+
+
+@pytest.fixture
+def changing_portal(packages):
+    """Portal whose pet-name resources can be removed during a test."""
+    with FakeCKANServer({PETS_PACKAGE: list(packages[PETS_PACKAGE])}) as server:
+        yield server
+
+
+def test_as_of_loads_without_the_portal(tmp_path, changing_portal):
+    store = SnapshotStore(tmp_path)
+    api = TorontoOpenDataAPI(
+        PETS_PACKAGE, snapshot_store=store, base_url=changing_portal.base_url
+    )
+    live = api.get_resource_data(2, header=None)
+    changing_portal.packages[PETS_PACKAGE] = changing_portal.packages[PETS_PACKAGE][:1]
+
+    requests = changing_portal.requests
+    offline = TorontoOpenDataAPI(
+        PETS_PACKAGE, snapshot_store=store, base_url=changing_portal.base_url
+    )
+    stored = offline.get_resource_data(2, as_of=datetime.now(), header=None)
+    pd.testing.assert_frame_equal(stored, live)
+    assert changing_portal.requests == requests
+
+    # The resource is gone from the portal
+    with pytest.raises(KeyError):
+        offline.get_resource_data(2)
+    with pytest.raises(KeyError):
+        offline.get_resource_data(5, as_of=datetime.now())
+
+
+def test_async_as_of_loads_without_the_portal(tmp_path, changing_portal, packages):
+    store = SnapshotStore(tmp_path)
+    expected = pd.read_csv(io.BytesIO(packages[PETS_PACKAGE][1]['data']), header=None)
+    TorontoOpenDataAPI(
+        PETS_PACKAGE, snapshot_store=store, base_url=changing_portal.base_url
+    ).get_resource_data(1)
+    changing_portal.packages[PETS_PACKAGE] = []
+    requests = changing_portal.requests
+
+    async def load():
+        async with AsyncTorontoOpenDataAPI(
+            snapshot_store=store, base_url=changing_portal.base_url
+        ) as api:
+            return await api.get_resource_data(
+                PETS_PACKAGE, 1, as_of=datetime.now(), header=None
+            )
+
+    pd.testing.assert_frame_equal(asyncio.run(load()), expected)
+    assert changing_portal.requests == requests
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.population_metrics import (
+    calculate_service_need_index, extract_population_metrics
+)
+from common.spatial_access import (
+    ServiceLocator, accessibility_metrics, haversine_km
+)
+
+
+@pytest.fixture
+def services():
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({
+        'longitude': rng.uniform(-79.6, -79.1, 60),
+        'latitude': rng.uniform(43.6, 43.85, 60),
+        'type': rng.choice(['youth', 'adult'], 60)
+    })
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(2)
+    points = pd.DataFrame({
+        'longitude': rng.uniform(-79.6, -79.1, 200),
+        'latitude': rng.uniform(43.6, 43.85, 200),
+        'neighbourhood': rng.integers(0, 10, 200),
+        'population': rng.integers(100, 1_000, 200)
+    })
+    points.loc[[3, 50], 'longitude'] = np.nan
+    return points
+
+
+def _brute_force_km(points, services):
+    return haversine_km(
+        points['longitude'].to_numpy()[:, None],
+        points['latitude'].to_numpy()[:, None],
+        services['longitude'].to_numpy()[None, :],
+        services['latitude'].to_numpy()[None, :]
+    )
+
+
+def test_queries_match_brute_force(points, services):
+    locator = ServiceLocator.from_frame(services)
+    lon, lat = points['longitude'], points['latitude']
+    distances, positions = locator.nearest(lon, lat, k=3)
+    all_km = _brute_force_km(points, services)
+
+    ok = points['longitude'].notna().to_numpy()
+    np.testing.assert_allclose(distances[ok], np.sort(all_km[ok], axis=1)[:, :3])
+    np.testing.assert_array_equal(positions[ok, 0], all_km[ok].argmin(axis=1))
+    counts = locator.count_within(lon, lat, 5)
+    np.testing.assert_array_equal(counts[ok], (all_km[ok] <= 5).sum(axis=1))
+
+
+def test_missing_coordinates_are_nan(points, services):
+    lon, lat = points['longitude'], points['latitude']
+    missing = lon.isna().to_numpy()
+    for locator in (ServiceLocator.from_frame(services), ServiceLocator([], [])):
+        distances, positions = locator.nearest(lon, lat)
+        assert np.isnan(distances[missing]).all()
+        assert (positions[missing] == -1).all()
+        assert np.isnan(locator.count_within(lon, lat, 5)[missing]).all()
+    # No services at all: every located point is infinitely far
+    assert np.isinf(ServiceLocator([], []).nearest(lon, lat)[0][~missing]).all()
+
+
+def test_group_means_skip_missing_points(points, services):
+    result = accessibility_metrics(
+        points, services, radius_km=5, type_col='type',
+        group_col='neighbourhood', weight_col='population'
+    )
+    per_point = accessibility_metrics(
+        points.dropna(), services, radius_km=5, type_col='type'
+    )
+    weights = per_point['population']
+    for col in ('nearest_service_km', 'services_within_km_youth'):
+        expected = (per_point[col] * weights).groupby(per_point['neighbourhood']).sum()
+        expected /= weights.groupby(per_point['neighbourhood']).sum()
+        np.testing.assert_allclose(result[col], expected)
+    assert result.notna().all().all()
+
+
+def test_need_index_with_missing_access(census_profile):
+    metrics = extract_population_metrics(census_profile)
+    base = calculate_service_need_index(metrics)
+    metrics['nearest_service_km'] = np.linspace(0.5, 3, len(metrics))
+    metrics.loc[0, 'nearest_service_km'] = np.nan
+    metrics.loc[1, 'nearest_service_km'] = np.inf
+
+    index = calculate_service_need_index(metrics, {'nearest_service_km': 0.3})
+    assert index.notna().all()
+    # Missing values count as the average distance
+    norm = metrics['nearest_service_km'].iloc[2:] / 3
+    np.testing.assert_allclose(index.iloc[:2], base.iloc[:2] + 0.3 * norm.mean())
+    np.testing.assert_allclose(index.iloc[2:], base.iloc[2:] + 0.3 * norm)
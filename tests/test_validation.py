@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from common.data_processors import FerryDataProcessor, PetNamesProcessor
+from common.validation import DataValidator, SchemaError
+
+
+def test_pet_names_same_with_validator(pet_resources):
+    validator = DataValidator(PetNamesProcessor.schema)
+    for raw, resource in pet_resources:
+        expected = PetNamesProcessor().process_resource(raw, resource)
+        result = PetNamesProcessor(validator).process_resource(raw, resource)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+    assert all(report.ok for report in validator.reports)
+
+
+def test_bad_pet_rows_quarantined(pet_resources):
+    raw, resource = pet_resources[0]
+    raw = raw.astype({1: object})
+    raw.iloc[0, 1] = 'many'
+    raw.iloc[1, 1] = -3
+    raw.iloc[2, 1] = ''
+    validator = DataValidator(PetNamesProcessor.schema)
+    result = PetNamesProcessor(validator).process_resource(raw, resource)
+
+    report = validator.reports[-1]
+    assert report.issues == {'count:not_numeric': 1, 'count:below_min': 1}
+    assert validator.quarantine['_issues'].tolist() == [
+        'count:not_numeric', 'count:below_min'
+    ]
+    # The blank count is allowed, and counts as no pets
+    assert len(result) == len(raw) - 3
+    assert result['count'].dtype.kind == 'f'
+
+
+def test_extra_pet_column_reported(pet_resources):
+    raw, resource = pet_resources[0]
+    raw = raw.assign(extra=1)
+    validator = DataValidator(PetNamesProcessor.schema)
+    with pytest.raises(SchemaError, match='missing columns'):
+        PetNamesProcessor(validator).process_resource(raw, resource)
+    assert validator.reports[-1].unexpected_columns == [0, 1, 'extra']
+    with pytest.raises(SchemaError, match='expected 2 columns'):
+        PetNamesProcessor().process_resource(raw, resource)
+
+
+def test_renamed_pet_columns_reported(pet_resources):
+    raw, resource = pet_resources[0]
+    raw = raw.set_axis(['pet_name', 'count'], axis=1)
+    validator = DataValidator(PetNamesProcessor.schema, raise_on_missing=False)
+    with pytest.raises(SchemaError, match='pet_name'):
+        PetNamesProcessor(validator).process_resource(raw, resource)
+    assert validator.reports[-1].missing_columns == ['name']
+    assert validator.reports[-1].unexpected_columns == ['pet_name']
+
+
+def test_ferry_checks(ferry_raw):
+    raw = ferry_raw.iloc[:200].astype({'Sales Count': float})
+    raw.loc[3, 'Sales Count'] = 2.5
+    raw.loc[4, 'Timestamp'] = 'yesterday'
+    raw.loc[5, 'Timestamp'] = raw.loc[6, 'Timestamp']
+    # Rows 4 and 5 leave one gap, dropping rows 10-13 another
+    raw = raw.drop(index=range(10, 14))
+    validator = DataValidator(FerryDataProcessor.schema)
+    result = FerryDataProcessor.process_resource(raw, validator)
+
+    report = validator.reports[-1]
+    assert report.issues == {
+        'Sales Count:not_integer': 1,
+        'Timestamp:not_datetime': 1,
+        'Timestamp:duplicate': 1
+    }
+    assert (report.order, report.n_gaps) == ('ascending', 2)
+    assert len(result) == len(raw) - 3
+    assert result['Sales Count'].dtype == np.int64
+    assert result['Timestamp'].dtype.kind == 'M'